@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+""" Module for benchmarking the library operations at several dataset scales
+
+This script seeds a sqlite clone of every dataset preset, runs bulk_populate,
+populate (at the small scale only, its scale is fixed), student_issue,
+check_status, impact and student_returning against it with a warmup and a
+number of timed repetitions, and records the throughput, the p50, p95 and p99
+latencies and the statements run per call of every operation to a JSON file.
+The operations log their errors and return None, such calls are counted as
+failures instead of being timed, and any failure fails the run. The results
+are compared with a stored baseline, and the run fails if the median latency
+or the statements of an operation grew beyond the threshold. Everything runs
+on sqlite files, so it needs no database server, it contains the following
+functions
+
+    * percentile
+    * measure
+    * run_preset
+    * run_suite
+    * compare
+    * main
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+import argparse
+from datetime import datetime
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+# External Imports
+import sqlalchemy
+from sqlalchemy import event
+
+# User Import
+from library.connections.get_connection import SESSION_FACTORY, create_engine
+from library.orm.cache import CACHES, invalidate
+from library.orm.models import BASE
+from library.populate.populate_db import bulk_populate, populate
+from library.populate.snapshots import PRESETS, expected_rows, use_snapshot
+from library.query import status_cache
+from library.query.queries import check_status, impact, student_issue, student_returning
+
+
+__author__ = 'praveen@gyandata.com'
+
+LOGGER = logging.getLogger(__name__)
+
+# Default number of untimed and timed calls of every operation, populate is much slower
+WARMUP = 5
+REPETITIONS = 50
+POPULATE_REPETITIONS = 3
+
+# Relative slowdown, or increase of statements, beyond which an operation regressed
+THRESHOLD = 0.25
+
+# Metrics compared with the baseline, a higher value is worse for all of them, and the
+# absolute increase of each below which it is noise, the tail latencies are only recorded
+COMPARED_METRICS = {"p50_ms": 0.5, "statements": 0.0}
+
+BASELINE_PATH = os.path.join("configs", "benchmark_baseline.json")
+
+
+def percentile(samples, percent):
+    """
+    Function to get a percentile of samples, by the nearest rank
+
+    Parameters
+    ----------
+    samples : list
+        Measured values.
+    percent : float
+        Percentile, between 0 and 100.
+
+    Returns
+    -------
+    float
+        Smallest sample with at least the given percent of the samples at or below it.
+    """
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def _count_statements(engine):
+    """Function to count the statements run by an engine, in a list of one counter"""
+    counter = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*args):  # pylint: disable=unused-argument
+        counter[0] += 1
+
+    return counter
+
+
+def measure(call, arguments, warmup, counter):
+    """
+    Function to time the calls of an operation, after untimed warmup calls
+
+    A call returning None failed, the operations log their errors instead of
+    raising them, so it is counted as a failure and left out of the figures.
+
+    Parameters
+    ----------
+    call : function
+        Operation called with every tuple of arguments.
+    arguments : iterator
+        Tuples of arguments, one per call, the first ones are used for the warmup.
+    warmup : int
+        Number of untimed calls.
+    counter : list
+        Counter of the statements run, as returned by _count_statements.
+
+    Returns
+    -------
+    dict
+        Number of timed calls that succeeded and of calls that failed, throughput,
+        mean and percentile latencies in milliseconds and mean number of statements per call.
+
+    Raises
+    ------
+    RuntimeError
+        If every timed call failed.
+    """
+    latencies = []
+    statements = 0
+    failures = 0
+    calls = 0
+    for calls, args in enumerate(arguments, 1):
+        before = counter[0]
+        start = time.perf_counter()
+        result = call(*args)
+        elapsed = time.perf_counter() - start
+        if result is None:
+            failures += 1
+        elif calls > warmup:
+            latencies.append(elapsed)
+            statements += counter[0] - before
+
+    assert calls > warmup, "Operation should be called more times than the warmup"
+    if not latencies:
+        raise RuntimeError(f"Every timed call of {getattr(call, '__name__', call)} failed")
+    return {
+        "runs": len(latencies),
+        "failures": failures,
+        "throughput": len(latencies) / sum(latencies),
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+        "p99_ms": 1000 * percentile(latencies, 99),
+        "statements": statements / len(latencies),
+    }
+
+
+def _populate_call(preset, counter, bulk=True):
+    """Function to get a call populating a new sqlite file at the scale of a preset, with
+    bulk_populate or else with populate, returning None if rows are missing afterwards"""
+    def call():
+        handle, path = tempfile.mkstemp(suffix=".sqlite", prefix=preset + "-populate-")
+        os.close(handle)
+        engine = create_engine("sqlite", url="sqlite:///" + path)
+        bind = SESSION_FACTORY.kw.get("bind")
+        try:
+            BASE.metadata.create_all(engine)
+            engine_counter = _count_statements(engine)
+            if bulk:
+                bulk_populate(bind=engine, chunk_size=10000, **PRESETS[preset])
+            else:
+                SESSION_FACTORY.configure(bind=engine)
+                populate()
+            counter[0] += engine_counter[0]
+            # The population errors are only logged, so its rows are counted
+            complete = all(engine.execute(f"SELECT count(*) FROM {table}").scalar() == rows
+                           for table, rows in expected_rows(preset).items())
+        finally:
+            SESSION_FACTORY.configure(bind=bind)
+            engine.dispose()
+            os.remove(path)
+        return True if complete else None
+    call.__name__ = "bulk_populate" if bulk else "populate"
+    return call
+
+
+def run_preset(preset, warmup=WARMUP, repetitions=REPETITIONS,
+               populate_repetitions=POPULATE_REPETITIONS, seed=0):
+    """
+    Function to benchmark the operations against a clone of the snapshot of a preset
+
+    Parameters
+    ----------
+    preset : str
+        Name of the dataset preset.
+    warmup : int
+        Number of untimed calls of every operation.
+    repetitions : int
+        Number of timed calls of every operation, fewer issues and returns are
+        timed if the preset has fewer book items.
+    populate_repetitions : int
+        Number of timed populations of a new database at the scale of the preset.
+    seed : int
+        Seed of the choice of the students, book items, books and departments.
+
+    Returns
+    -------
+    dict
+        Results of measure, by operation name.
+    """
+    assert preset in PRESETS, f"Preset should be one of {', '.join(PRESETS)}"
+
+    rng = random.Random(seed)
+    results = {}
+
+    counter = [0]
+    results["bulk_populate"] = measure(_populate_call(preset, counter),
+                                       [()] * (1 + populate_repetitions), 1, counter)
+    if preset == "small":
+        # The scale of populate is the one of the small preset
+        results["populate"] = measure(_populate_call(preset, counter, bulk=False),
+                                      [()] * (1 + populate_repetitions), 1, counter)
+
+    # The rows cached from the database of the previous preset have the same keys
+    for model in CACHES:
+        invalidate(model)
+    status_cache.clear()
+
+    engine = use_snapshot(preset)
+    try:
+        counter = _count_statements(engine)
+        students = [row[0] for row in engine.execute("SELECT reg_id FROM students")]
+        books = [row[0] for row in engine.execute("SELECT isbn_id FROM books")]
+        departments = [row[0] for row in engine.execute("SELECT dept_id FROM department")]
+        staff = engine.execute("SELECT min(staff_id) FROM staffs").scalar()
+        items = [row[0] for row in engine.execute(
+            "SELECT bar_code FROM book_item WHERE status = 'AVAILABLE'")]
+        rng.shuffle(items)
+        items = items[:warmup + repetitions]
+        calls = warmup + repetitions
+
+        results["student_issue"] = measure(
+            student_issue, [(staff, rng.choice(students), [bar_code]) for bar_code in items],
+            warmup, counter)
+        results["check_status"] = measure(
+            check_status, [(rng.choice(books),) for _ in range(calls)], warmup, counter)
+        # Departments whose books were borrowed by students of other departments,
+        # impact finds no activity for the others
+        impacted = [row[0] for row in engine.execute(
+            "SELECT DISTINCT book_dept_id FROM department_impact WHERE borrower_type = 'student' "
+            "AND borrower_dept_id != book_dept_id AND loan_count > 0")] or departments
+        results["impact"] = measure(
+            impact, [(rng.choice(impacted),) for _ in range(calls)], warmup, counter)
+        results["student_returning"] = measure(
+            student_returning, [([bar_code],) for bar_code in items], warmup, counter)
+    finally:
+        engine.dispose()
+        os.remove(engine.url.database)
+    return results
+
+
+def run_suite(presets, **options):
+    """
+    Function to benchmark the operations at the scale of every preset
+
+    Parameters
+    ----------
+    presets : list
+        Names of the dataset presets.
+    options : dict
+        Parameters of run_preset.
+
+    Returns
+    -------
+    dict
+        Environment of the run and results of run_preset by preset name.
+    """
+    return {
+        "meta": {"date": datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(),
+                 "sqlalchemy": sqlalchemy.__version__,
+                 "machine": platform.platform(),
+                 "options": options},
+        "results": {preset: run_preset(preset, **options) for preset in presets},
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Function to find the operations that regressed since the baseline
+
+    Only the presets and operations present in both are compared.
+
+    Parameters
+    ----------
+    results : dict
+        Results of run_suite.
+    baseline : dict
+        Results of an earlier run_suite.
+    threshold : float
+        Relative increase of a metric tolerated.
+
+    Returns
+    -------
+    list
+        Description of every regression.
+    """
+    regressions = []
+    for preset, operations in results["results"].items():
+        for name, metrics in operations.items():
+            reference = baseline["results"].get(preset, {}).get(name)
+            if not reference:
+                continue
+            for metric, noise in COMPARED_METRICS.items():
+                if metrics[metric] > reference[metric] * (1 + threshold) + noise:
+                    regressions.append(f"{preset} {name} {metric}: {metrics[metric]:.3f}"
+                                       f" against {reference[metric]:.3f}")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Function to run the suite, write its results and compare them with the baseline
+
+    Parameters
+    ----------
+    argv : list
+        Command line arguments, defaults to the ones of the process.
+
+    Returns
+    -------
+    int
+        Exit status, 1 if a call failed or an operation regressed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("presets", nargs="*", default=["small"], choices=list(PRESETS))
+    parser.add_argument("--warmup", type=int, default=WARMUP)
+    parser.add_argument("--repetitions", type=int, default=REPETITIONS)
+    parser.add_argument("--populate-repetitions", type=int, default=POPULATE_REPETITIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results as the new baseline instead of comparing them")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.presets, warmup=args.warmup, repetitions=args.repetitions,
+                        populate_repetitions=args.populate_repetitions, seed=args.seed)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    failed = False
+    for preset, operations in results["results"].items():
+        for name, metrics in operations.items():
+            LOGGER.info("%s %s: %.1f/s, p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, %.1f statements",
+                        preset, name, metrics["throughput"], metrics["p50_ms"],
+                        metrics["p95_ms"], metrics["p99_ms"], metrics["statements"])
+            if metrics["failures"]:
+                LOGGER.error("%s %s: %d calls failed", preset, name, metrics["failures"])
+                failed = True
+    if failed:
+        # The figures of a run with failed calls are not comparable, nor a baseline
+        return 1
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        LOGGER.info("Saved the baseline to %s", args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        LOGGER.warning("No baseline at %s, nothing compared", args.baseline)
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline["meta"]["options"] != results["meta"]["options"]:
+        LOGGER.warning("The baseline was run with %s, the figures may not be comparable",
+                       baseline["meta"]["options"])
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        LOGGER.error("Regression: %s", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    # The records of every call of the operations are not worth their cost here
+    for name in ("library.populate", "library.query"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    sys.exit(main())
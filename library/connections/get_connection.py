@@ -1,6 +1,27 @@
 # -*- coding: utf-8 -*-
 """ Module for creating Engine and session maker factory
 
+The engine is created lazily, on the first session or the first call of
+get_engine, from a profile of the engine configuration: the MySQL production
+database, or a sqlite file or memory database for local runs. Every profile
+carries its pool settings and, for sqlite, the pragmas run on every new
+connection. The engines are kept per process, a forked worker creates its
+own engine on first use instead of sharing the connections of its parent.
+The statements of every engine are attributed to the running operations.
+
+A profile can list the urls of read replicas of its database. The sessions
+route the queries of read-only operations to the replicas, in turn, skipping
+the replicas that fail a health check, and everything else to the primary.
+Reads that follow a write of the same thread can be pinned to the primary.
+
+SCOPED_SESSION keeps one session per thread, for the units of work grouping
+several operations in a single transaction.
+
+The configuration is read from configs/engine_config.json, or the file named
+by the LIBRARY_ENGINE_CONFIG environment variable, and the profile is chosen
+by the LIBRARY_DB_PROFILE environment variable or the default_profile of the
+configuration.
+
 This script requires that the following packages be installed within the Python
 environment you are running this script in.
 
@@ -9,23 +30,348 @@ environment you are running this script in.
 """
 
 # Standard Imports
+import itertools
 import json
+import os
+import threading
+import time
 
 # External Imports
-from sqlalchemy import engine_from_config
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import engine_from_config, event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql.dml import UpdateBase
+
+# User Imports
+from library.connections.instrumentation import instrument
+
+
+CONFIG_PATH = os.path.join("configs", "engine_config.json")
+
+# Profiles available without a configuration file, the file adds to and overrides them
+DEFAULT_PROFILES = {
+    "sqlite": {"sqlalchemy.url": "sqlite:///library.db",
+               "pragmas": {"journal_mode": "WAL", "synchronous": "NORMAL",
+                           "cache_size": -64000, "foreign_keys": "ON"}},
+    "memory": {"sqlalchemy.url": "sqlite://",
+               "pragmas": {"foreign_keys": "ON"}},
+}
+
+# Seconds a failed replica is skipped for before it is checked again
+HEALTH_CHECK_INTERVAL = 30.0
+
+_ENGINES = {}
+_REPLICAS = {}
+_LOCK = threading.Lock()
+_CONFIG = {}
 
+# Time of the last committed write of every thread
+_LAST_WRITE = threading.local()
 
-def create_engine():
+
+def load_config():
     """
-    Function used to read the configuration file and create engine
-    :return: engine
+    Function to read the engine configuration, once
+
+    Returns
+    -------
+    dict
+        Profiles by name and the name of the default profile.
     """
-    with open("configs\\engine_config.json") as file:
-        data = json.load(file)
-    engine = engine_from_config(data)
+    if not _CONFIG:
+        path = os.environ.get("LIBRARY_ENGINE_CONFIG", CONFIG_PATH)
+        config = {"profiles": {}}
+        if os.path.exists(path):
+            with open(path) as file:
+                config.update(json.load(file))
+        profiles = {name: dict(settings) for name, settings in DEFAULT_PROFILES.items()}
+        for name, settings in config["profiles"].items():
+            profiles.setdefault(name, {}).update(settings)
+        _CONFIG.update(profiles=profiles,
+                       default_profile=config.get("default_profile", "sqlite"))
+    return _CONFIG
+
+
+def _set_pragmas(engine, pragmas):
+    """Function to run the sqlite pragmas on every new connection of an engine"""
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _sqlite_transactions(engine):
+    """Function to let sqlalchemy begin the sqlite transactions, so savepoints work,
+    instead of the driver which begins them late and commits on a savepoint"""
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        connection.execute("BEGIN")
+
+
+def _guard_fork(engine):
+    """Function to keep a forked process from using the pooled connections of its parent"""
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):  # pylint: disable=unused-argument
+        if connection_record.info["pid"] != os.getpid():
+            # Dropping the connection without closing it, it belongs to the parent
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError("Connection belongs to another process")
+
+
+def create_engine(profile=None, url=None):
+    """
+    Function used to create an engine from a profile of the configuration
+
+    Parameters
+    ----------
+    profile : str
+        Name of the profile, defaults to the LIBRARY_DB_PROFILE environment
+        variable or to the default profile of the configuration.
+    url : str
+        Database url, overriding the one of the profile.
+
+    Returns
+    -------
+    Engine
+        New engine, not kept by the registry.
+    """
+    config = load_config()
+    profile = profile or os.environ.get("LIBRARY_DB_PROFILE") or config["default_profile"]
+    assert profile in config["profiles"], \
+        f"Profile should be one of {', '.join(config['profiles'])}"
+
+    settings = dict(config["profiles"][profile])
+    pragmas = settings.pop("pragmas", {})
+    settings.pop("replicas", None)
+    settings.pop("pin_seconds", None)
+    if url:
+        settings["sqlalchemy.url"] = url
+
+    options = {}
+    database = make_url(settings["sqlalchemy.url"])
+    if database.get_backend_name() == "sqlite" and database.database in (None, "", ":memory:"):
+        # A memory database lives as long as its connection, so it is shared by the threads
+        options = {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+
+    engine = engine_from_config(settings, **options)
+    if pragmas:
+        _set_pragmas(engine, pragmas)
+    if database.get_backend_name() == "sqlite":
+        _sqlite_transactions(engine)
+    _guard_fork(engine)
+    instrument(engine)
     return engine
 
 
-ENGINE = create_engine()
-SESSION_FACTORY = sessionmaker(bind=ENGINE)
+def get_engine(profile=None):
+    """
+    Function to get the engine of a profile, created on the first call in every process
+
+    Parameters
+    ----------
+    profile : str
+        Name of the profile, defaults as for create_engine.
+
+    Returns
+    -------
+    Engine
+        Engine of the profile in the current process.
+    """
+    profile = profile or os.environ.get("LIBRARY_DB_PROFILE") or load_config()["default_profile"]
+    key = (os.getpid(), profile)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        with _LOCK:
+            engine = _ENGINES.get(key)
+            if engine is None:
+                engine = _ENGINES[key] = create_engine(profile)
+    return engine
+
+
+class ReplicaSet:
+    """This class chooses the replica engine of the next read, in turn.
+
+    A replica is checked with a query before it is chosen, at most once every
+    interval, and skipped until the next check if it fails.
+
+    Attributes
+    ----------
+    engines : list
+        Engines of the replicas.
+
+    pin_seconds : float
+        Seconds after a write of a thread during which its reads go to the primary.
+
+    interval : float
+        Seconds between the health checks of a replica.
+
+    """
+
+    def __init__(self, engines, pin_seconds=0.0, interval=HEALTH_CHECK_INTERVAL):
+        self.engines = list(engines)
+        self.pin_seconds = pin_seconds
+        self.interval = interval
+        self._turn = itertools.count()
+        self._checks = {}
+
+    def _healthy(self, engine):
+        """Function to check a replica, at most once every interval"""
+        healthy, checked = self._checks.get(engine, (True, None))
+        now = time.monotonic()
+        if checked is None or now - checked >= self.interval:
+            try:
+                with engine.connect() as connection:
+                    connection.scalar("SELECT 1")
+                healthy = True
+            except exc.DBAPIError:
+                healthy = False
+            self._checks[engine] = (healthy, now)
+        return healthy
+
+    def choose(self):
+        """
+        Function to choose the replica of the next read
+
+        Returns
+        -------
+        Engine
+            Next healthy replica, None if the read has to go to the primary.
+        """
+        if self.pin_seconds and \
+                time.monotonic() - getattr(_LAST_WRITE, "time", float("-inf")) < self.pin_seconds:
+            return None
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._turn) % len(self.engines)]
+            if self._healthy(engine):
+                return engine
+        return None
+
+
+def get_replicas(profile=None):
+    """
+    Function to get the replicas of a profile, created on the first call in every process
+
+    Parameters
+    ----------
+    profile : str
+        Name of the profile, defaults as for create_engine.
+
+    Returns
+    -------
+    ReplicaSet
+        Replicas of the profile, None if it has none.
+    """
+    config = load_config()
+    profile = profile or os.environ.get("LIBRARY_DB_PROFILE") or config["default_profile"]
+    settings = config["profiles"][profile]
+    if not settings.get("replicas"):
+        return None
+
+    key = (os.getpid(), profile)
+    replicas = _REPLICAS.get(key)
+    if replicas is None:
+        with _LOCK:
+            replicas = _REPLICAS.get(key)
+            if replicas is None:
+                replicas = _REPLICAS[key] = ReplicaSet(
+                    [create_engine(profile, url) for url in settings["replicas"]],
+                    settings.get("pin_seconds", 0.0))
+    return replicas
+
+
+def dispose_engines():
+    """
+    Function to close the pooled connections of the engines of the current process
+    """
+    pid = os.getpid()
+    with _LOCK:
+        for key in [key for key in _ENGINES if key[0] == pid]:
+            _ENGINES.pop(key).dispose()
+        for key in [key for key in _REPLICAS if key[0] == pid]:
+            for engine in _REPLICAS.pop(key).engines:
+                engine.dispose()
+
+
+class RoutingSession(Session):
+    """This class is a session sending the queries of read-only sessions to a replica.
+
+    A session is read-only if its info has read_only set, its queries go to
+    the replica chosen when it is first used, and the flushes, inserts, updates
+    and deletes of any session go to the primary.
+
+    Attributes
+    ----------
+    replicas : ReplicaSet
+        Replicas of the primary, None to send everything to the primary.
+
+    """
+
+    def __init__(self, replicas=None, **kwargs):
+        super().__init__(**kwargs)
+        self.replicas = replicas
+        self._replica = None
+
+    def get_bind(self, mapper=None, clause=None):
+        """
+        Function to choose the engine of a query, the replica of the session for the
+        reads of a read-only session and the primary for everything else
+
+        Parameters
+        ----------
+        mapper : Mapper
+            Mapper of the queried or flushed class, if any.
+        clause : ClauseElement
+            Statement being executed, if any.
+
+        Returns
+        -------
+        Engine
+            Replica or primary engine.
+        """
+        write = self._flushing or isinstance(clause, UpdateBase)
+        if write:
+            self.info["wrote"] = True
+        elif self.replicas is not None and self.info.get("read_only"):
+            if self._replica is None:
+                self._replica = self.replicas.choose() or False
+            if self._replica:
+                return self._replica
+        return super().get_bind(mapper, clause)
+
+    def commit(self):
+        """Function to commit the transaction, noting the time of a write for the
+        reads of the thread pinned to the primary"""
+        super().commit()
+        if self.info.pop("wrote", False):
+            _LAST_WRITE.time = time.monotonic()
+
+
+class LazySessionmaker(sessionmaker):
+    """This class is a session factory binding its sessions to the engine of the
+    default profile, and routing their reads to its replicas, created on the first
+    session, unless it is configured with a bind."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("class_", RoutingSession)
+        super().__init__(**kwargs)
+
+    def __call__(self, **local_kw):
+        if local_kw.get("bind") is None and self.kw.get("bind") is None:
+            local_kw["bind"] = get_engine()
+            local_kw.setdefault("replicas", get_replicas())
+        return super().__call__(**local_kw)
+
+
+SESSION_FACTORY = LazySessionmaker()
+SCOPED_SESSION = scoped_session(SESSION_FACTORY)
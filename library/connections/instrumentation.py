@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+""" Module for attributing the SQL statements to the operations running them
+
+This script listens to the statements run by the engines and adds their
+number, their time in the database and the rows reported for them to the
+innermost operation of the thread running them. The operations are scoped by
+the operation decorator. A statement shape, its SQL with the lists of the IN
+criteria collapsed, run many times within one call of an operation is
+reported as a suspected N+1 query. The transaction control statements only
+add to the time in the database. The numbers are kept in a registry of the
+process and summarised in the log at regular intervals, it contains the
+following functions
+
+    * instrument
+    * operation_scope
+    * statement_shape
+    * operation_stats
+    * reset_operation_stats
+    * log_operation_stats
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard Imports
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import logging
+import re
+import threading
+import time
+
+# External Imports
+from sqlalchemy import event
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of runs of the same statement shape within one call that make it an N+1 suspect
+N_PLUS_ONE_THRESHOLD = 5
+
+# Seconds between the summaries logged by the operations
+SUMMARY_INTERVAL = 300.0
+
+# List of placeholders, of the qmark, format or pyformat parameter styles
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)")
+
+# Transaction control statements, run by every transaction and savepoint, which are
+# neither queries of the operation nor N+1 suspects
+_TRANSACTION_CONTROL = re.compile(r"\s*(?:BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b", re.IGNORECASE)
+
+# Operations running in every thread, innermost last
+_CURRENT = threading.local()
+
+_STATS_LOCK = threading.Lock()
+_STATS = defaultdict(lambda: {"calls": 0, "statements": 0, "db_seconds": 0.0, "rows": 0,
+                              "max_statements": 0, "suspects": Counter()})
+_SUMMARY = {"logged": time.monotonic()}
+
+
+def statement_shape(statement):
+    """
+    Function to get the shape of a statement, the same for every length of its IN lists
+
+    Parameters
+    ----------
+    statement : str
+        SQL of the statement, with placeholders for its parameters.
+
+    Returns
+    -------
+    str
+        SQL with every list of placeholders collapsed, and the whitespace normalised.
+    """
+    return " ".join(_PLACEHOLDER_LIST.sub("(...)", statement).split())
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+    """Function to note the start time of a statement run inside an operation"""
+    if getattr(_CURRENT, "frames", None):
+        context.statement_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument,too-many-arguments
+    """Function to add a statement to the innermost operation of the thread"""
+    frames = getattr(_CURRENT, "frames", None)
+    start = getattr(context, "statement_start", None)
+    if not frames or start is None:
+        return
+    frame = frames[-1]
+    frame["db_seconds"] += time.perf_counter() - start
+    if _TRANSACTION_CONTROL.match(statement):
+        return
+    # Rows written, and rows selected where the driver buffers them, -1 if it does not know
+    frame["rows"] += max(cursor.rowcount, 0)
+    frame["shapes"][statement_shape(statement)] += 1
+
+
+def instrument(engine):
+    """
+    Function to attribute the statements of an engine to the running operations
+
+    Parameters
+    ----------
+    engine : Engine
+        Engine to listen to.
+    """
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+def _record(name, frame):
+    """Function to add the statements of a call of an operation to the registry"""
+    statements = sum(frame["shapes"].values())
+    suspects = {shape: count for shape, count in frame["shapes"].items()
+                if count >= N_PLUS_ONE_THRESHOLD}
+    with _STATS_LOCK:
+        stats = _STATS[name]
+        stats["calls"] += 1
+        stats["statements"] += statements
+        stats["db_seconds"] += frame["db_seconds"]
+        stats["rows"] += frame["rows"]
+        stats["max_statements"] = max(stats["max_statements"], statements)
+        first = [shape for shape in suspects if shape not in stats["suspects"]]
+        stats["suspects"].update(suspects.keys())
+
+    for shape in first:
+        LOGGER.warning("Suspected N+1 query in %s, run %d times in one call: %s",
+                       name, suspects[shape], shape)
+
+
+@contextmanager
+def operation_scope(name):
+    """
+    Provide a scope attributing the statements run by the current thread to an operation
+
+    The statements of an operation called within another one are attributed
+    to the inner operation only.
+
+    Parameters
+    ----------
+    name : str
+        Name the statements are recorded under.
+    """
+    frames = getattr(_CURRENT, "frames", None)
+    if frames is None:
+        frames = _CURRENT.frames = []
+    frame = {"db_seconds": 0.0, "rows": 0, "shapes": Counter()}
+    frames.append(frame)
+    try:
+        yield frame
+    finally:
+        frames.pop()
+        _record(name, frame)
+        if time.monotonic() - _SUMMARY["logged"] >= SUMMARY_INTERVAL:
+            log_operation_stats()
+
+
+def operation_stats():
+    """
+    Function to get the statements of every operation
+
+    Returns
+    -------
+    dict
+        Calls, statements, seconds in the database, rows, most statements of a
+        call, and number of calls running every suspected N+1 shape, by operation name.
+    """
+    with _STATS_LOCK:
+        return {name: dict(stats, suspects=dict(stats["suspects"]))
+                for name, stats in _STATS.items()}
+
+
+def reset_operation_stats():
+    """
+    Function to clear the registry
+    """
+    with _STATS_LOCK:
+        _STATS.clear()
+
+
+def log_operation_stats():
+    """
+    Function to log a summary of the statements of every operation
+    """
+    _SUMMARY["logged"] = time.monotonic()
+    for name, stats in sorted(operation_stats().items()):
+        LOGGER.info("%s: %d calls, %.1f statements and %.2f ms in the database per call, "
+                    "%d at most, %d rows, %d N+1 suspects",
+                    name, stats["calls"], stats["statements"] / stats["calls"],
+                    1000 * stats["db_seconds"] / stats["calls"], stats["max_statements"],
+                    stats["rows"], len(stats["suspects"]))
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+""" Module for sampled CPU and memory profiles of the operations
+
+This script profiles one in every N calls of an operation with cProfile and
+tracemalloc, and writes the call statistics and the top allocations of every
+sampled call, with the operation name and a summary of its arguments, to a
+directory keeping only the latest profiles. Profiling is switched on by the
+LIBRARY_PROFILE_SAMPLE environment variable or the sample_every setting of
+configs/profile_config.json, read when the operations are defined. When it is
+off the operations are left undecorated, it contains the following functions
+
+    * load_settings
+    * profiled
+    * profile_call
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * cProfile, pstats, tracemalloc - Standard packages used to profile the calls
+
+"""
+
+# Standard Imports
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+import functools
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import reprlib
+import threading
+import tracemalloc
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+LOGGER = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join("configs", "profile_config.json")
+
+# Settings used when neither the environment nor the configuration sets them
+DEFAULT_SETTINGS = {
+    "sample_every": 0,
+    "directory": "profiles",
+    "keep": 50,
+    "top_functions": 30,
+    "top_allocations": 20,
+    "traceback_frames": 10,
+}
+
+# Environment variables overriding the settings
+ENVIRONMENT = {
+    "sample_every": "LIBRARY_PROFILE_SAMPLE",
+    "directory": "LIBRARY_PROFILE_DIR",
+    "keep": "LIBRARY_PROFILE_KEEP",
+}
+
+_SETTINGS = {}
+_COUNTERS = {}
+
+# A call is profiled only if no other call of the thread is, and tracemalloc
+# is stopped once the last profiled call of any thread ends
+_ACTIVE = threading.local()
+_TRACING = {"calls": 0, "started": False}
+_TRACING_LOCK = threading.Lock()
+
+# Summary of the arguments written with a profile
+_REPR = reprlib.Repr()
+_REPR.maxstring = 60
+_REPR.maxother = 60
+
+
+def load_settings():
+    """
+    Function to read the profiling settings, once
+
+    Returns
+    -------
+    dict
+        Settings of the configuration file overridden by the environment.
+    """
+    if not _SETTINGS:
+        settings = dict(DEFAULT_SETTINGS)
+        if os.path.exists(CONFIG_PATH):
+            with open(CONFIG_PATH) as file:
+                settings.update(json.load(file))
+        for key, variable in ENVIRONMENT.items():
+            if os.environ.get(variable):
+                settings[key] = type(DEFAULT_SETTINGS[key])(os.environ[variable])
+        _SETTINGS.update(settings)
+    return _SETTINGS
+
+
+def _start_tracing(frames):
+    """Function to start tracemalloc for a profiled call, unless it is tracing already"""
+    with _TRACING_LOCK:
+        if _TRACING["calls"] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _TRACING["started"] = True
+        _TRACING["calls"] += 1
+
+
+def _stop_tracing():
+    """Function to stop tracemalloc after the last profiled call, if it was started for them"""
+    with _TRACING_LOCK:
+        _TRACING["calls"] -= 1
+        if _TRACING["calls"] == 0 and _TRACING["started"]:
+            tracemalloc.stop()
+            _TRACING["started"] = False
+
+
+def _rotate(directory, keep):
+    """Function to delete the oldest profiles of a directory beyond the number kept"""
+    names = sorted(name[:-len(".txt")] for name in os.listdir(directory) if name.endswith(".txt"))
+    for name in names[:max(0, len(names) - keep)]:
+        for extension in (".txt", ".prof"):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def _write(name, summary, profile, snapshot, peak, settings):  # pylint: disable=too-many-arguments
+    """Function to write the statistics and allocations of a call, returning the path of the report"""
+    directory = settings["directory"]
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{datetime.now():%Y%m%dT%H%M%S%f}-{os.getpid()}-{name}")
+
+    profile.dump_stats(base + ".prof")
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats("cumulative").print_stats(settings["top_functions"])
+
+    with open(base + ".txt", "w") as file:
+        file.write(f"Operation: {name}\nArguments: {summary}\n\n")
+        file.write(stream.getvalue())
+        file.write(f"\nPeak traced memory: {peak / 1024:.1f} KiB\n")
+        file.write("\nTop allocations alive at the end of the call\n")
+        for statistic in snapshot.statistics("traceback")[:settings["top_allocations"]]:
+            file.write(f"\n{statistic.size / 1024:.1f} KiB in {statistic.count} blocks\n")
+            file.write("\n".join(statistic.traceback.format()) + "\n")
+
+    _rotate(directory, settings["keep"])
+    return base + ".txt"
+
+
+@contextmanager
+def profile_call(name, summary=""):
+    """
+    Provide a scope profiling the code run in it, whatever the settings
+
+    Parameters
+    ----------
+    name : str
+        Name of the operation, part of the name of the files written.
+    summary : str
+        Summary of the arguments of the call, written with the profile.
+    """
+    settings = load_settings()
+    if getattr(_ACTIVE, "name", None):
+        # cProfile profiles a single call of a thread at a time
+        yield
+        return
+
+    _ACTIVE.name = name
+    _start_tracing(settings["traceback_frames"])
+    tracemalloc.reset_peak()
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        _stop_tracing()
+        _ACTIVE.name = None
+        try:
+            path = _write(name, summary, profile, snapshot, peak, settings)
+            LOGGER.info("Profiled %s into %s", name, path)
+        except OSError as err:
+            # A profile is not worth failing the operation for
+            LOGGER.warning("Could not write the profile of %s: %s", name, err)
+
+
+def profiled(name):
+    """
+    Decorator to profile one in every sample_every calls of an operation
+
+    The operation is returned as it is when profiling is off.
+
+    Parameters
+    ----------
+    name : str
+        Name of the operation.
+
+    Returns
+    -------
+    function
+        Decorator.
+    """
+    sample_every = load_settings()["sample_every"]
+
+    def decorator(function):
+        if sample_every <= 0:
+            return function
+
+        counter = _COUNTERS.setdefault(name, itertools.count())
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if next(counter) % sample_every:
+                return function(*args, **kwargs)
+            summary = ", ".join([_REPR.repr(arg) for arg in args] +
+                                [f"{key}={_REPR.repr(value)}" for key, value in kwargs.items()])
+            with profile_call(name, summary):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
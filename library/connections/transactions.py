@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+""" Module for transactional scopes that retry transient database errors
+
+This script contains the session scope shared by the query and populate
+modules, and the operation decorator which reruns an operation with jittered
+exponential backoff when it fails with a deadlock, a lock wait timeout or a
+lost connection. Retries, aborts and the time spent waiting are counted for
+every operation name, and the statements run by an operation are attributed to it.
+
+A unit of work groups several operations of a thread in one transaction of
+the thread's session: the session scopes opened inside it run in savepoints of
+that session, so a failed operation is undone alone, and the unit commits once
+at its end. It contains the following functions
+
+    * is_transient
+    * unit_of_work
+    * in_unit_of_work
+    * session_scope
+    * run_with_retry
+    * operation
+    * contention_report
+    * log_contention
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard Imports
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import logging
+import random
+import threading
+import time
+
+# External Imports
+from sqlalchemy.exc import DBAPIError
+
+# User Imports
+from library.connections.get_connection import SCOPED_SESSION, SESSION_FACTORY
+from library.connections.instrumentation import operation_scope
+from library.connections.profiling import profiled
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+LOGGER = logging.getLogger(__name__)
+
+# MySQL error codes of lock wait timeout, deadlock and lost connections
+TRANSIENT_ERROR_CODES = {1205, 1213, 2006, 2013, 2055}
+
+# Number of attempts of an operation and bounds of the backoff, in seconds
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.05
+MAX_DELAY = 2.0
+
+# Session of the unit of work of every thread, and how deep the units are nested
+_UNIT = threading.local()
+
+_METRICS_LOCK = threading.Lock()
+_METRICS = defaultdict(lambda: {"calls": 0, "retries": 0, "aborts": 0,
+                                "wait_seconds": 0.0, "failed_seconds": 0.0})
+
+
+def is_transient(error):
+    """
+    Function to check whether an error is worth retrying the transaction for
+
+    Parameters
+    ----------
+    error : Exception
+        Error raised by the operation.
+
+    Returns
+    -------
+    bool
+        True for deadlocks, lock wait timeouts, lost connections and locked sqlite databases.
+    """
+    if not isinstance(error, DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return True
+    args = getattr(error.orig, "args", ())
+    if args and args[0] in TRANSIENT_ERROR_CODES:
+        return True
+    return "database is locked" in str(error.orig)
+
+
+def in_unit_of_work():
+    """
+    Function to check whether the current thread is inside a unit of work
+
+    Returns
+    -------
+    bool
+        True if the session scopes of the thread join a unit of work.
+    """
+    return getattr(_UNIT, "depth", 0) > 0
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Provide one transaction around several operations of the current thread
+
+    The operations opening a session scope inside the unit share the session
+    of the thread, each in a savepoint, and nothing is committed before the
+    unit ends. A unit inside a unit joins it. A transient error aborts the
+    whole unit, so it is retried as a whole, such as with run_with_retry.
+
+    Returns
+    -------
+    Session
+        Session of the thread, shared by the operations of the unit.
+    """
+    if in_unit_of_work():
+        _UNIT.depth += 1
+        try:
+            yield SCOPED_SESSION()
+        finally:
+            _UNIT.depth -= 1
+        return
+
+    session = SCOPED_SESSION()
+    _UNIT.depth = 1
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        _UNIT.depth = 0
+        SCOPED_SESSION.remove()
+
+
+@contextmanager
+def _savepoint_scope():
+    """Provide a savepoint of the session of the unit of work, for one operation"""
+    session = SCOPED_SESSION()
+    savepoint = session.begin_nested()
+    try:
+        yield session
+        savepoint.commit()
+    except AssertionError as err:
+        savepoint.rollback()
+        LOGGER.error(err)
+    except AttributeError as err:
+        savepoint.rollback()
+        LOGGER.error(err)
+    except DBAPIError:
+        # The unit decides whether to go on, the operation decorator does not retry
+        savepoint.rollback()
+        raise
+
+
+@contextmanager
+def session_scope(bind=None, read_only=False):
+    """Provide a transactional scope around a series of operations,
+    read_only ones are sent to a replica if the database has replicas.
+    Inside a unit of work the scope is a savepoint of the unit's session."""
+    if bind is None and in_unit_of_work():
+        with _savepoint_scope() as session:
+            yield session
+        return
+
+    options = {"info": {"read_only": True}} if read_only else {}
+    session = SESSION_FACTORY(bind=bind, **options) if bind else SESSION_FACTORY(**options)
+    try:
+        yield session
+        session.commit()
+    except AssertionError as err:
+        LOGGER.error(err)
+    except AttributeError as err:
+        session.rollback()
+        LOGGER.error(err)
+    except DBAPIError:
+        # Leaving nothing half done, the operation decorator decides whether to retry
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _record(name, **counts):
+    """Function to add to the metrics of an operation"""
+    with _METRICS_LOCK:
+        metrics = _METRICS[name]
+        for key, value in counts.items():
+            metrics[key] += value
+
+
+def run_with_retry(name, function, *args, attempts=MAX_ATTEMPTS, **kwargs):
+    """
+    Function to call a function, calling it again if it fails with a transient database error
+
+    The function is called again from the start, so it must leave nothing
+    behind when it fails, such as by opening its own session scope. Inside a
+    unit of work it is called once, the unit is retried instead.
+
+    Parameters
+    ----------
+    name : str
+        Name the metrics of the call are recorded under.
+    function : function
+        Function to call with the remaining arguments.
+    attempts : int
+        Maximum number of attempts, the error is raised after the last one.
+
+    Returns
+    -------
+    object
+        Return value of the function.
+    """
+    _record(name, calls=1)
+    if in_unit_of_work():
+        attempts = 1
+    for attempt in range(attempts):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except DBAPIError as err:
+            if not is_transient(err):
+                raise
+            failed = time.perf_counter() - start
+            if attempt == attempts - 1:
+                _record(name, aborts=1, failed_seconds=failed)
+                LOGGER.error("%s aborted after %d attempts: %s", name, attempts, err.orig)
+                raise
+
+            # Full jitter keeps the retrying transactions from colliding again
+            delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+            _record(name, retries=1, failed_seconds=failed, wait_seconds=delay)
+            LOGGER.warning("%s failed with %s, retrying in %.3fs", name, err.orig, delay)
+            time.sleep(delay)
+    return None
+
+
+def operation(name, attempts=MAX_ATTEMPTS):
+    """
+    Decorator to rerun an operation that failed with a transient database error,
+    attributing the statements of all its attempts to it, and profiling a sample
+    of its calls if profiling is on
+
+    Parameters
+    ----------
+    name : str
+        Name the metrics of the operation are recorded under.
+    attempts : int
+        Maximum number of attempts, 1 only records the metrics.
+
+    Returns
+    -------
+    function
+        Decorator.
+    """
+    def decorator(function):
+        @profiled(name)
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with operation_scope(name):
+                return run_with_retry(name, function, *args, attempts=attempts, **kwargs)
+        return wrapper
+    return decorator
+
+
+def contention_report():
+    """
+    Function to get the contention metrics of every operation
+
+    Returns
+    -------
+    dict
+        Calls, retries, aborts, seconds spent in backoff and in failed attempts,
+        by operation name.
+    """
+    with _METRICS_LOCK:
+        return {name: dict(metrics) for name, metrics in _METRICS.items()}
+
+
+def log_contention():
+    """
+    Function to log the contention metrics of the operations that were retried
+    """
+    for name, metrics in sorted(contention_report().items()):
+        if metrics["retries"] or metrics["aborts"]:
+            LOGGER.info("%s: %d calls, %d retries, %d aborts, %.3fs waiting, %.3fs in failed attempts",
+                        name, metrics["calls"], metrics["retries"], metrics["aborts"],
+                        metrics["wait_seconds"], metrics["failed_seconds"])
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+""" Module for configuring logging without blocking the threads logging
+
+This script configures the handlers of the logging configuration file and
+moves them behind a queue: the threads logging only put their records on the
+queue, and a listener thread writes them out through the configured handlers,
+each filtering the records by its own level. The structured formatter writes
+every record as a JSON object with the extra fields given to the logging call.
+The console handlers can be left out, for batch jobs, and the file the file
+handlers write to can be set by the LIBRARY_LOG_FILE environment variable, it
+contains the following classes and functions
+
+    * StructuredFormatter
+    * configure_logging
+    * stop_logging
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * json - Package used to parse json files
+
+"""
+
+# Standard Imports
+import atexit
+from datetime import datetime
+import json
+import logging
+import logging.config
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import sys
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+CONFIG_PATH = os.path.join("configs", "log.json")
+
+# Attributes of every record, the other attributes are the extra fields of the logging call
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_LISTENER = {}
+
+
+class StructuredFormatter(logging.Formatter):
+    """This class formats a record as a JSON object, with the extra fields of the logging call."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _is_console(handler):
+    """Function to check whether a handler writes to the standard output or error"""
+    return isinstance(handler, logging.StreamHandler) and \
+        getattr(handler, "stream", None) in (sys.stdout, sys.stderr)
+
+
+def configure_logging(path=CONFIG_PATH, console=None, filename=None):
+    """
+    Function to configure logging from a file, with the handlers behind a queue
+
+    Parameters
+    ----------
+    path : str
+        Path of the dictConfig configuration file.
+    console : bool
+        Whether to keep the handlers writing to the console, defaults to True
+        unless the LIBRARY_LOG_CONSOLE environment variable is 0.
+    filename : str
+        File the file handlers write to, defaults to the LIBRARY_LOG_FILE environment
+        variable or to the files of the configuration, relative to the working directory.
+
+    Returns
+    -------
+    QueueListener
+        Listener writing the queued records, stopped at exit.
+    """
+    if console is None:
+        console = os.environ.get("LIBRARY_LOG_CONSOLE", "1") != "0"
+    filename = filename or os.environ.get("LIBRARY_LOG_FILE")
+
+    stop_logging()
+    with open(path) as file:
+        config = json.load(file)
+    for handler in config.get("handlers", {}).values():
+        if "filename" in handler:
+            if filename:
+                handler["filename"] = filename
+            # Creating the directory of the log file, such as Logs in a new checkout
+            if os.path.dirname(handler["filename"]):
+                os.makedirs(os.path.dirname(handler["filename"]), exist_ok=True)
+    logging.config.dictConfig(config)
+
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if console or not _is_console(handler)]
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    records = queue.SimpleQueue()
+    root.addHandler(QueueHandler(records))
+    listener = _LISTENER["listener"] = QueueListener(records, *handlers,
+                                                     respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_logging():
+    """
+    Function to write the queued records and stop the listener, if logging was configured
+    """
+    listener = _LISTENER.pop("listener", None)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+""" Module for a cache of the compiled hot queries
+
+This script keeps the hot lookups of the circulation functions as baked
+queries: a query is built and compiled to SQL once per shape, keyed by the code
+of the function building it and the arguments changing its shape, and only
+its parameters change from a call to the next. The lists of the IN criteria
+are expanding parameters, so a list of any length uses the same cached query.
+The lookups of the cached queries and of their compiled statements are counted,
+it contains the following classes and functions
+
+    * CountingCache
+    * bake
+    * in_list
+    * bakery_stats
+    * log_bakery_stats
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard Imports
+import logging
+import threading
+
+# External Imports
+from sqlalchemy import bindparam, util
+from sqlalchemy.engine.interfaces import Dialect
+from sqlalchemy.ext import baked
+
+
+__author__ = 'praveen@gyandata.com'
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of queries and compiled statements kept, the least recently used are evicted beyond it
+BAKERY_SIZE = 500
+
+
+class CountingCache(util.LRUCache):
+    """This class is the least recently used cache of a bakery, counting its hits and misses.
+
+    The bakery keeps the queries by their key and the compiled statements of
+    the queries by dialect, both are counted apart.
+
+    Attributes
+    ----------
+    counts : dict
+        Hits and misses of the queries and of the statements.
+
+    """
+
+    def __init__(self, capacity=BAKERY_SIZE):
+        super().__init__(capacity)
+        self.counts = {kind: {"hits": 0, "misses": 0} for kind in ("queries", "statements")}
+        self._counts_lock = threading.Lock()
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        kind = "statements" if isinstance(key[0], Dialect) else "queries"
+        with self._counts_lock:
+            self.counts[kind]["misses" if value is default else "hits"] += 1
+        return value
+
+
+_CACHE = CountingCache()
+
+# Bakery of the hot queries, called with the function building the query and the arguments
+# of its shape, such as bake(lambda session: session.query(model), model)
+bake = baked.Bakery(baked.BakedQuery, _CACHE)  # pylint: disable=invalid-name
+
+
+def in_list(name):
+    """
+    Function to get the parameter of the list of an IN criterion, rendered for its length
+
+    Parameters
+    ----------
+    name : str
+        Name of the parameter, the list is given to the params of the baked query.
+
+    Returns
+    -------
+    BindParameter
+        Expanding parameter.
+    """
+    return bindparam(name, expanding=True)
+
+
+def bakery_stats():
+    """
+    Function to get the hit and miss counters of the bakery
+
+    Returns
+    -------
+    dict
+        Hits, misses and hit rate of the queries and of the compiled statements,
+        and the number of entries kept.
+    """
+    with _CACHE._counts_lock:  # pylint: disable=protected-access
+        stats = {kind: dict(counts) for kind, counts in _CACHE.counts.items()}
+    for counts in stats.values():
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+    stats["size"] = len(_CACHE)
+    return stats
+
+
+def log_bakery_stats():
+    """
+    Function to log the hit rates of the bakery
+    """
+    stats = bakery_stats()
+    LOGGER.info("Baked queries: %.1f%% of %d lookups hit, statements: %.1f%% of %d lookups hit, "
+                "%d entries", 100 * stats["queries"]["hit_rate"],
+                stats["queries"]["hits"] + stats["queries"]["misses"],
+                100 * stats["statements"]["hit_rate"],
+                stats["statements"]["hits"] + stats["statements"]["misses"], stats["size"])
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+""" Module for a read-through cache of the reference entities
+
+This script keeps a process local cache of the rows of the tables which
+almost never change, the students, professors, staffs, departments and books,
+looked up by primary key. The rows are cached as immutable snapshots of their
+columns, in a size bounded least recently used cache whose entries expire
+after a time to live. The rows missing from the cache are read with baked
+queries. A flush changing a cached row evicts it, and evicts it
+again once the transaction ends, so neither the old row cached by another
+thread in between nor the new row read from the transaction before it
+committed is kept, it contains the following classes and functions
+
+    * LRUCache
+    * lookup
+    * lookup_many
+    * invalidate
+    * cache_stats
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard Imports
+from collections import OrderedDict, namedtuple
+import threading
+import time
+
+# External Imports
+from sqlalchemy import bindparam, event, inspect
+from sqlalchemy.orm import Session
+
+# User Imports
+from library.orm.bakery import bake, in_list
+from library.orm.models import Books, Department, Professors, Staffs, Students
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+# Number of rows cached for every model and seconds a row is cached for
+CACHE_SIZE = 10000
+CACHE_TTL = 300.0
+
+# Columns cached for every model, the counters of the books change on every issue
+CACHED_COLUMNS = {
+    Students: ("reg_id", "name", "doj", "dept_id"),
+    Professors: ("employee_code", "name", "dept_id"),
+    Staffs: ("staff_id", "name"),
+    Department: ("dept_id", "name"),
+    Books: ("isbn_id", "name", "dept_id"),
+}
+
+# Key of the session info holding the keys flushed in the transaction
+_FLUSHED = "reference_cache_flushed"
+
+
+class LRUCache:
+    """This class is a thread safe least recently used cache whose entries expire.
+
+    Attributes
+    ----------
+    max_size : int
+        Number of entries kept, the least recently used one is evicted beyond it.
+
+    ttl : float
+        Seconds an entry is kept for.
+
+    hits : int
+        Number of lookups answered from the cache.
+
+    misses : int
+        Number of lookups not in the cache or expired.
+
+    """
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Function to get a cached value, None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Function to cache a value, evicting the least recently used values beyond the size"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        """Function to evict a value"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Function to evict every value"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Snapshot type and cache of every model
+SNAPSHOTS = {model: namedtuple(model.__name__ + "Snapshot", columns)
+             for model, columns in CACHED_COLUMNS.items()}
+CACHES = {model: LRUCache() for model in CACHED_COLUMNS}
+
+
+def _query(session, model):
+    """Function to build the query of the cached columns of a model"""
+    return session.query(*[getattr(model, column) for column in CACHED_COLUMNS[model]])
+
+
+def _baked_query(model, many=False):
+    """Function to get the baked query of the cached columns of a model, by key or by list of keys"""
+    column = inspect(model).primary_key[0]
+    if many:
+        return bake(lambda session: _query(session, model).filter(column.in_(in_list("keys"))), model)
+    return bake(lambda session: _query(session, model).filter(column == bindparam("key")), model)
+
+
+def lookup(session, model, key):
+    """
+    Function to get a row by primary key, from the cache or from the database
+
+    Parameters
+    ----------
+    session : Session
+        Session used on a cache miss.
+    model : class
+        One of the cached models.
+    key : int
+        Primary key of the row.
+
+    Returns
+    -------
+    namedtuple
+        Snapshot of the cached columns of the row, None if it is not in the database.
+    """
+    cache = CACHES[model]
+    snapshot = cache.get(key)
+    if snapshot is None:
+        row = _baked_query(model)(session).params(key=key).one_or_none()
+        if row is None:
+            return None
+        snapshot = SNAPSHOTS[model](*row)
+        cache.put(key, snapshot)
+    return snapshot
+
+
+def lookup_many(session, model, keys):
+    """
+    Function to get rows by primary key, querying the missing ones together
+
+    Parameters
+    ----------
+    session : Session
+        Session used on cache misses.
+    model : class
+        One of the cached models.
+    keys : iterable
+        Primary keys of the rows.
+
+    Returns
+    -------
+    dict
+        Snapshot of every row found, by primary key.
+    """
+    cache = CACHES[model]
+    snapshots = {}
+    missing = []
+    for key in set(keys):
+        snapshot = cache.get(key)
+        if snapshot is None:
+            missing.append(key)
+        else:
+            snapshots[key] = snapshot
+
+    if missing:
+        for row in _baked_query(model, many=True)(session).params(keys=missing):
+            snapshot = SNAPSHOTS[model](*row)
+            cache.put(snapshot[0], snapshot)
+            snapshots[snapshot[0]] = snapshot
+    return snapshots
+
+
+def invalidate(model, keys=None):
+    """
+    Function to evict rows of a model changed without a flush, such as by bulk updates
+
+    Parameters
+    ----------
+    model : class
+        One of the cached models.
+    keys : iterable
+        Primary keys of the rows, defaults to every row of the model.
+    """
+    if keys is None:
+        CACHES[model].clear()
+    else:
+        for key in keys:
+            CACHES[model].discard(key)
+
+
+def cache_stats():
+    """
+    Function to get the hit and miss counters of the caches
+
+    Returns
+    -------
+    dict
+        Hits, misses and size of the cache, by model name.
+    """
+    return {model.__name__: {"hits": cache.hits, "misses": cache.misses, "size": len(cache)}
+            for model, cache in CACHES.items()}
+
+
+@event.listens_for(Session, "after_flush")
+def _evict_flushed(session, flush_context):  # pylint: disable=unused-argument
+    """Function to evict the cached rows changed by a flush"""
+    flushed = session.info.setdefault(_FLUSHED, set())
+    for instance in list(session.dirty) + list(session.deleted):
+        model = type(instance)
+        if model in CACHES:
+            key = inspect(instance).identity[0]
+            CACHES[model].discard(key)
+            flushed.add((model, key))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _evict_ended(session, transaction):
+    """Function to evict the rows flushed in a transaction again once it is committed or
+    rolled back, the rows read from it meanwhile may have been cached, a savepoint
+    ending leaves them to the transaction"""
+    if transaction.parent is None:
+        for model, key in session.info.pop(_FLUSHED, ()):
+            if key is None:
+                CACHES[model].clear()
+            else:
+                CACHES[model].discard(key)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _evict_bulk(context):
+    """Function to evict every cached row of a model changed by a bulk query update or delete"""
+    model = context.mapper.class_
+    if model in CACHES:
+        CACHES[model].clear()
+        # Every row of the model is evicted again once the transaction ends
+        context.session.info.setdefault(_FLUSHED, set()).add((model, None))
@@ -16,6 +16,8 @@ orm_queries based SQL operations, it contains the following classes
     * ProfessorActivity
     * StudentBorrow
     * ProfessorBorrow
+    * DepartmentImpact
+    * FineLedger
 
 This script requires that the following packages be installed within the Python
 environment you are running this script in.
@@ -30,17 +32,22 @@ import enum
 
 # External Imports
 from sqlalchemy import Column, Integer, Enum, \
-    String, Float, DATE, Boolean, ForeignKey, CheckConstraint
+    String, Float, DATE, Boolean, ForeignKey, CheckConstraint, Index
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import TIMESTAMP
 from sqlalchemy import text
 from sqlalchemy.schema import FetchedValue
+from sqlalchemy.sql.functions import FunctionElement
 
 __author__ = 'praveen@gyandata.com'
 
 BASE = declarative_base()
 
+# Number of days a book item is lent for
+LOAN_DAYS = 15
+
 
 class BookStatus(enum.Enum):
     """ Enum class to store the status of book items"""
@@ -49,6 +56,30 @@ class BookStatus(enum.Enum):
     LOST = "LOST"
 
 
+class UpdatedTimestamp(FunctionElement):
+    """ Server default of the last updated columns, refreshed on every update
+    by MySQL and set only on insert by databases without ON UPDATE (sqlite)"""
+    name = "updated_timestamp"
+    type = TIMESTAMP()
+
+
+@compiles(UpdatedTimestamp)
+def _compile_updated_timestamp(element, compiler, **kwargs):  # pylint: disable=unused-argument
+    """Function to compile the last updated default for databases without ON UPDATE"""
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(UpdatedTimestamp, "mysql")
+def _compile_mysql_updated_timestamp(element, compiler, **kwargs):  # pylint: disable=unused-argument
+    """Function to compile the last updated default for MySQL"""
+    return "CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"
+
+
+def default_due_date():
+    """Function to get the due date of a book item issued today"""
+    return date.today() + timedelta(LOAN_DAYS)
+
+
 class TimestampMixin:
     """
     Class to be inherited by other classes to get user trail attributes
@@ -61,7 +92,7 @@ class TimestampMixin:
         server_default=text("CURRENT_TIMESTAMP"))
     last_updated = Column(
         TIMESTAMP,
-        server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+        server_default=UpdatedTimestamp(),
         server_onupdate=FetchedValue())
 
 
@@ -196,6 +227,15 @@ class Books(TimestampMixin, BASE):
     quantity : int
         Number of copies of books available.
 
+    available_count : int
+        Number of copies available, kept in step with the status of the book items.
+
+    issued_count : int
+        Number of copies issued, kept in step with the status of the book items.
+
+    lost_count : int
+        Number of copies lost, kept in step with the status of the book items.
+
     dept_id : str
         Foreign key referring to Department Table, denoting the department
         to which the book belongs to
@@ -205,9 +245,15 @@ class Books(TimestampMixin, BASE):
 
     """
     __tablename__ = 'books'
+    # Finding the books of a department
+    __table_args__ = (Index('ix_books_dept', 'dept_id'),
+                      {'mysql_engine': 'InnoDB'})
     isbn_id = Column(Integer(), primary_key=True)
     name = Column(String(255), index=True, nullable=False)
     quantity = Column(Integer(), nullable=False)
+    available_count = Column(Integer(), nullable=False, default=0, server_default=text("0"))
+    issued_count = Column(Integer(), nullable=False, default=0, server_default=text("0"))
+    lost_count = Column(Integer(), nullable=False, default=0, server_default=text("0"))
     dept_id = Column(Integer(), ForeignKey('department.dept_id'), nullable=False)
 
     book_items = relationship("BookItem", backref=backref('book'),
@@ -304,9 +350,16 @@ class BookItem(TimestampMixin, BASE):
     isbn_id : int
         Foreign key referring to the Books table.
 
+    version : int
+        Incremented on every issue and return, updates conditioned on the
+        version read fail instead of overwriting a concurrent change.
+
     """
 
     __tablename__ = 'book_item'
+    # Finding the items of a book, by status
+    __table_args__ = (Index('ix_book_item_isbn_status', 'isbn_id', 'status'),
+                      {'mysql_engine': 'InnoDB'})
 
     bar_code = Column(Integer(), primary_key=True)
     # Date of Purchase
@@ -318,6 +371,7 @@ class BookItem(TimestampMixin, BASE):
     status = Column(Enum(BookStatus), default=BookStatus.AVAILABLE, nullable=False)
     tampered = Column(Boolean(), default=False)
     isbn_id = Column(Integer(), ForeignKey('books.isbn_id'), nullable=False)
+    version = Column(Integer(), nullable=False, default=0, server_default=text("0"))
 
 
 class StudentActivity(TimestampMixin, BASE):
@@ -339,6 +393,9 @@ class StudentActivity(TimestampMixin, BASE):
 
     """
     __tablename__ = 'student_activity'
+    # Finding the activities of a student, by date of issue
+    __table_args__ = (Index('ix_student_activity_student_doi', 'student_id', 'doi'),
+                      {'mysql_engine': 'InnoDB'})
     trans_id = Column(Integer(), primary_key=True)
     # Date of issue
     doi = Column(DATE(), nullable=False)
@@ -367,6 +424,9 @@ class ProfessorActivity(TimestampMixin, BASE):
 
     """
     __tablename__ = 'professor_activity'
+    # Finding the activities of a professor, by date of issue
+    __table_args__ = (Index('ix_professor_activity_professor_doi', 'professor_id', 'doi'),
+                      {'mysql_engine': 'InnoDB'})
     trans_id = Column(Integer(), primary_key=True)
     # Date of issue
     doi = Column(DATE(), nullable=False)
@@ -402,9 +462,14 @@ class StudentBorrow(TimestampMixin, BASE):
 
     """
     __tablename__ = 'student_borrow'
+    # Finding the open overdue borrows without scanning the returned ones
+    __table_args__ = (Index('ix_student_borrow_return_due', 'return_date', 'due_date'),
+                      # Finding the latest borrows of a book item
+                      Index('ix_student_borrow_item_trans', 'book_bar_code_id', 'student_trans_id'),
+                      {'mysql_engine': 'InnoDB'})
     student_trans_id = Column(Integer, ForeignKey("student_activity.trans_id"), primary_key=True)
     book_bar_code_id = Column(Integer, ForeignKey("book_item.bar_code"), primary_key=True)
-    due_date = Column(DATE(), nullable=False, default=date.today() + timedelta(15))
+    due_date = Column(DATE(), nullable=False, default=default_due_date)
     return_date = Column(DATE())
 
     student_activity = relationship("StudentActivity",
@@ -441,12 +506,18 @@ class ProfessorBorrow(TimestampMixin, BASE):
     """
 
     __tablename__ = 'professor_borrow'
+    # Finding the open overdue borrows without scanning the returned ones
+    __table_args__ = (Index('ix_professor_borrow_return_due', 'return_date', 'due_date'),
+                      # Finding the latest borrows of a book item
+                      Index('ix_professor_borrow_item_trans', 'book_bar_code_id',
+                            'professor_trans_id'),
+                      {'mysql_engine': 'InnoDB'})
     professor_trans_id = Column(Integer, ForeignKey("professor_activity.trans_id"),
                                 primary_key=True)
     book_bar_code_id = Column(Integer, ForeignKey("book_item.bar_code"),
                               primary_key=True)
     # Due Date
-    due_date = Column(DATE(), nullable=False, default=date.today() + timedelta(15))
+    due_date = Column(DATE(), nullable=False, default=default_due_date)
     # Return Date
     return_date = Column(DATE())
 
@@ -455,3 +526,89 @@ class ProfessorBorrow(TimestampMixin, BASE):
                                                       cascade="all, delete, delete-orphan"))
     book_item = relationship("BookItem", backref=backref("professor_activity_associations",
                                                          cascade="all, delete, delete-orphan"))
+
+
+class DepartmentImpact(TimestampMixin, BASE):
+    """This class stores the summary of the loans of the books of a department,
+    by the department and type of the borrowers. The issue and return functions
+    keep it up to date in their own transactions.
+
+    Attributes
+    ----------
+    book_dept_id : int
+        Primary Key of DepartmentImpact table, also a foreign key denoting the
+        department of the books.
+
+    borrower_dept_id : int
+        Primary Key of DepartmentImpact table, also a foreign key denoting the
+        department of the borrowers.
+
+    borrower_type : ["student", "professor"]
+        Primary Key of DepartmentImpact table, type of the borrowers.
+
+    loan_count : int
+        Number of book items ever issued.
+
+    active_loan_count : int
+        Number of book items issued and not yet returned.
+
+    """
+    __tablename__ = 'department_impact'
+    book_dept_id = Column(Integer(), ForeignKey('department.dept_id'), primary_key=True)
+    borrower_dept_id = Column(Integer(), ForeignKey('department.dept_id'), primary_key=True)
+    borrower_type = Column(String(16), primary_key=True)
+    loan_count = Column(Integer(), nullable=False, default=0, server_default=text("0"))
+    active_loan_count = Column(Integer(), nullable=False, default=0, server_default=text("0"))
+
+
+class FineLedger(TimestampMixin, BASE):
+    """This class stores the fines of the overdue borrows, assessed by the overdue engine.
+    The fine of a borrow is assessed again every night until the book item is returned.
+
+    Attributes
+    ----------
+    borrower_type : ["student", "professor"]
+        Primary Key of FineLedger table, type of the borrower.
+
+    trans_id : int
+        Primary Key of FineLedger table, the transaction of the borrow.
+
+    bar_code : int
+        Primary Key of FineLedger table, also a foreign key denoting the book_item.
+
+    borrower_id : int
+        Student or Professor id.
+
+    due_date : DATE
+        Due date of the borrow.
+
+    days_overdue : int
+        Number of days past the due date.
+
+    amount : float
+        Fine, by the rate schedule.
+
+    assessed_on : DATE
+        Date the fine was last assessed.
+
+    """
+    __tablename__ = 'fine_ledger'
+    borrower_type = Column(String(16), primary_key=True)
+    trans_id = Column(Integer(), primary_key=True)
+    bar_code = Column(Integer(), ForeignKey('book_item.bar_code'), primary_key=True)
+    borrower_id = Column(Integer(), nullable=False)
+    due_date = Column(DATE(), nullable=False)
+    days_overdue = Column(Integer(), nullable=False)
+    amount = Column(Float(2), CheckConstraint('amount >= 0.00'), nullable=False)
+    assessed_on = Column(DATE(), nullable=False, index=True)
+
+
+# Borrower, activity and borrow models of every type of borrower
+BORROWER_MODELS = {
+    "student": {"borrower": Students, "key": Students.reg_id,
+                "activity": StudentActivity, "activity_key": "student_id",
+                "borrow": StudentBorrow, "trans_key": "student_trans_id"},
+    "professor": {"borrower": Professors, "key": Professors.employee_code,
+                  "activity": ProfessorActivity, "activity_key": "professor_id",
+                  "borrow": ProfessorBorrow, "trans_key": "professor_trans_id"},
+}
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+""" Module for inserting or updating rows in a single statement
+
+This script builds the dialect specific upsert statements, it contains the
+following functions
+
+    * upsert_statement
+    * upsert
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# External Imports
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects import mysql
+
+
+__author__ = 'praveen@gyandata.com'
+
+# Dialects having an upsert statement
+DIALECTS = ("mysql", "sqlite")
+
+
+def _mysql_upsert(table, update_columns, increment_columns):
+    """
+    Function to build an INSERT ... ON DUPLICATE KEY UPDATE statement
+
+    Parameters
+    ----------
+    table : Table
+        Table to insert into.
+    update_columns : list
+        Names of the columns overwritten when the key already exists.
+    increment_columns : list
+        Names of the columns added to when the key already exists.
+
+    Returns
+    -------
+    Insert
+        Upsert statement.
+    """
+    statement = mysql.insert(table)
+    values = {name: statement.inserted[name] for name in update_columns}
+    values.update({name: table.columns[name] + statement.inserted[name]
+                   for name in increment_columns})
+    if not values:
+        # Assigning the key to itself turns the duplicate into a no-op
+        name = table.primary_key.columns.values()[0].name
+        values = {name: statement.inserted[name]}
+    return statement.on_duplicate_key_update(values)
+
+
+def _sqlite_upsert(table, columns, update_columns, increment_columns):
+    """
+    Function to build an INSERT ... ON CONFLICT statement
+
+    Parameters
+    ----------
+    table : Table
+        Table to insert into.
+    columns : list
+        Names of the columns present in the rows.
+    update_columns : list
+        Names of the columns overwritten when the key already exists.
+    increment_columns : list
+        Names of the columns added to when the key already exists.
+
+    Returns
+    -------
+    TextClause
+        Upsert statement.
+    """
+    keys = ", ".join(column.name for column in table.primary_key.columns)
+    assignments = [f"{name} = excluded.{name}" for name in update_columns]
+    assignments += [f"{name} = {name} + excluded.{name}" for name in increment_columns]
+    if assignments:
+        action = "DO UPDATE SET " + ", ".join(assignments)
+    else:
+        action = "DO NOTHING"
+    statement = text(f"INSERT INTO {table.name} ({', '.join(columns)}) "
+                     f"VALUES ({', '.join(':' + name for name in columns)}) "
+                     f"ON CONFLICT ({keys}) {action}")
+    # Typing the parameters keeps the column conversions, such as enums and dates
+    return statement.bindparams(*[bindparam(name, type_=table.columns[name].type)
+                                  for name in columns])
+
+
+def upsert_statement(dialect, table, columns, update_columns=None, increment_columns=()):
+    """
+    Function to build the upsert statement of a dialect
+
+    Parameters
+    ----------
+    dialect : str
+        Name of the dialect, mysql or sqlite.
+    table : Table
+        Table to insert into.
+    columns : list
+        Names of the columns present in the rows.
+    update_columns : list
+        Names of the columns overwritten when the key already exists,
+        defaults to every non key column of the rows that is not incremented.
+    increment_columns : iterable
+        Names of the columns whose value in the row is added to the existing
+        value when the key already exists.
+
+    Returns
+    -------
+    Insert or TextClause
+        Upsert statement, executed with the row dictionaries.
+
+    Raises
+    ------
+    ValueError
+        If the dialect has no upsert statement.
+    """
+    increment_columns = list(increment_columns)
+    if update_columns is None:
+        update_columns = [name for name in columns
+                          if name not in table.primary_key.columns.keys()
+                          and name not in increment_columns]
+
+    if dialect == "mysql":
+        return _mysql_upsert(table, update_columns, increment_columns)
+    if dialect == "sqlite":
+        return _sqlite_upsert(table, columns, update_columns, increment_columns)
+    raise ValueError(f"Dialect should be one of {', '.join(DIALECTS)}, not {dialect}")
+
+
+def upsert(session, table, rows, update_columns=None, increment_columns=()):
+    """
+    Function to insert rows, updating the rows whose primary key already exists
+
+    Parameters
+    ----------
+    session : Session
+        Session used to execute the statement.
+    table : Table
+        Table to insert into.
+    rows : list
+        Row dictionaries, all having the same keys.
+    update_columns : list
+        Names of the columns overwritten when the key already exists,
+        defaults to every non key column of the rows that is not incremented.
+    increment_columns : iterable
+        Names of the columns whose value in the row is added to the existing
+        value when the key already exists, such as counters.
+    """
+    if not rows:
+        return
+
+    statement = upsert_statement(session.get_bind().dialect.name, table, list(rows[0]),
+                                 update_columns, increment_columns)
+    session.execute(statement, rows)
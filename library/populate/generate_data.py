@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+""" Module for generating reproducible synthetic data as load files
+
+This script splits the departments across a process pool, every department
+is generated with its own seed derived from the dataset seed, so the same seed
+always yields the same files no matter how many workers are used. The rows are
+written as per-table CSV files along with the scripts to bulk load them, it
+contains the following functions
+
+    * generate
+    * main
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from datetime import date
+import enum
+import logging
+import os
+import random
+import shutil
+
+# User Import
+from library.orm.models import BASE
+from library.populate.populate_db import generate_rows
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Tables in the order of their foreign keys
+TABLE_ORDER = ("staffs", "department", "students", "professors", "books",
+               "authors", "book_has_authors", "book_item")
+
+# Generated dates are relative to this date, so that they do not change from day to day
+REFERENCE_DATE = date(2020, 1, 1)
+
+# Audit columns are left to their server defaults
+AUDIT_COLUMNS = ("created_on", "last_updated")
+
+
+def _columns(table_name):
+    """
+    Function to get the columns written to the load file of a table
+
+    Parameters
+    ----------
+    table_name : str
+        Name of the table.
+
+    Returns
+    -------
+    list
+        Names of the columns in table order.
+    """
+    return [column.name for column in BASE.metadata.tables[table_name].columns
+            if column.name not in AUDIT_COLUMNS]
+
+
+def _to_csv(value):
+    """
+    Function to convert a row value into its load file representation
+
+    Parameters
+    ----------
+    value : object
+        Value of a column.
+
+    Returns
+    -------
+    object
+        Value understood by both LOAD DATA INFILE and sqlite .import
+    """
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _department_rng(seed, index):
+    """
+    Function to get the random number generator of a department
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the whole dataset.
+    index : int
+        Zero based position of the department.
+
+    Returns
+    -------
+    random.Random
+        Generator seeded only by the dataset seed and the department position.
+    """
+    return random.Random(seed * 1000003 + index)
+
+
+def _part_path(output_dir, table_name, shard):
+    """Function to get the path of the part file written by a worker"""
+    return os.path.join(output_dir, f"{table_name}.part{shard}.csv")
+
+
+def _generate_shard(output_dir, shard, dept_range, scale, offsets, seed):
+    """
+    Function run by a worker to write the part files for a range of departments
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory the part files are written to.
+    shard : int
+        Number of the shard, used to name the part files.
+    dept_range : range
+        Zero based positions of the departments to generate.
+    scale : dict
+        Number of students, professors, books (per department) and items (per book).
+    offsets : dict
+        Largest primary key already present in each table.
+    seed : int
+        Seed of the whole dataset.
+
+    Returns
+    -------
+    dict
+        Number of rows written for every table name.
+    """
+    counts = dict.fromkeys(TABLE_ORDER[1:], 0)
+    files = {name: open(_part_path(output_dir, name, shard), "w", newline="", encoding="utf-8")
+             for name in counts}
+    try:
+        writers = {name: csv.writer(file, lineterminator="\n") for name, file in files.items()}
+        for index in dept_range:
+            rows = generate_rows(scale, offsets, range(index, index + 1),
+                                 _department_rng(seed, index), REFERENCE_DATE)
+            for name, writer in writers.items():
+                columns = _columns(name)
+                for row in rows[name]:
+                    writer.writerow([_to_csv(row[column]) for column in columns])
+                    counts[name] += 1
+    finally:
+        for file in files.values():
+            file.close()
+    return counts
+
+
+def _write_load_scripts(output_dir):
+    """
+    Function to write the MySQL and sqlite scripts loading the generated files
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory holding the generated files.
+    """
+    mysql_lines = ["SET foreign_key_checks = 0;", "SET unique_checks = 0;"]
+    sqlite_lines = [".mode csv", "BEGIN;"]
+    for name in TABLE_ORDER:
+        path = os.path.abspath(os.path.join(output_dir, name + ".csv")).replace("\\", "/")
+        columns = ", ".join(_columns(name))
+        mysql_lines.append(f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {name}\n"
+                           f"    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"'\n"
+                           f"    LINES TERMINATED BY '\\n' IGNORE 1 LINES ({columns});")
+        # .import creates the staging table from the header row
+        sqlite_lines.extend([f".import '{path}' {name}_load",
+                             f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {name}_load;",
+                             f"DROP TABLE {name}_load;"])
+    mysql_lines.extend(["SET unique_checks = 1;", "SET foreign_key_checks = 1;"])
+    sqlite_lines.append("COMMIT;")
+
+    with open(os.path.join(output_dir, "load_mysql.sql"), "w", encoding="utf-8") as file:
+        file.write("\n".join(mysql_lines) + "\n")
+    with open(os.path.join(output_dir, "load_sqlite.sql"), "w", encoding="utf-8") as file:
+        file.write("\n".join(sqlite_lines) + "\n")
+
+
+def generate(output_dir, seed=0, departments=3, students=10, professors=3, books=10,
+             items=2, staffs=3, workers=None, offsets=None):
+    """
+    Function to generate a reproducible dataset as per-table CSV files
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory the files are written to, created if missing.
+    seed : int
+        Seed of the dataset, the same seed always yields the same files.
+    departments : int
+        Number of departments.
+    students : int
+        Number of students per department.
+    professors : int
+        Number of professors per department.
+    books : int
+        Number of books (each with one author) per department.
+    items : int
+        Number of book items per book.
+    staffs : int
+        Number of staffs.
+    workers : int
+        Number of worker processes, defaults to the number of cpus.
+    offsets : dict
+        Largest primary key already present in each table, defaults to an empty database.
+
+    Returns
+    -------
+    dict
+        Number of rows written for every table name.
+    """
+    # Asserting the parameters
+    assert isinstance(seed, int), "Seed should be integer"
+    assert all(isinstance(value, int) and value >= 0
+               for value in (departments, students, professors, books, items, staffs)), \
+        "Scale parameters should be non negative integers"
+
+    os.makedirs(output_dir, exist_ok=True)
+    scale = {"students": students, "professors": professors, "books": books, "items": items}
+    offsets = offsets or dict.fromkeys(TABLE_ORDER, 0)
+    workers = max(1, min(workers or os.cpu_count() or 1, departments))
+
+    # Splitting the departments into one contiguous range per worker
+    step = max(1, -(-departments // workers))
+    shards = [range(start, min(start + step, departments)) for start in range(0, departments, step)]
+
+    counts = dict.fromkeys(TABLE_ORDER, 0)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_generate_shard, output_dir, shard, dept_range,
+                                   scale, offsets, seed)
+                   for shard, dept_range in enumerate(shards)]
+        for future in futures:
+            for name, count in future.result().items():
+                counts[name] += count
+
+    # Staffs do not depend on the seed and are written directly
+    with open(os.path.join(output_dir, "staffs.csv"), "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(_columns("staffs"))
+        for i in range(staffs):
+            writer.writerow([offsets["staffs"] + i + 1, "Staff-" + str(offsets["staffs"] + i + 1)])
+    counts["staffs"] = staffs
+
+    # Merging the part files of every table in shard order
+    for name in TABLE_ORDER[1:]:
+        with open(os.path.join(output_dir, name + ".csv"), "w", newline="",
+                  encoding="utf-8") as file:
+            csv.writer(file, lineterminator="\n").writerow(_columns(name))
+            for shard in range(len(shards)):
+                with open(_part_path(output_dir, name, shard), encoding="utf-8") as part:
+                    shutil.copyfileobj(part, file)
+                os.remove(_part_path(output_dir, name, shard))
+
+    _write_load_scripts(output_dir)
+    LOGGER.info("Generated %s into %s with seed %d", counts, output_dir, seed)
+    return counts
+
+
+def main():
+    """ The main function to generate the default dataset"""
+
+    generate("data", seed=0)
+
+
+if __name__ == '__main__':
+    main()
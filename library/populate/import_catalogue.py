@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+""" Module for importing book catalogues from CSV or JSONL exports
+
+This script streams a catalogue file one record at a time, validates and maps
+every record to the books, authors, book_has_authors and book_item tables and
+upserts them in fixed size batches, so the memory used does not depend on the
+size of the file. The byte offset reached is checkpointed after every batch and
+an interrupted import resumes from there, it contains the following functions
+
+    * read_records
+    * map_record
+    * import_catalogue
+
+Every record describes one book item and its book and author, the fields are
+
+    isbn_id, book_name, dept_id, author_id, author_name, bar_code, dopur,
+    dopub, price, edition and status (optional, defaults to AVAILABLE)
+
+Records without a bar_code only import the book and its author. CSV files must
+have a header row and no line breaks inside quoted fields.
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+import csv
+from datetime import date
+import json
+import logging
+import os
+
+# External Imports
+from sqlalchemy.exc import DBAPIError
+
+# User Import
+from library.orm.models import Authors, Books, BooksAuthor, BookItem, BookStatus
+from library.connections.transactions import run_with_retry
+from library.orm.cache import invalidate
+from library.orm.upsert import upsert
+from library.query import status_cache
+from library.query.availability import refresh_counters
+from library.populate.populate_db import population_session_scope
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Tables in the order of their foreign keys
+TABLES = (Books, Authors, BooksAuthor, BookItem)
+
+# Columns of the existing rows owned by the catalogue. The quantity of the books is
+# recounted from their items, and the status, tampered state and version of the book
+# items belong to the circulation, so they are only written when an item is new
+UPDATE_COLUMNS = {"books": ["name", "dept_id"],
+                  "book_item": ["dopur", "dopub", "price", "edition"]}
+
+
+def read_records(path, offset=0):
+    """
+    Function to read the records of a CSV or JSONL file, starting at a byte offset
+
+    Parameters
+    ----------
+    path : str
+        Path of the file, read as JSONL if it ends with .jsonl or .json
+    offset : int
+        Byte offset of the first record to read, 0 reads the whole file.
+
+    Yields
+    ------
+    tuple
+        Record dictionary, or the text of a JSONL line which map_record parses,
+        and the byte offset just after it.
+    """
+    is_json = path.lower().endswith((".jsonl", ".json"))
+    with open(path, "rb") as file:
+        header = None
+        if not is_json:
+            header = next(csv.reader([file.readline().decode("utf-8-sig")]))
+        if offset > file.tell():
+            file.seek(offset)
+
+        for line in iter(file.readline, b""):
+            line = line.decode("utf-8").strip()
+            if not line:
+                continue
+            if is_json:
+                record = line
+            else:
+                record = dict(zip(header, next(csv.reader([line]))))
+            yield record, file.tell()
+
+
+def map_record(record):
+    """
+    Function to validate a record and map it to the rows of every table
+
+    Parameters
+    ----------
+    record : dict or str
+        Record read from the catalogue, or the text of a JSONL line.
+
+    Returns
+    -------
+    dict
+        Row dictionary (or None) for every table name.
+
+    Raises
+    ------
+    ValueError
+        If the line is not valid JSON, or a field is missing or invalid.
+    """
+    try:
+        if isinstance(record, str):
+            # Parsing the line here, so that a malformed line is rejected alone
+            record = json.loads(record)
+        rows = {"books": {"isbn_id": int(record["isbn_id"]),
+                          "name": str(record["book_name"]).strip(),
+                          "quantity": 0,
+                          "dept_id": int(record["dept_id"])},
+                "authors": {"author_id": int(record["author_id"]),
+                            "name": str(record["author_name"]).strip()},
+                "book_item": None}
+        if record.get("bar_code") not in (None, ""):
+            rows["book_item"] = {"bar_code": int(record["bar_code"]),
+                                 "dopur": date.fromisoformat(record["dopur"]),
+                                 "dopub": date.fromisoformat(record["dopub"]),
+                                 "price": round(float(record["price"]), 2),
+                                 "edition": float(record["edition"])
+                                            if record.get("edition") not in (None, "") else None,
+                                 "status": BookStatus[record.get("status") or "AVAILABLE"],
+                                 "tampered": False,
+                                 "isbn_id": int(record["isbn_id"])}
+    except (KeyError, TypeError, ValueError) as err:
+        raise ValueError(f"Invalid field {err}") from err
+
+    if not rows["books"]["name"] or not rows["authors"]["name"]:
+        raise ValueError("Book and author names should not be empty")
+    if rows["book_item"] and rows["book_item"]["price"] < 0:
+        raise ValueError("Price should not be negative")
+
+    rows["book_has_authors"] = {"isbn_id": rows["books"]["isbn_id"],
+                                "author_id": rows["authors"]["author_id"]}
+    return rows
+
+
+def _load_checkpoint(checkpoint, path):
+    """
+    Function to get the offset checkpointed for a file
+
+    Parameters
+    ----------
+    checkpoint : str
+        Path of the checkpoint file.
+    path : str
+        Path of the catalogue file.
+
+    Returns
+    -------
+    int
+        Checkpointed byte offset, 0 if there is none for this file.
+    """
+    if not checkpoint or not os.path.exists(checkpoint):
+        return 0
+    with open(checkpoint) as file:
+        data = json.load(file)
+    if data.get("source") != os.path.abspath(path):
+        return 0
+    return data.get("offset", 0)
+
+
+def _save_checkpoint(checkpoint, path, offset):
+    """
+    Function to atomically save the offset reached in a file
+
+    Parameters
+    ----------
+    checkpoint : str
+        Path of the checkpoint file.
+    path : str
+        Path of the catalogue file.
+    offset : int
+        Byte offset of the first record not yet imported.
+    """
+    temp = checkpoint + ".tmp"
+    with open(temp, "w") as file:
+        json.dump({"source": os.path.abspath(path), "offset": offset}, file)
+    os.replace(temp, checkpoint)
+
+
+def _write_batch(session, batch):
+    """
+    Function to upsert and commit a batch of rows and recount the counters of its books,
+    leaving nothing behind if it fails
+
+    Parameters
+    ----------
+    session : Session
+        Session used to write the rows.
+    batch : dict
+        Row dictionaries keyed by primary key, for every table name.
+    """
+    try:
+        for table in TABLES:
+            upsert(session, table.__table__, list(batch[table.__tablename__].values()),
+                   UPDATE_COLUMNS.get(table.__tablename__))
+
+        # Quantity and availability of the books having new items are recounted from their items
+        bar_codes = [row["bar_code"] for row in batch["book_item"].values()]
+        refresh_counters(session, bar_codes)
+        # Cached status of the books is evicted once the batch commits, names included
+        status_cache.mark_changed(session, bar_codes,
+                                  [row["isbn_id"] for row in batch["books"].values()])
+        session.commit()
+        # The books were changed by the upserts, without a flush evicting them from the cache
+        invalidate(Books, [row["isbn_id"] for row in batch["books"].values()])
+    except DBAPIError:
+        session.rollback()
+        raise
+
+
+def import_catalogue(path, batch_size=1000, checkpoint=None):
+    """
+    Function to import a catalogue file into the database in batches
+
+    Parameters
+    ----------
+    path : str
+        Path of the CSV or JSONL file.
+    batch_size : int
+        Number of records upserted and committed together.
+    checkpoint : str
+        Path of the checkpoint file, defaults to the catalogue path with .checkpoint
+        appended. It is removed once the whole file is imported.
+
+    Returns
+    -------
+    dict
+        Number of imported and rejected records.
+    """
+    checkpoint = checkpoint or path + ".checkpoint"
+    stats = {"imported": 0, "rejected": 0}
+    complete = False
+
+    with population_session_scope() as session:
+        # Asserting the parameters
+        assert isinstance(batch_size, int) and batch_size > 0, "Batch size should be positive"
+
+        offset = _load_checkpoint(checkpoint, path)
+        if offset:
+            LOGGER.info("Resuming import of %s from byte %d", path, offset)
+
+        batch = {table.__tablename__: {} for table in TABLES}
+        pending = 0
+        for record, end in read_records(path, offset):
+            try:
+                rows = map_record(record)
+            except ValueError as err:
+                LOGGER.warning("Rejected record ending at byte %d of %s: %s", end, path, err)
+                stats["rejected"] += 1
+            else:
+                for table in TABLES:
+                    row = rows[table.__tablename__]
+                    if row:
+                        # Keeping the last occurrence of a key within the batch
+                        key = tuple(row[column.name] for column in table.__table__.primary_key)
+                        batch[table.__tablename__][key] = row
+                pending += 1
+
+            if pending >= batch_size:
+                run_with_retry("import_catalogue", _write_batch, session, batch)
+                _save_checkpoint(checkpoint, path, end)
+                stats["imported"] += pending
+                batch = {table.__tablename__: {} for table in TABLES}
+                pending = 0
+
+        run_with_retry("import_catalogue", _write_batch, session, batch)
+        stats["imported"] += pending
+        complete = True
+
+    if complete and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    LOGGER.info("Imported %d records from %s, rejected %d",
+                stats["imported"], path, stats["rejected"])
+    return stats
@@ -5,6 +5,7 @@ This script contains all the functions to populate the database using
 orm_queries classes, it contains the following functions
 
     * populate
+    * bulk_populate
     * main
 
 This script requires that the following packages be installed within the Python
@@ -18,13 +19,20 @@ environment you are running this script in.
 import random
 from datetime import date, timedelta
 from contextlib import contextmanager
+from itertools import islice
 import logging
+import time
+
+# External Imports
+from sqlalchemy import func
+from sqlalchemy.exc import DBAPIError
 
 # User Import
 from library.orm.models import Staffs, Department, \
     Students, Professors, Books, BookItem,\
-    BASE, Authors
-from library.connections.get_connection import ENGINE, SESSION_FACTORY
+    BASE, Authors, BooksAuthor, BookStatus
+from library.connections.get_connection import get_engine
+from library.connections.transactions import operation, run_with_retry, session_scope
 
 
 __author__ = 'praveen@gyandata.com'
@@ -32,23 +40,21 @@ __author__ = 'praveen@gyandata.com'
 
 LOGGER = logging.getLogger(__name__)
 
+# Version of the generated data, to be increased whenever generate_rows changes
+GENERATOR_VERSION = 2
+
+# Names given to the first departments, later departments are numbered
+DEPARTMENT_NAMES = ("Mechanical", "Computer", "Electrical")
+
 
 @contextmanager
-def population_session_scope():
+def population_session_scope(bind=None):
     """Provide a transactional scope around a series of operations."""
-    session = SESSION_FACTORY()
-    try:
+    with session_scope(bind) as session:
         yield session
-        session.commit()
-    except AssertionError as err:
-        LOGGER.error(err)
-    except AttributeError as err:
-        session.rollback()
-        LOGGER.error(err)
-    finally:
-        session.close()
 
 
+@operation("populate", attempts=1)
 def populate():
     """
     Function to populate the database
@@ -97,7 +103,7 @@ def populate():
 
                 # Creating 10 books and one author for every book
                 book = Books(name="book" + str(department.name) + str(i), quantity=2,
-                             department=department)
+                             available_count=2, department=department)
                 author = Authors(name="Author" + str(department.name) + str(i))
                 book_1 = BookItem(dopur=date.today() - timedelta(random.randint(30, 600)),
                                   dopub=date.today() - timedelta(random.randint(30, 600)),
@@ -112,11 +118,262 @@ def populate():
                 session.commit()
 
 
+def department_name(index):
+    """
+    Function to get the name of the department at the given position
+
+    Parameters
+    ----------
+    index : int
+        Zero based position of the department.
+
+    Returns
+    -------
+    str
+        Name of the department.
+    """
+    name = DEPARTMENT_NAMES[index % len(DEPARTMENT_NAMES)]
+    if index >= len(DEPARTMENT_NAMES):
+        # Numbering the repeated names to keep them unique
+        name += str(index // len(DEPARTMENT_NAMES))
+    return name
+
+
+def generate_rows(scale, offsets, dept_range, rng=random, today=None):
+    """
+    Function to generate the rows of every table for a range of departments
+
+    The primary keys are derived from the department position, so a department
+    always gets the same ids no matter which range it is generated in.
+
+    Parameters
+    ----------
+    scale : dict
+        Number of students, professors, books (per department) and items (per book).
+    offsets : dict
+        Largest primary key already present in each table.
+    dept_range : range
+        Zero based positions of the departments to generate.
+    rng : random.Random
+        Random number generator used for dates and prices.
+    today : date
+        Date the generated dates are relative to, defaults to today.
+
+    Returns
+    -------
+    dict
+        Generator of row dictionaries for every table name.
+    """
+    today = today or date.today()
+
+    def departments():
+        for i in dept_range:
+            yield {"dept_id": offsets["department"] + i + 1, "name": department_name(i)}
+
+    def students():
+        for i in dept_range:
+            for j in range(scale["students"]):
+                yield {"reg_id": offsets["students"] + i * scale["students"] + j + 1,
+                       "name": "student" + department_name(i) + str(j),
+                       "doj": today - timedelta(rng.randint(30, 600)),
+                       "dept_id": offsets["department"] + i + 1}
+
+    def professors():
+        for i in dept_range:
+            for j in range(scale["professors"]):
+                yield {"employee_code": offsets["professors"] + i * scale["professors"] + j + 1,
+                       "name": "professor" + department_name(i) + str(j),
+                       "dept_id": offsets["department"] + i + 1}
+
+    def books():
+        for i in dept_range:
+            for j in range(scale["books"]):
+                yield {"isbn_id": offsets["books"] + i * scale["books"] + j + 1,
+                       "name": "book" + department_name(i) + str(j),
+                       "quantity": scale["items"],
+                       "available_count": scale["items"],
+                       "issued_count": 0,
+                       "lost_count": 0,
+                       "dept_id": offsets["department"] + i + 1}
+
+    def authors():
+        # One author for every book
+        for i in dept_range:
+            for j in range(scale["books"]):
+                yield {"author_id": offsets["authors"] + i * scale["books"] + j + 1,
+                       "name": "Author" + department_name(i) + str(j)}
+
+    def book_authors():
+        for i in dept_range:
+            for j in range(scale["books"]):
+                yield {"isbn_id": offsets["books"] + i * scale["books"] + j + 1,
+                       "author_id": offsets["authors"] + i * scale["books"] + j + 1}
+
+    def book_items():
+        for i in dept_range:
+            for j in range(scale["books"]):
+                book_index = i * scale["books"] + j
+                for k in range(scale["items"]):
+                    yield {"bar_code": offsets["book_item"] + book_index * scale["items"] + k + 1,
+                           "dopur": today - timedelta(rng.randint(30, 600)),
+                           "dopub": today - timedelta(rng.randint(30, 600)),
+                           "price": round((rng.random() * 10000), 2),
+                           "edition": float(k + 1),
+                           "status": BookStatus.AVAILABLE,
+                           "tampered": False,
+                           "version": 0,
+                           "isbn_id": offsets["books"] + book_index + 1}
+
+    return {"department": departments(), "students": students(),
+            "professors": professors(), "books": books(), "authors": authors(),
+            "book_has_authors": book_authors(), "book_item": book_items()}
+
+
+def current_offsets(session):
+    """
+    Function to get the largest primary key present in every seeded table
+
+    Parameters
+    ----------
+    session : Session
+        Session used to query the database.
+
+    Returns
+    -------
+    dict
+        Largest primary key (0 for empty tables) for every table name.
+    """
+    keys = {"staffs": Staffs.staff_id, "department": Department.dept_id,
+            "students": Students.reg_id, "professors": Professors.employee_code,
+            "books": Books.isbn_id, "authors": Authors.author_id,
+            "book_item": BookItem.bar_code}
+    return {name: session.query(func.max(key)).scalar() or 0 for name, key in keys.items()}
+
+
+def _commit_chunk(session, table, chunk):
+    """
+    Function to insert and commit a chunk of rows, leaving nothing behind if it fails
+
+    Parameters
+    ----------
+    session : Session
+        Session used to insert the rows.
+    table : Table
+        Table to insert into.
+    chunk : list
+        Row dictionaries to be inserted.
+    """
+    try:
+        session.execute(table.insert(), chunk)
+        session.commit()
+    except DBAPIError:
+        session.rollback()
+        raise
+
+
+def _insert_chunked(session, table, rows, chunk_size):
+    """
+    Function to insert rows into a table using executemany, committing every chunk
+
+    A chunk failing with a transient error is inserted again, the chunks
+    already committed are kept, so a whole population is never retried.
+
+    Parameters
+    ----------
+    session : Session
+        Session used to insert the rows.
+    table : Table
+        Table to insert into.
+    rows : iterable
+        Row dictionaries to be inserted.
+    chunk_size : int
+        Number of rows inserted and committed together.
+
+    Returns
+    -------
+    dict
+        Number of rows, seconds taken and rows per second.
+    """
+    count = 0
+    start = time.perf_counter()
+    rows = iter(rows)
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+        run_with_retry("bulk_populate." + table.name, _commit_chunk, session, table, chunk)
+        count += len(chunk)
+        chunk = list(islice(rows, chunk_size))
+
+    seconds = time.perf_counter() - start
+    rate = count / seconds if seconds else 0.0
+    LOGGER.info("Inserted %d rows into %s in %.2fs (%.0f rows/sec)",
+                count, table.name, seconds, rate)
+    return {"rows": count, "seconds": seconds, "rows_per_sec": rate}
+
+
+@operation("bulk_populate", attempts=1)
+def bulk_populate(departments=3, students=10, professors=3, books=10, items=2,
+                  staffs=3, chunk_size=1000, bind=None):
+    """
+    Function to populate the database in bulk, at the given scale
+
+    Rows are inserted through executemany in chunks with one commit per chunk,
+    new rows are numbered after the rows already present in the database.
+
+    Parameters
+    ----------
+    departments : int
+        Number of departments.
+    students : int
+        Number of students per department.
+    professors : int
+        Number of professors per department.
+    books : int
+        Number of books (each with one author) per department.
+    items : int
+        Number of book items per book.
+    staffs : int
+        Number of staffs.
+    chunk_size : int
+        Number of rows inserted and committed together.
+    bind : Engine
+        Engine of the database to populate, defaults to the configured engine.
+
+    Returns
+    -------
+    dict
+        Rows, seconds and rows per second for every table name.
+    """
+    scale = {"students": students, "professors": professors, "books": books, "items": items}
+    stats = {}
+
+    with population_session_scope(bind) as session:
+        # Asserting the parameters
+        assert all(isinstance(value, int) and value >= 0
+                   for value in list(scale.values()) + [departments, staffs]), \
+            "Scale parameters should be non negative integers"
+        assert isinstance(chunk_size, int) and chunk_size > 0, "Chunk size should be positive"
+
+        offsets = current_offsets(session)
+        stats["staffs"] = _insert_chunked(
+            session, Staffs.__table__,
+            ({"staff_id": offsets["staffs"] + i + 1, "name": "Staff-" + str(offsets["staffs"] + i + 1)}
+             for i in range(staffs)),
+            chunk_size)
+
+        # Tables are inserted in the order of their foreign keys
+        rows = generate_rows(scale, offsets, range(departments))
+        for table in (Department, Students, Professors, Books, Authors, BooksAuthor, BookItem):
+            name = table.__tablename__
+            stats[name] = _insert_chunked(session, table.__table__, rows[name], chunk_size)
+
+    return stats
+
+
 def main():
     """ The main function to initialize engines and call necessary functions"""
 
     # Creating all tables in the database
-    BASE.metadata.create_all(ENGINE)
+    BASE.metadata.create_all(get_engine())
 
     # calling populate function to populate the database
     populate()
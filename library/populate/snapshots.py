@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+""" Module for prebuilt dataset snapshots
+
+This script builds every named dataset preset once into a cached sqlite file,
+keyed by a hash of the schema, the generator version and the preset. A run
+clones the cached file with the sqlite backup API instead of creating and
+populating the tables again, a cache miss builds the snapshot first, it
+contains the following functions
+
+    * snapshot_key
+    * expected_rows
+    * build_snapshot
+    * clone_snapshot
+    * use_snapshot
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+
+# External Imports
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+# User Import
+from library.connections.get_connection import SESSION_FACTORY, create_engine
+from library.orm.models import BASE
+from library.populate.populate_db import GENERATOR_VERSION, bulk_populate
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Scale of the named datasets, the small preset matches populate()
+PRESETS = {
+    "small": {"departments": 3, "students": 10, "professors": 3, "books": 10, "items": 2},
+    "medium": {"departments": 10, "students": 1000, "professors": 20, "books": 500, "items": 3},
+    "large": {"departments": 30, "students": 10000, "professors": 50, "books": 5000, "items": 4},
+}
+
+# Directory holding the cached snapshots
+SNAPSHOT_DIR = os.environ.get("LIBRARY_SNAPSHOT_DIR", ".snapshots")
+
+
+def snapshot_key(preset):
+    """
+    Function to get the cache key of a preset
+
+    Parameters
+    ----------
+    preset : str
+        Name of the preset.
+
+    Returns
+    -------
+    str
+        Hash of the sqlite schema, the generator version and the preset scale.
+    """
+    digest = hashlib.sha256()
+    dialect = sqlite.dialect()
+    for table in BASE.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    digest.update(str(GENERATOR_VERSION).encode())
+    digest.update(json.dumps(PRESETS[preset], sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def expected_rows(preset):
+    """
+    Function to get the number of rows of the tables of a preset
+
+    Parameters
+    ----------
+    preset : str
+        Name of the preset.
+
+    Returns
+    -------
+    dict
+        Number of rows of the department, students, professors, books and book_item tables.
+    """
+    scale = PRESETS[preset]
+    departments = scale["departments"]
+    return {"department": departments,
+            "students": departments * scale["students"],
+            "professors": departments * scale["professors"],
+            "books": departments * scale["books"],
+            "book_item": departments * scale["books"] * scale["items"]}
+
+
+def _snapshot_path(preset):
+    """Function to get the path of the cached snapshot of a preset"""
+    return os.path.join(SNAPSHOT_DIR, f"{preset}-{snapshot_key(preset)}.sqlite")
+
+
+def build_snapshot(preset):
+    """
+    Function to build the snapshot of a preset, unless it is already cached
+
+    Parameters
+    ----------
+    preset : str
+        Name of the preset.
+
+    Returns
+    -------
+    str
+        Path of the cached snapshot.
+    """
+    assert preset in PRESETS, f"Preset should be one of {', '.join(PRESETS)}"
+
+    path = _snapshot_path(preset)
+    if os.path.exists(path):
+        return path
+
+    LOGGER.info("Building the %s snapshot into %s", preset, path)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    # Building into a temporary file, so that an interrupted build is never cached
+    handle, temp = tempfile.mkstemp(suffix=".sqlite", dir=SNAPSHOT_DIR)
+    os.close(handle)
+    engine = create_engine("sqlite", url="sqlite:///" + temp)
+    try:
+        BASE.metadata.create_all(engine)
+        bulk_populate(bind=engine, chunk_size=10000, **PRESETS[preset])
+        # A failed population is only logged, so the rows are counted before caching them
+        missing = {table: rows for table, rows in expected_rows(preset).items()
+                   if engine.execute(f"SELECT count(*) FROM {table}").scalar() != rows}
+        if missing:
+            raise RuntimeError(f"Snapshot of {preset} is incomplete, expected rows {missing}")
+        engine.dispose()
+        os.replace(temp, path)
+    finally:
+        engine.dispose()
+        if os.path.exists(temp):
+            os.remove(temp)
+    return path
+
+
+def clone_snapshot(preset, target=None):
+    """
+    Function to clone the snapshot of a preset, building it on a cache miss
+
+    Parameters
+    ----------
+    preset : str
+        Name of the preset.
+    target : str
+        Path of the clone, defaults to a new temporary file.
+
+    Returns
+    -------
+    str
+        Path of the clone.
+    """
+    source = build_snapshot(preset)
+    if target is None:
+        handle, target = tempfile.mkstemp(suffix=".sqlite", prefix=preset + "-")
+        os.close(handle)
+
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        source_connection.backup(target_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
+    return target
+
+
+def use_snapshot(preset, target=None):
+    """
+    Function to point the session factory at a clone of the snapshot of a preset
+
+    Parameters
+    ----------
+    preset : str
+        Name of the preset.
+    target : str
+        Path of the clone, defaults to a new temporary file.
+
+    Returns
+    -------
+    Engine
+        Engine of the clone, to be disposed by the caller.
+    """
+    engine = create_engine("sqlite", url="sqlite:///" + clone_snapshot(preset, target))
+    SESSION_FACTORY.configure(bind=engine)
+    return engine
@@ -0,0 +1,534 @@
+# -*- coding: utf-8 -*-
+""" Module for doing library transactions from an asyncio event loop
+
+This script contains the async counterparts of the issue, return, status and
+impact functions of library.query.queries. The statements are built from the
+same models and queries, compiled with SQLAlchemy and executed through an async
+driver (aiomysql for MySQL, aiosqlite as a local stand-in) over a small pool of
+connections, so one event loop can serve many concurrent desk requests. It
+contains the following classes and functions
+
+    * AsyncPool
+    * issue
+    * returning
+    * check_status
+    * bulk_status
+    * impact
+
+Unlike their synchronous counterparts the functions return their results
+and raise AttributeError when a transaction can not be done.
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+    * aiosqlite - Async sqlite driver, for sqlite urls
+    * aiomysql - Async MySQL driver, for mysql urls
+
+"""
+
+# Standard Imports
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+import logging
+import time
+
+# External Imports
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.engine.url import make_url
+
+# User Imports
+from library.orm.models import BookItem, BookStatus, Department, DepartmentImpact, Staffs
+from library.orm.upsert import upsert_statement
+from library.query import status_cache
+from library.query.availability import counters_update
+from library.query.impact_summary import COUNT_COLUMNS, borrower_departments_query, \
+    item_departments_query, loan_rows, returning_departments_query, return_rows
+from library.query.queries import BORROWER_MODELS, IssueResult, IssueRequest, ReturnRequest, \
+    ReturnResult, collect_titles, impact_query, open_borrows_query, title_status_query
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncPool:
+    """This class stores a small pool of async database connections.
+
+    Attributes
+    ----------
+    url : URL
+        Database url, sqlite or mysql.
+
+    size : int
+        Maximum number of open connections.
+
+    dialect : Dialect
+        Dialect the statements are compiled with.
+
+    """
+
+    def __init__(self, url, size=5):
+        self.url = make_url(url)
+        self.size = size
+        self._idle = asyncio.LifoQueue()
+        self._opened = 0
+        self._lock = asyncio.Lock()
+
+        if self.url.get_backend_name() == "sqlite":
+            assert aiosqlite, "aiosqlite is required for sqlite urls"
+            self.dialect = sqlite.dialect(paramstyle="qmark")
+        elif self.url.get_backend_name() == "mysql":
+            assert aiomysql, "aiomysql is required for mysql urls"
+            self.dialect = mysql.pymysql.dialect(paramstyle="format")
+        else:
+            raise ValueError(f"Database should be sqlite or mysql, "
+                             f"not {self.url.get_backend_name()}")
+
+    async def _connect(self):
+        """Function to open a new connection"""
+        if self.url.get_backend_name() == "sqlite":
+            # Transactions are begun explicitly
+            connection = await aiosqlite.connect(self.url.database, isolation_level=None)
+            await connection.execute("PRAGMA foreign_keys = ON")
+            return connection
+        return await aiomysql.connect(host=self.url.host, port=self.url.port or 3306,
+                                      user=self.url.username, password=self.url.password or "",
+                                      db=self.url.database, autocommit=False,
+                                      charset=self.url.query.get("charset", "utf8mb4"))
+
+    async def _acquire(self):
+        """Function to get an idle connection, opening one while below the pool size"""
+        async with self._lock:
+            if self._idle.empty() and self._opened < self.size:
+                self._opened += 1
+                try:
+                    return await self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        connection = await self._idle.get()
+        if connection is None:
+            # The slot of a discarded connection, reopened
+            try:
+                return await self._connect()
+            except Exception:
+                self._idle.put_nowait(None)
+                raise
+        return connection
+
+    async def _close(self, connection):
+        """Function to close a connection"""
+        if self.url.get_backend_name() == "sqlite":
+            await connection.close()
+        else:
+            connection.close()
+
+    async def _discard(self, connection):
+        """Function to close a broken connection, keeping its slot for a new one"""
+        try:
+            await self._close(connection)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.warning("Could not close a broken connection: %s", err)
+        self._idle.put_nowait(None)
+
+    @asynccontextmanager
+    async def transaction(self, write=False):
+        """
+        Provide a transactional scope around a series of statements.
+
+        Parameters
+        ----------
+        write : bool
+            True if the transaction writes, sqlite then takes the write lock up front.
+        """
+        connection = await self._acquire()
+        reusable = False
+        try:
+            if self.url.get_backend_name() == "sqlite":
+                await connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            else:
+                await connection.begin()
+            yield AsyncTransaction(connection, self.dialect)
+            await connection.commit()
+            reusable = True
+        except BaseException:
+            try:
+                await connection.rollback()
+                reusable = True
+            except Exception as err:  # pylint: disable=broad-except
+                LOGGER.warning("Could not roll back, closing the connection: %s", err)
+            raise
+        finally:
+            # A connection that could not end its transaction is not given to another one
+            if reusable:
+                self._idle.put_nowait(connection)
+            else:
+                await self._discard(connection)
+
+    async def close(self):
+        """Function to close all the idle connections"""
+        while not self._idle.empty():
+            connection = self._idle.get_nowait()
+            if connection is not None:
+                await self._close(connection)
+            self._opened -= 1
+
+
+class AsyncTransaction:
+    """This class executes SQLAlchemy statements on an async connection.
+
+    Attributes
+    ----------
+    connection : Connection
+        aiosqlite or aiomysql connection, inside a transaction.
+
+    dialect : Dialect
+        Dialect the statements are compiled with.
+
+    """
+
+    def __init__(self, connection, dialect):
+        self.connection = connection
+        self.dialect = dialect
+
+    @staticmethod
+    def _defaults(compiled):
+        """Function to evaluate the python side defaults of the columns missing from an insert"""
+        defaults = {}
+        for column in getattr(compiled, "insert_prefetch", ()):
+            default = column.default
+            defaults[column.key] = default.arg if default.is_scalar else default.arg(None)
+        return defaults
+
+    def _parameters(self, compiled, params):
+        """Function to order and process the parameters of a compiled statement"""
+        values = []
+        for name in compiled.positiontup:
+            processor = compiled.binds[name].type.dialect_impl(self.dialect).\
+                bind_processor(self.dialect)
+            values.append(processor(params[name]) if processor else params[name])
+        return values
+
+    def _compile(self, statement):
+        """Function to compile a statement into its SQL and processed positional parameters"""
+        compiled = statement.compile(dialect=self.dialect)
+        params = compiled.construct_params()
+        params.update(self._defaults(compiled))
+        return str(compiled), self._parameters(compiled, params)
+
+    async def execute(self, statement):
+        """
+        Function to execute a statement
+
+        Parameters
+        ----------
+        statement : Executable
+            Core statement.
+
+        Returns
+        -------
+        tuple
+            Number of rows affected and the id of the last inserted row.
+        """
+        sql, values = self._compile(statement)
+        cursor = await self.connection.cursor()
+        try:
+            await cursor.execute(sql, values)
+            return cursor.rowcount, cursor.lastrowid
+        finally:
+            await cursor.close()
+
+    async def executemany(self, statement, rows):
+        """
+        Function to execute an insert once for every row
+
+        Parameters
+        ----------
+        statement : Insert
+            Core insert, compiled with the keys of the first row.
+        rows : list
+            Row dictionaries, all having the same keys.
+        """
+        compiled = statement.compile(dialect=self.dialect, column_keys=list(rows[0]))
+        defaults = self._defaults(compiled)
+        values = [self._parameters(compiled, dict(defaults, **row)) for row in rows]
+        cursor = await self.connection.cursor()
+        try:
+            await cursor.executemany(str(compiled), values)
+        finally:
+            await cursor.close()
+
+    async def fetch(self, statement):
+        """
+        Function to execute a select and get all its rows
+
+        Parameters
+        ----------
+        statement : Select
+            Core select.
+
+        Returns
+        -------
+        list
+            Rows as tuples, with the values converted to their python types.
+        """
+        sql, values = self._compile(statement)
+        processors = [column.type.dialect_impl(self.dialect).result_processor(self.dialect, None)
+                      for column in statement.inner_columns]
+        cursor = await self.connection.cursor()
+        try:
+            await cursor.execute(sql, values)
+            rows = await cursor.fetchall()
+        finally:
+            await cursor.close()
+        return [tuple(processor(value) if processor else value
+                      for processor, value in zip(processors, row)) for row in rows]
+
+
+async def _record_impact(transaction, rows):
+    """Function to add summary rows to the counts of the impact summary"""
+    if rows:
+        await transaction.executemany(
+            upsert_statement(transaction.dialect.name, DepartmentImpact.__table__, list(rows[0]),
+                             increment_columns=COUNT_COLUMNS), rows)
+
+
+async def issue(pool, borrower_type, borrower_id, staff_id, bar_codes):
+    """
+    Function to issue books to a student or a professor
+
+    Parameters
+    ----------
+    pool : AsyncPool
+        Pool of connections to the database.
+    borrower_type : str
+        Type of borrower, student or professor.
+    borrower_id : int
+        Student or Professor id.
+    staff_id : int
+        Staff id who handled the issue.
+    bar_codes : list
+        list of book-item bar codes being borrowed
+
+    Returns
+    -------
+    IssueResult
+        Result of the issue, with the transaction id.
+    """
+    request = IssueRequest(borrower_type, borrower_id, staff_id, bar_codes)
+
+    # Asserting the parameters
+    assert borrower_type in BORROWER_MODELS, "Borrower type should be student or professor"
+    assert isinstance(bar_codes, list) and bar_codes, "Books should be a non empty list"
+    models = BORROWER_MODELS[borrower_type]
+    if len(set(bar_codes)) != len(bar_codes):
+        raise AttributeError("Book item repeated in request")
+
+    async with pool.transaction(write=True) as transaction:
+        if not await transaction.fetch(select([models["key"]]).where(models["key"] == borrower_id)):
+            raise AttributeError(f"{borrower_type.capitalize()} not in DB")
+        if not await transaction.fetch(select([Staffs.staff_id]).where(Staffs.staff_id == staff_id)):
+            raise AttributeError("Staff not in DB")
+
+        found = await transaction.fetch(select([BookItem.isbn_id]).
+                                        where(BookItem.bar_code.in_(bar_codes)))
+        if len(found) != len(bar_codes):
+            raise AttributeError("Book item not in DB")
+
+        # Changing the status of the available book items, in one atomic statement
+        issued, _ = await transaction.execute(
+            BookItem.__table__.update().
+            where(BookItem.bar_code.in_(bar_codes)).
+            where(BookItem.status == BookStatus.AVAILABLE).
+            values(status=BookStatus.UNAVAILABLE, version=BookItem.version + 1))
+        if issued != len(bar_codes):
+            raise AttributeError("Book item not Available")
+        await transaction.execute(counters_update(bar_codes))
+
+        _, trans_id = await transaction.execute(models["activity"].__table__.insert().values(
+            {"doi": date.today(), models["activity_key"]: borrower_id, "staff_id": staff_id}))
+        await transaction.executemany(
+            models["borrow"].__table__.insert(),
+            [{models["trans_key"]: trans_id, "book_bar_code_id": bar_code} for bar_code in bar_codes])
+
+        borrower_departments = dict(await transaction.fetch(
+            borrower_departments_query(borrower_type, [borrower_id]).statement))
+        item_departments = dict(await transaction.fetch(item_departments_query(bar_codes).statement))
+        await _record_impact(transaction, loan_rows(borrower_type, [(borrower_id, bar_codes)],
+                                                    borrower_departments, item_departments))
+
+    # Evicting the status of the books once the issue is committed
+    status_cache.invalidate({row[0] for row in found})
+    return IssueResult(request, True, trans_id, None)
+
+
+async def returning(pool, borrower_type, bar_codes, lost=False, tampered=False):
+    """
+    Function to return books from a student or a professor
+
+    Parameters
+    ----------
+    pool : AsyncPool
+        Pool of connections to the database.
+    borrower_type : str
+        Type of borrower, student or professor.
+    bar_codes : list
+        list of book-item bar codes being returned.
+    lost : bool
+        True if the borrower has lost the book.
+    tampered : bool
+        True if the book was tampered while returning.
+
+    Returns
+    -------
+    list
+        ReturnResult of every book item returned, with its transaction id and fine.
+    """
+    # Asserting the parameters
+    assert borrower_type in BORROWER_MODELS, "Borrower type should be student or professor"
+    assert isinstance(bar_codes, list) and bar_codes, "Books should be a non empty list"
+    borrow = BORROWER_MODELS[borrower_type]["borrow"]
+
+    async with pool.transaction(write=True) as transaction:
+        rows = await transaction.fetch(
+            select([BookItem.bar_code, BookItem.tampered, BookItem.version, BookItem.isbn_id]).
+            where(BookItem.bar_code.in_(bar_codes)))
+        items = {row[0]: row[1:3] for row in rows}
+        if len(items) != len(set(bar_codes)):
+            raise AttributeError("Book item not in DB")
+
+        open_borrows = dict(await transaction.fetch(
+            open_borrows_query(borrower_type, items).statement))
+        if len(open_borrows) != len(items):
+            raise AttributeError("Book Not Found in Any Borrowed Transaction")
+
+        await _record_impact(transaction, return_rows(borrower_type, await transaction.fetch(
+            returning_departments_query(borrower_type, items).statement)))
+
+        await transaction.execute(borrow.__table__.update().
+                                  where(borrow.book_bar_code_id.in_(items)).
+                                  where(borrow.return_date.is_(None)).
+                                  values(return_date=date.today()))
+
+        # Updating the book items only if they did not change since they were read
+        values = {"status": BookStatus.LOST if lost else BookStatus.AVAILABLE,
+                  "version": BookItem.version + 1}
+        if tampered:
+            values["tampered"] = True
+        updated, _ = await transaction.execute(
+            BookItem.__table__.update().
+            where(tuple_(BookItem.bar_code, BookItem.version).
+                  in_([(bar_code, version) for bar_code, (_, version) in items.items()])).
+            values(values))
+        if updated != len(items):
+            raise AttributeError("Book item changed by a concurrent transaction")
+        await transaction.execute(counters_update(list(items)))
+
+    # Evicting the status of the books once the return is committed
+    status_cache.invalidate({row[3] for row in rows})
+
+    # Fine has to be paid for book items tampered for the first time, and by students
+    # for lost book items, professors are not fined for losing a book item
+    return [ReturnResult(ReturnRequest(bar_code, lost, tampered), True, borrower_type,
+                         open_borrows[bar_code],
+                         (lost and borrower_type == "student") or (tampered and not was_tampered),
+                         None)
+            for bar_code, (was_tampered, _) in items.items()]
+
+
+async def bulk_status(pool, isbn_ids):
+    """
+    Function to get the status and due dates of the items of many books at once
+
+    Parameters
+    ----------
+    pool : AsyncPool
+        Pool of connections to the database.
+    isbn_ids : list
+        Primary Keys/ Isbn codes of Books.
+
+    Returns
+    -------
+    dict
+        TitleStatus of every book found, by isbn code.
+    """
+    assert isinstance(isbn_ids, list), "Book Ids should be a list"
+    if not isbn_ids:
+        return {}
+
+    # Querying only the books missing from the status cache
+    isbn_ids = set(isbn_ids)
+    titles = status_cache.get_titles(list(isbn_ids))
+    missing = isbn_ids.difference(titles)
+    if missing:
+        # Noting when the read started, so that a status evicted meanwhile is not cached
+        started = time.time()
+        async with pool.transaction() as transaction:
+            fetched = collect_titles(await transaction.fetch(title_status_query(missing).statement))
+        status_cache.put_titles(fetched, started)
+        titles.update(fetched)
+    return titles
+
+
+async def check_status(pool, book_id):
+    """
+    Function to check the status of a given book
+
+    Parameters
+    ----------
+    pool : AsyncPool
+        Pool of connections to the database.
+    book_id : int
+        Primary Key/ Isbn code of Book.
+
+    Returns
+    -------
+    TitleStatus
+        Status of the book items of the book.
+    """
+    assert isinstance(book_id, int), "Book Id should be integer"
+
+    title = (await bulk_status(pool, [book_id])).get(book_id)
+    if not title:
+        raise AttributeError("Book not in DB")
+    return title
+
+
+async def impact(pool, dep):
+    """
+    Function to get the borrows of a department's books by students of other departments
+
+    Parameters
+    ----------
+    pool : AsyncPool
+        Pool of connections to the database.
+    dep : int
+        Department Id
+
+    Returns
+    -------
+    list
+        (transaction id, book name, student name, student department name) rows.
+    """
+    assert isinstance(dep, int), "Department Id should be integer"
+
+    async with pool.transaction() as transaction:
+        if not await transaction.fetch(select([Department.dept_id]).
+                                       where(Department.dept_id == dep)):
+            raise AttributeError("Department not in DB")
+        return await transaction.fetch(impact_query(dep).statement)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+""" Module for the availability counters of the books
+
+This script keeps the quantity, available, issued and lost counters of the
+books in step with the status of their book items. The counters of the books
+of the issued and returned book items are recounted by one UPDATE in the
+transaction that changes the items, and a reconciliation recounts every book,
+so the availability of a book is read with a primary key lookup, it contains
+the following functions
+
+    * counters_update
+    * refresh_counters
+    * reconcile_counters
+    * availability
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+from collections import namedtuple
+import logging
+
+# External Imports
+from sqlalchemy import and_, func, or_, select
+
+# User Import
+from library.orm.models import Books, BookItem, BookStatus
+from library.connections.transactions import operation, session_scope
+
+
+__author__ = 'praveen@gyandata.com'
+
+LOGGER = logging.getLogger(__name__)
+
+# Copies of a book, in total and by status
+Availability = namedtuple("Availability", ["isbn_id", "name", "quantity", "available",
+                                           "issued", "lost"])
+
+
+def _counts():
+    """Function to build the recount of every counter, correlated to the updated book"""
+    def count(*criteria):
+        return select([func.count(BookItem.bar_code)]).\
+            where(and_(BookItem.isbn_id == Books.isbn_id, *criteria)).as_scalar()
+
+    return {"quantity": count(),
+            "available_count": count(BookItem.status == BookStatus.AVAILABLE),
+            "issued_count": count(BookItem.status == BookStatus.UNAVAILABLE),
+            "lost_count": count(BookItem.status == BookStatus.LOST)}
+
+
+def counters_update(bar_codes=None):
+    """
+    Function to build the update recounting the counters of books
+
+    Parameters
+    ----------
+    bar_codes : iterable
+        Bar codes of the changed book items, defaults to recounting every book.
+
+    Returns
+    -------
+    Update
+        Core update of the books table.
+    """
+    statement = Books.__table__.update().values(_counts())
+    if bar_codes is None:
+        return statement
+    return statement.where(Books.isbn_id.in_(
+        select([BookItem.isbn_id]).where(BookItem.bar_code.in_(bar_codes))))
+
+
+def refresh_counters(session, bar_codes):
+    """
+    Function to recount the counters of the books of changed book items,
+    in the transaction that changed them
+
+    Parameters
+    ----------
+    session : Session
+        Session of the transaction.
+    bar_codes : iterable
+        Bar codes of the changed book items.
+    """
+    bar_codes = list(bar_codes)
+    if bar_codes:
+        session.execute(counters_update(bar_codes))
+
+
+@operation("reconcile_counters")
+def reconcile_counters():
+    """
+    Function to recount the counters of every book
+
+    Returns
+    -------
+    int
+        Number of books whose counters were out of step, None if the recount failed,
+        the reason is logged.
+    """
+    counts = _counts()
+    drifted = None
+    with session_scope() as session:
+        out_of_step = session.query(func.count(Books.isbn_id)).\
+            filter(or_(*[getattr(Books, name) != count for name, count in counts.items()])).scalar()
+        session.execute(counters_update())
+        LOGGER.info("Reconciled the counters, %d books were out of step", out_of_step)
+        # Set last, so that nothing is reported if the recount failed
+        drifted = out_of_step
+    return drifted
+
+
+@operation("availability")
+def availability(isbn_id):
+    """
+    Function to get the number of copies of a book, by status
+
+    Parameters
+    ----------
+    isbn_id : int
+        Primary Key/ Isbn code of Book.
+
+    Returns
+    -------
+    Availability
+        Copies of the book, None if the book is not in the database or the query failed,
+        the reason is logged.
+    """
+    row = None
+    with session_scope(read_only=True) as session:
+        row = session.query(Books.isbn_id, Books.name, Books.quantity, Books.available_count,
+                            Books.issued_count, Books.lost_count).\
+            filter(Books.isbn_id == isbn_id).first()
+    return Availability(*row) if row else None
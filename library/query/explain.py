@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+""" Module for checking the query plans of the hot queries
+
+This script runs EXPLAIN on a catalogue of the queries of the issue, return,
+status, impact and overdue functions, against a seeded database, and reports
+every query that reads a table with a full table scan instead of an index. Run
+as a script it checks a clone of a dataset snapshot and exits with an error if
+a plan regressed, it contains the following classes and functions
+
+    * Explain
+    * explain
+    * full_scans
+    * check_plans
+    * main
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+import argparse
+from datetime import date
+import logging
+import re
+import sys
+
+# External Imports
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.expression import ClauseElement
+
+# User Import
+from library.connections.transactions import session_scope
+from library.populate.snapshots import PRESETS, use_snapshot
+from library.query.availability import counters_update
+from library.query.impact_summary import item_departments_query, returning_departments_query
+from library.query.overdue import overdue_query
+from library.query.queries import impact_query, open_borrows_query, title_status_query
+
+
+__author__ = 'praveen@gyandata.com'
+
+LOGGER = logging.getLogger(__name__)
+
+# Hot queries by name, built with sample parameters
+CATALOGUE = {
+    "open_student_borrows": lambda: open_borrows_query("student", [1, 2]),
+    "open_professor_borrows": lambda: open_borrows_query("professor", [1, 2]),
+    "title_status": lambda: title_status_query([1, 2]),
+    "impact": lambda: impact_query(1),
+    "item_departments": lambda: item_departments_query([1, 2]),
+    "returning_student_departments": lambda: returning_departments_query("student", [1, 2]),
+    "returning_professor_departments": lambda: returning_departments_query("professor", [1, 2]),
+    "overdue_student_borrows": lambda: overdue_query("student", date.today()),
+    "overdue_professor_borrows": lambda: overdue_query("professor", date.today()),
+    "refresh_counters": lambda: counters_update([1, 2]),
+}
+
+# Detail of a full table scan in a sqlite query plan, scans of an index are not matched
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+class Explain(Executable, ClauseElement):
+    """ EXPLAIN of a statement, the query plan of sqlite"""
+
+    def __init__(self, statement):
+        self.statement = statement.statement if isinstance(statement, Query) else statement
+
+
+def _process(element, compiler, **kwargs):
+    """Function to compile the statement explained, as a part of the plan"""
+    sql = compiler.process(element.statement, **kwargs)
+    # The rows are the ones of the plan, not the ones of the statement explained,
+    # which is not executed, so it is not an update either
+    compiler._result_columns = []  # pylint: disable=protected-access
+    compiler.isinsert = compiler.isupdate = compiler.isdelete = False
+    return sql
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kwargs):
+    """Function to compile the query plan of a statement for sqlite"""
+    return "EXPLAIN QUERY PLAN " + _process(element, compiler, **kwargs)
+
+
+@compiles(Explain, "mysql")
+def _compile_mysql_explain(element, compiler, **kwargs):
+    """Function to compile the query plan of a statement for MySQL"""
+    return "EXPLAIN " + _process(element, compiler, **kwargs)
+
+
+def explain(session, statement):
+    """
+    Function to get the query plan of a statement
+
+    Parameters
+    ----------
+    session : Session
+        Session used to query the database.
+    statement : Query or Executable
+        Statement to explain, it is not executed.
+
+    Returns
+    -------
+    list
+        Rows of the plan, as dictionaries.
+    """
+    return [dict(row) for row in session.execute(Explain(statement))]
+
+
+def full_scans(session, statement):
+    """
+    Function to get the tables a statement reads with a full table scan
+
+    Parameters
+    ----------
+    session : Session
+        Session used to query the database.
+    statement : Query or Executable
+        Statement to explain, it is not executed.
+
+    Returns
+    -------
+    list
+        Names of the tables scanned.
+    """
+    tables = []
+    for row in explain(session, statement):
+        if "detail" in row:
+            match = _SQLITE_SCAN.match(row["detail"])
+            if match:
+                tables.append(match.group(1))
+        elif row.get("type") == "ALL":
+            tables.append(row["table"])
+    return tables
+
+
+def check_plans(bind=None):
+    """
+    Function to check that no query of the catalogue reads a table with a full table scan
+
+    Parameters
+    ----------
+    bind : Engine
+        Engine of the seeded database, defaults to the one of the session factory.
+
+    Returns
+    -------
+    dict
+        Tables scanned, by name of the queries which regressed.
+    """
+    regressions = {}
+    with session_scope(bind) as session:
+        for name, build in CATALOGUE.items():
+            tables = full_scans(session, build())
+            if tables:
+                regressions[name] = tables
+                LOGGER.error("%s scans %s", name, ", ".join(tables))
+    return regressions
+
+
+def main(argv=None):
+    """
+    Function to check the plans of the hot queries on a clone of a dataset snapshot
+
+    Parameters
+    ----------
+    argv : list
+        Command line arguments, defaults to the ones of the process.
+
+    Returns
+    -------
+    int
+        Exit status, 1 if a query reads a table with a full table scan.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("preset", nargs="?", default="small", choices=list(PRESETS))
+    args = parser.parse_args(argv)
+
+    engine = use_snapshot(args.preset)
+    try:
+        return 1 if check_plans(engine) else 0
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+""" Module for the incrementally maintained department impact summary
+
+This script keeps the department_impact table, which counts the loans and the
+active loans of the books of every department by the department and type of
+the borrowers. The issue and return functions add to the counts in their own
+transactions, so reading the impact of a department reads at most one row per
+pair of departments instead of joining the whole borrowing history. The counts
+can be rebuilt from the history for repair, it contains the following functions
+
+    * borrower_departments_query
+    * item_departments_query
+    * returning_departments_query
+    * loan_rows
+    * return_rows
+    * record_loans
+    * record_returns
+    * rebuild_impact_summary
+    * impact_figures
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+from collections import Counter, namedtuple
+import logging
+
+# External Imports
+from sqlalchemy import case, func, literal, union_all
+from sqlalchemy.orm import Query
+
+# User Import
+from library.orm.models import Books, BookItem, Department, DepartmentImpact, BORROWER_MODELS
+from library.orm.cache import lookup_many
+from library.orm.upsert import upsert
+from library.connections.transactions import operation, session_scope
+
+
+__author__ = 'praveen@gyandata.com'
+
+LOGGER = logging.getLogger(__name__)
+
+# Counts of the loans of the books of a department by the borrowers of another department
+ImpactFigure = namedtuple("ImpactFigure", ["borrower_dept_id", "borrower_dept_name", "borrower_type",
+                                           "loan_count", "active_loan_count"])
+
+# Counter columns of the summary, added to instead of overwritten by the upserts
+COUNT_COLUMNS = ("loan_count", "active_loan_count")
+
+
+def borrower_departments_query(borrower_type, borrower_ids):
+    """
+    Function to build the query of the department of every borrower
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor.
+    borrower_ids : iterable
+        Ids of the borrowers.
+
+    Returns
+    -------
+    Query
+        Query of (borrower id, department id) rows, not bound to any session.
+    """
+    models = BORROWER_MODELS[borrower_type]
+    return Query([models["key"], models["borrower"].dept_id]).\
+        filter(models["key"].in_(borrower_ids))
+
+
+def item_departments_query(bar_codes):
+    """
+    Function to build the query of the department of the book of every book item
+
+    Parameters
+    ----------
+    bar_codes : iterable
+        Bar codes of the book items.
+
+    Returns
+    -------
+    Query
+        Query of (bar code, department id) rows, not bound to any session.
+    """
+    return Query([BookItem.bar_code, Books.dept_id]).\
+        join(Books, BookItem.isbn_id == Books.isbn_id).\
+        filter(BookItem.bar_code.in_(bar_codes))
+
+
+def returning_departments_query(borrower_type, bar_codes):
+    """
+    Function to build the query of the open loans of book items, counted by departments
+
+    It has to be run before the borrows are closed.
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor.
+    bar_codes : iterable
+        Bar codes of the book items being returned.
+
+    Returns
+    -------
+    Query
+        Query of (book department id, borrower department id, count) rows,
+        not bound to any session.
+    """
+    models = BORROWER_MODELS[borrower_type]
+    borrow, activity, borrower = models["borrow"], models["activity"], models["borrower"]
+    return Query([Books.dept_id, borrower.dept_id, func.count()]).\
+        select_from(borrow).\
+        join(activity, getattr(borrow, models["trans_key"]) == activity.trans_id).\
+        join(borrower, getattr(activity, models["activity_key"]) == models["key"]).\
+        join(BookItem, borrow.book_bar_code_id == BookItem.bar_code).\
+        join(Books, BookItem.isbn_id == Books.isbn_id).\
+        filter(borrow.book_bar_code_id.in_(bar_codes)).\
+        filter(borrow.return_date.is_(None)).\
+        group_by(Books.dept_id, borrower.dept_id)
+
+
+def loan_rows(borrower_type, loans, borrower_departments, item_departments):
+    """
+    Function to count new loans into summary rows
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor.
+    loans : iterable
+        (borrower id, bar codes) of every issue.
+    borrower_departments : dict
+        Department id by borrower id.
+    item_departments : dict
+        Department id of the book by bar code.
+
+    Returns
+    -------
+    list
+        Row dictionaries of the summary, holding the counts to add.
+    """
+    counts = Counter((item_departments[bar_code], borrower_departments[borrower_id])
+                     for borrower_id, bar_codes in loans for bar_code in bar_codes)
+    return [{"book_dept_id": book_dept_id, "borrower_dept_id": borrower_dept_id,
+             "borrower_type": borrower_type, "loan_count": count, "active_loan_count": count}
+            for (book_dept_id, borrower_dept_id), count in counts.items()]
+
+
+def return_rows(borrower_type, counts):
+    """
+    Function to turn the counts of returned loans into summary rows
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor.
+    counts : iterable
+        Rows of the returning departments query.
+
+    Returns
+    -------
+    list
+        Row dictionaries of the summary, holding the counts to add.
+    """
+    return [{"book_dept_id": book_dept_id, "borrower_dept_id": borrower_dept_id,
+             "borrower_type": borrower_type, "loan_count": 0, "active_loan_count": -count}
+            for book_dept_id, borrower_dept_id, count in counts]
+
+
+def record_loans(session, borrower_type, loans):
+    """
+    Function to add new loans to the summary, in the transaction of the issue
+
+    Parameters
+    ----------
+    session : Session
+        Session of the issue.
+    borrower_type : str
+        Type of borrower, student or professor.
+    loans : list
+        (borrower id, bar codes) of every issue.
+    """
+    borrower_ids = {borrower_id for borrower_id, _ in loans}
+    bar_codes = {bar_code for _, bar_codes in loans for bar_code in bar_codes}
+    if not bar_codes:
+        return
+
+    borrower_departments = {key: borrower.dept_id for key, borrower in lookup_many(
+        session, BORROWER_MODELS[borrower_type]["borrower"], borrower_ids).items()}
+    item_departments = dict(item_departments_query(bar_codes).with_session(session))
+    upsert(session, DepartmentImpact.__table__,
+           loan_rows(borrower_type, loans, borrower_departments, item_departments),
+           increment_columns=COUNT_COLUMNS)
+
+
+def record_returns(session, borrower_type, bar_codes):
+    """
+    Function to remove returned loans from the active loans of the summary,
+    in the transaction of the return, before the borrows are closed
+
+    Parameters
+    ----------
+    session : Session
+        Session of the return.
+    borrower_type : str
+        Type of borrower, student or professor.
+    bar_codes : list
+        Bar codes of the book items being returned.
+    """
+    if not bar_codes:
+        return
+
+    counts = returning_departments_query(borrower_type, bar_codes).with_session(session)
+    upsert(session, DepartmentImpact.__table__, return_rows(borrower_type, counts),
+           increment_columns=COUNT_COLUMNS)
+
+
+def _history_query(borrower_type):
+    """Function to build the select of the summary rows of a borrower type from the borrowing history"""
+    models = BORROWER_MODELS[borrower_type]
+    borrow, activity, borrower = models["borrow"], models["activity"], models["borrower"]
+    return Query([Books.dept_id.label("book_dept_id"), borrower.dept_id.label("borrower_dept_id"),
+                  literal(borrower_type).label("borrower_type"), func.count().label("loan_count"),
+                  func.sum(case([(borrow.return_date.is_(None), 1)], else_=0)).
+                  label("active_loan_count")]).\
+        select_from(borrow).\
+        join(activity, getattr(borrow, models["trans_key"]) == activity.trans_id).\
+        join(borrower, getattr(activity, models["activity_key"]) == models["key"]).\
+        join(BookItem, borrow.book_bar_code_id == BookItem.bar_code).\
+        join(Books, BookItem.isbn_id == Books.isbn_id).\
+        group_by(Books.dept_id, borrower.dept_id).statement
+
+
+@operation("rebuild_impact_summary")
+def rebuild_impact_summary():
+    """
+    Function to rebuild the impact summary from the whole borrowing history
+
+    Returns
+    -------
+    int
+        Number of summary rows, None if the rebuild failed, the reason is logged.
+    """
+    table = DepartmentImpact.__table__
+    count = None
+    with session_scope() as session:
+        session.execute(table.delete())
+        session.execute(table.insert().from_select(
+            ["book_dept_id", "borrower_dept_id", "borrower_type", "loan_count", "active_loan_count"],
+            union_all(*[_history_query(borrower_type) for borrower_type in BORROWER_MODELS])))
+        count = session.query(func.count()).select_from(table).scalar()
+        LOGGER.info("Rebuilt the impact summary with %d rows", count)
+    return count
+
+
+@operation("impact_figures")
+def impact_figures(dep):
+    """
+    Function to get the loans of the books of a department by the other departments
+
+    Parameters
+    ----------
+    dep : int
+        Department id.
+
+    Returns
+    -------
+    list
+        ImpactFigure of every borrowing department and type of borrower, None if the
+        query failed, the reason is logged.
+    """
+    figures = None
+    with session_scope(read_only=True) as session:
+        rows = session.query(DepartmentImpact.borrower_dept_id, Department.name,
+                             DepartmentImpact.borrower_type, DepartmentImpact.loan_count,
+                             DepartmentImpact.active_loan_count).\
+            join(Department, DepartmentImpact.borrower_dept_id == Department.dept_id).\
+            filter(DepartmentImpact.book_dept_id == dep).\
+            filter(DepartmentImpact.borrower_dept_id != dep).\
+            filter(DepartmentImpact.loan_count > 0).\
+            order_by(DepartmentImpact.borrower_dept_id, DepartmentImpact.borrower_type)
+        figures = [ImpactFigure(*row) for row in rows]
+    return figures
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+""" Module for finding the overdue borrows and assessing their fines
+
+This script is the nightly overdue engine. For every borrow table it finds the
+open borrows past their due date through the (return_date, due_date) index,
+computes their fines by the rate schedule of configs/fine_config.json in the
+database, and writes them to the fine ledger with one INSERT ... SELECT, so no
+borrow is loaded into python. The fines of the open borrows are replaced every
+night, the fines of returned borrows keep their last assessment, it contains
+the following classes and functions
+
+    * DaysBetween
+    * load_fine_schedule
+    * fine_amount
+    * overdue_query
+    * assess_overdue
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+from datetime import date
+import json
+import logging
+import os
+
+# External Imports
+from sqlalchemy import Integer, and_, case, exists, literal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.functions import FunctionElement
+
+# User Import
+from library.orm.models import FineLedger, BORROWER_MODELS
+from library.connections.transactions import operation, session_scope
+
+
+__author__ = 'praveen@gyandata.com'
+
+LOGGER = logging.getLogger(__name__)
+
+FINE_CONFIG = os.path.join("configs", "fine_config.json")
+
+# Columns of the ledger written by the engine, in the order of the overdue query
+LEDGER_COLUMNS = ["borrower_type", "trans_id", "bar_code", "borrower_id", "due_date",
+                  "days_overdue", "amount", "assessed_on"]
+
+
+class DaysBetween(FunctionElement):
+    """ Number of whole days from the second date to the first one"""
+    name = "days_between"
+    type = Integer()
+
+
+@compiles(DaysBetween)
+def _compile_days_between(element, compiler, **kwargs):
+    """Function to compile the days between two dates for sqlite"""
+    later, earlier = list(element.clauses)
+    return (f"CAST(julianday({compiler.process(later, **kwargs)}) - "
+            f"julianday({compiler.process(earlier, **kwargs)}) AS INTEGER)")
+
+
+@compiles(DaysBetween, "mysql")
+def _compile_mysql_days_between(element, compiler, **kwargs):
+    """Function to compile the days between two dates for MySQL"""
+    later, earlier = list(element.clauses)
+    return f"DATEDIFF({compiler.process(later, **kwargs)}, {compiler.process(earlier, **kwargs)})"
+
+
+def load_fine_schedule(path=FINE_CONFIG):
+    """
+    Function to read the fine rate schedule
+
+    Parameters
+    ----------
+    path : str
+        Path of the schedule, a json object holding the rates and the maximum
+        amount of every borrower type. A rate applies per day overdue after its
+        from_day number of days.
+
+    Returns
+    -------
+    dict
+        Rates sorted by their first day and maximum amount, by borrower type.
+    """
+    with open(path) as file:
+        schedule = json.load(file)
+
+    for borrower_type, fines in schedule.items():
+        assert borrower_type in BORROWER_MODELS, "Borrower type should be student or professor"
+        fines["rates"] = sorted(fines["rates"], key=lambda rate: rate["from_day"])
+    return schedule
+
+
+def fine_amount(days, fines):
+    """
+    Function to build the fine of a number of days overdue, by a rate schedule
+
+    Parameters
+    ----------
+    days : ColumnElement
+        Number of days overdue.
+    fines : dict
+        Rates and maximum amount of a borrower type.
+
+    Returns
+    -------
+    ColumnElement
+        Fine, the days of every rate charged at that rate, capped at the maximum amount.
+    """
+    rates = fines["rates"]
+    amount = literal(0.0)
+    for rate, following in zip(rates, rates[1:] + [None]):
+        start = rate["from_day"]
+        whens = [(days <= start, 0)]
+        if following:
+            whens.append((days >= following["from_day"], following["from_day"] - start))
+        amount = amount + case(whens, else_=days - start) * rate["per_day"]
+
+    if fines.get("max_amount") is None:
+        return amount
+    return case([(amount > fines["max_amount"], fines["max_amount"])], else_=amount)
+
+
+def overdue_query(borrower_type, today):
+    """
+    Function to build the query of the open borrows past their due date
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor.
+    today : date
+        Date the borrows are overdue on.
+
+    Returns
+    -------
+    Query
+        Query of (transaction id, bar code, borrower id, due date, days overdue) rows,
+        not bound to any session.
+    """
+    models = BORROWER_MODELS[borrower_type]
+    borrow, activity = models["borrow"], models["activity"]
+    trans_id = getattr(borrow, models["trans_key"])
+    return Query([trans_id.label("trans_id"),
+                  borrow.book_bar_code_id.label("bar_code"),
+                  getattr(activity, models["activity_key"]).label("borrower_id"),
+                  borrow.due_date.label("due_date"),
+                  DaysBetween(literal(today), borrow.due_date).label("days_overdue")]).\
+        join(activity, trans_id == activity.trans_id).\
+        filter(borrow.return_date.is_(None)).\
+        filter(borrow.due_date < today)
+
+
+def _assess(borrower_type, fines, today):
+    """Function to replace the fines of the open borrows of a borrower type, in one transaction"""
+    models = BORROWER_MODELS[borrower_type]
+    borrow = models["borrow"]
+    ledger = FineLedger.__table__
+
+    overdue = overdue_query(borrower_type, today).subquery()
+    assessed = Query([literal(borrower_type), overdue.c.trans_id, overdue.c.bar_code,
+                      overdue.c.borrower_id, overdue.c.due_date, overdue.c.days_overdue,
+                      fine_amount(overdue.c.days_overdue, fines), literal(today)])
+
+    with session_scope() as session:
+        # Removing the previous assessment of the borrows which are still open
+        session.execute(ledger.delete().where(and_(
+            ledger.c.borrower_type == borrower_type,
+            exists().where(and_(getattr(borrow, models["trans_key"]) == ledger.c.trans_id,
+                                borrow.book_bar_code_id == ledger.c.bar_code,
+                                borrow.return_date.is_(None))))))
+        result = session.execute(ledger.insert().from_select(LEDGER_COLUMNS, assessed.statement))
+        return result.rowcount
+
+
+@operation("assess_overdue")
+def assess_overdue(today=None, schedule=None):
+    """
+    Function to assess the fines of all the open overdue borrows, in one pass per borrow table
+
+    Parameters
+    ----------
+    today : date
+        Date of the assessment, defaults to today.
+    schedule : dict
+        Fine rate schedule, defaults to the one of configs/fine_config.json.
+
+    Returns
+    -------
+    dict
+        Number of overdue borrows, by borrower type.
+    """
+    today = today or date.today()
+    schedule = schedule or load_fine_schedule()
+
+    counts = {}
+    for borrower_type in BORROWER_MODELS:
+        counts[borrower_type] = _assess(borrower_type, schedule[borrower_type], today)
+        LOGGER.info("Assessed the fines of %d overdue %s borrows", counts[borrower_type],
+                    borrower_type)
+    return counts
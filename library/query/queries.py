@@ -3,15 +3,23 @@
 
 This script contains all the code details required to perform the
 orm_queries based SQL operations, and do some transactions on the
-library database, it contains the following functions
+library database. The functions return their results and log their details,
+nothing is printed, it contains the following functions
 
     * log
     * student_issue
     * professor_issue
+    * batch_issue
     * professor_returning
     * student_returning
+    * open_borrows_query
+    * batch_return
+    * impact_query
     * impact
+    * title_status_query
+    * collect_titles
     * check_status
+    * bulk_status
     * test
     * main
 
@@ -28,38 +36,85 @@ environment you are running this script in.
 """
 
 # Standard import
+from collections import namedtuple
 from datetime import date
 import logging
 from contextlib import contextmanager
+import time
+
+# External Imports
+from sqlalchemy import and_, func, tuple_
+from sqlalchemy.orm import Query
 
 # User Import
 from library.orm.models import Staffs, Department, \
     Students, Professors, Books, BookItem, BookStatus, StudentActivity, \
-    ProfessorActivity, StudentBorrow, ProfessorBorrow, BASE
-from library.connections.get_connection import ENGINE, SESSION_FACTORY
+    ProfessorActivity, StudentBorrow, ProfessorBorrow, BASE, BORROWER_MODELS
+from library.connections.get_connection import get_engine
+from library.connections.transactions import operation, session_scope
+from library.orm.bakery import bake, in_list
+from library.orm.cache import lookup, lookup_many
+from library.query.availability import refresh_counters
+from library.query import status_cache
+from library.query.impact_summary import record_loans, record_returns
 
 
 __author__ = 'praveen@gyandata.com'
 
 LOGGER = logging.getLogger(__name__)
 
+# A checkout request of a batch, borrower type is either student or professor
+IssueRequest = namedtuple("IssueRequest", ["borrower_type", "borrower_id", "staff_id", "bar_codes"])
+
+# Outcome of a checkout request, trans_id is None and error is set if it failed
+IssueResult = namedtuple("IssueResult", ["request", "success", "trans_id", "error"])
+
+# A book item being returned, with whether it was lost or tampered
+ReturnRequest = namedtuple("ReturnRequest", ["bar_code", "lost", "tampered"], defaults=(False, False))
+
+# Outcome of a return, fine is True if the borrower has to pay a fine
+ReturnResult = namedtuple("ReturnResult",
+                          ["request", "success", "borrower_type", "trans_id", "fine", "error"])
+
+# Status of a book item, due date is set only for unavailable book items
+ItemStatus = namedtuple("ItemStatus", ["bar_code", "status", "due_date"])
+
+# Status of all the book items of a book
+TitleStatus = namedtuple("TitleStatus", ["isbn_id", "name", "items"])
+
 
 @contextmanager
-def query_session_scope():
+def query_session_scope(read_only=False):
     """Provide a transactional scope around a series of operations."""
-    session = SESSION_FACTORY()
-    try:
+    with session_scope(read_only=read_only) as session:
         yield session
-        session.commit()
-    except AssertionError as err:
-        LOGGER.error(err)
-    except AttributeError as err:
-        session.rollback()
-        LOGGER.error(err)
-    finally:
-        session.close()
 
 
+def _book_items(session, bar_codes, *columns):
+    """
+    Function to get book items, or columns of them, by bar code with a baked query
+
+    Parameters
+    ----------
+    session : Session
+        Session used to query the database.
+    bar_codes : iterable
+        Bar codes of the book items.
+    columns : tuple
+        Columns of the rows, defaults to the book item objects.
+
+    Returns
+    -------
+    Result
+        Book items or rows of the columns, found in any order.
+    """
+    columns = columns or (BookItem,)
+    query = bake(lambda session: session.query(*columns).
+                 filter(BookItem.bar_code.in_(in_list("bar_codes"))), *columns)
+    return query(session).params(bar_codes=list(bar_codes))
+
+
+@operation("student_issue")
 def student_issue(staff, s_id, b_id):
     """
     Function to issues books to student
@@ -73,63 +128,60 @@ def student_issue(staff, s_id, b_id):
         Students id.
     b_id : list
         list of book-item bar codes being borrowed
-    """
-
-    print("\nIssuing\n")
 
+    Returns
+    -------
+    IssueResult
+        Outcome of the issue, None if it failed, the reason is logged.
+    """
     with query_session_scope() as session:
         # Asserting the parameters
         assert issubclass(type(staff), int), "Staff ID should be integer"
         assert isinstance(s_id, int), "Student ID should be integer"
         assert isinstance(b_id, list), "Books should be a list"
 
-        # Getting Student object
-        student = session.query(Students).filter_by(reg_id=s_id).first()
+        # Getting Student, from the cache of reference rows
+        student = lookup(session, Students, s_id)
 
         if not student:
             # If student id is not in database, then raises attribute error
             raise AttributeError("Student not in DB")
 
-        # Getting staff object
-        staff = session.query(Staffs).filter_by(staff_id=staff).first()
-
-        if not staff:
+        # Getting staff
+        if not lookup(session, Staffs, staff):
             # If staff id is not in database, raise attribute error
             raise AttributeError("Staff not in DB")
 
         # Getting all book-item objects
-        book_list = session.query(BookItem). \
-            filter(BookItem.bar_code.in_(b_id)).all()
+        book_list = _book_items(session, b_id).all()
 
         if (not book_list) or (len(b_id) != len(book_list)):
             # If books not in database, then raise attribute error
             raise AttributeError("Book item not in DB")
 
-        for book_item in book_list:
-            if book_item.status != BookStatus.AVAILABLE:
-                # If book is not available then raise attribute error
-                raise AttributeError("Book item not Available")
-            # If all books are available, then their status are changed
-            book_item.status = BookStatus.UNAVAILABLE
+        if _mark_issued(session, b_id) != len(book_list):
+            # If a book is not available then raise attribute error,
+            # which rolls back the status of the other books
+            raise AttributeError("Book item not Available")
 
         # Creating a student activity object to enter transaction details
         student_activity = StudentActivity(doi=date.today(),
-                                           student=student,
-                                           staff=staff)
+                                           student_id=s_id,
+                                           staff_id=staff)
         session.add(student_activity)
 
         # Adding all the book items to student activity
         student_activity.book_items = book_list
         session.flush()
+        record_loans(session, "student", [(s_id, b_id)])
 
-        # Printing all details
-        print(f"Student: {student.name}\n")
-        print(f"Student_ Activity Id: {student_activity.trans_id}\n")
-        print(f"Date Of Issue: {student_activity.doi}\n")
-        for book_item in book_list:
-            print("Name of book: ", book_item.book.name)
+        # Logging all details
+        _log_issue("student", student.name, student_activity, book_list, staff)
+        return IssueResult(IssueRequest("student", s_id, staff, b_id), True,
+                           student_activity.trans_id, None)
 
 
+@operation("professor_issue")
 def professor_issue(staff, p_id, b_id):
     """
     Function to issues books to professor
@@ -142,125 +194,498 @@ def professor_issue(staff, p_id, b_id):
         Professor id.
     b_id : list
         list of book-item bar codes being borrowed
-    """
-
-    print("\nIssuing\n")
 
+    Returns
+    -------
+    IssueResult
+        Outcome of the issue, None if it failed, the reason is logged.
+    """
     with query_session_scope() as session:
         # Asserting the parameters
         assert isinstance(staff, int), "Staff ID should be integer"
         assert isinstance(p_id, int), "Professor ID should be integer"
         assert isinstance(b_id, list), "Books should be a list"
 
-        # Getting Professor object
-        professor = session.query(Professors).\
-            filter_by(employee_code=p_id).first()
+        # Getting Professor, from the cache of reference rows
+        professor = lookup(session, Professors, p_id)
 
         if not professor:
             # If Professor id is not in database, then raises attribute error
             raise AttributeError("Professor not in DB")
 
-        staff = session.query(Staffs).filter_by(staff_id=staff).first()
-        if not staff:
+        if not lookup(session, Staffs, staff):
             # If staff id is not in database, raise attribute error
             raise AttributeError("Staff not in DB")
 
         # Getting all book-item objects
-        book_list = session.query(BookItem).\
-            filter(BookItem.bar_code.in_(b_id)).all()
+        book_list = _book_items(session, b_id).all()
 
         if (not book_list) or (len(b_id) != len(book_list)):
             # If books not in database, then raise attribute error
             raise AttributeError("Book item not in DB")
 
-        for book_item in book_list:
-            if book_item.status != BookStatus.AVAILABLE:
-                # If book is not available then raise attribute error
-                raise AttributeError("Book item not Available")
-            # If all books are available, then their status are changed
-            book_item.status = BookStatus.UNAVAILABLE
+        if _mark_issued(session, b_id) != len(book_list):
+            # If a book is not available then raise attribute error,
+            # which rolls back the status of the other books
+            raise AttributeError("Book item not Available")
 
         # Creating a professor activity object to enter transaction details
         professor_activity = ProfessorActivity(doi=date.today(),
-                                               professor=professor,
-                                               staff=staff)
+                                               professor_id=p_id,
+                                               staff_id=staff)
         session.add(professor_activity)
 
         # Adding all the book items to student activity
         professor_activity.book_items = book_list
         session.flush()
+        record_loans(session, "professor", [(p_id, b_id)])
 
-        # Printing all details
-        print(f"Professor: {professor.name}\n")
-        print(f"Professor_ Activity Id: {professor_activity.trans_id}\n")
-        print(f"Date Of Issue: {professor_activity.doi}\n")
-        for book_item in book_list:
-            print("Name of book: ", book_item.book.name)
+        # Logging all details
+        _log_issue("professor", professor.name, professor_activity, book_list, staff)
+        return IssueResult(IssueRequest("professor", p_id, staff, b_id), True,
+                           professor_activity.trans_id, None)
 
 
-def student_returning(b_id, lost=False, tampered=False):
+def _log_issue(borrower_type, borrower_name, activity, book_list, staff):
     """
-    Function to return books from student.
+    Function to log the details of an issue, the book names only at debug level
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor.
+    borrower_name : str
+        Name of the borrower.
+    activity : StudentActivity or ProfessorActivity
+        Activity of the issue.
+    book_list : list
+        Issued book items.
+    staff : int
+        Staff id who handled the issue.
+    """
+    details = {"borrower_type": borrower_type, "trans_id": activity.trans_id,
+               "doi": activity.doi, "staff_id": staff,
+               "bar_codes": [book_item.bar_code for book_item in book_list]}
+    LOGGER.info("Issued %d book items to %s %s, activity %d on %s", len(book_list),
+                borrower_type, borrower_name, activity.trans_id, activity.doi, extra=details)
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        # Loading the books only if their names are logged
+        LOGGER.debug("Books issued in activity %d: %s", activity.trans_id,
+                     ", ".join(book_item.book.name for book_item in book_list), extra=details)
+
+
+def _mark_issued(session, bar_codes):
+    """
+    Function to change the status of the available book items to unavailable, atomically
+
+    The status is checked by the update itself, so two transactions issuing the
+    same book item can not both succeed. The counters of their books are recounted.
+
+    Parameters
+    ----------
+    session : Session
+        Session used to update the database.
+    bar_codes : iterable
+        Bar codes of the book items being issued.
+
+    Returns
+    -------
+    int
+        Number of book items issued, less than the number of bar codes if some
+        of them were not available.
+    """
+    issued = session.query(BookItem).\
+        filter(BookItem.bar_code.in_(bar_codes)).\
+        filter(BookItem.status == BookStatus.AVAILABLE).\
+        update({BookItem.status: BookStatus.UNAVAILABLE,
+                BookItem.version: BookItem.version + 1}, synchronize_session=False)
+    refresh_counters(session, bar_codes)
+    status_cache.mark_changed(session, bar_codes)
+    return issued
+
+
+def _issue_error(request, borrowers, staffs, items, claimed):
+    """
+    Function to validate a checkout request against the resolved rows
+
+    Parameters
+    ----------
+    request : IssueRequest
+        Checkout request.
+    borrowers : dict
+        Set of existing borrower ids for every borrower type.
+    staffs : set
+        Existing staff ids.
+    items : dict
+        Status of the existing book items, by bar code.
+    claimed : set
+        Bar codes issued by the earlier requests of the batch.
+
+    Returns
+    -------
+    str
+        Reason the request can not be issued, None if it can.
+    """
+    if request.borrower_type not in BORROWER_MODELS:
+        return "Borrower type should be student or professor"
+    if not isinstance(request.bar_codes, list) or not request.bar_codes:
+        return "Books should be a non empty list"
+    if len(set(request.bar_codes)) != len(request.bar_codes):
+        return "Book item repeated in request"
+    if request.borrower_id not in borrowers[request.borrower_type]:
+        return f"{request.borrower_type.capitalize()} not in DB"
+    if request.staff_id not in staffs:
+        return "Staff not in DB"
+    if any(bar_code not in items for bar_code in request.bar_codes):
+        return "Book item not in DB"
+    if any(items[bar_code] != BookStatus.AVAILABLE or bar_code in claimed
+           for bar_code in request.bar_codes):
+        return "Book item not Available"
+    return None
+
+
+@operation("batch_issue")
+def batch_issue(requests):
+    """
+    Function to issue the books of many checkout requests in one transaction
+
+    The borrowers, staffs and book items of all the requests are resolved with
+    one query each, the activities are flushed together, numbered by the database,
+    and the borrows are written with a bulk insert.
+    A request that can not be issued is reported as failed without affecting
+    the other requests of the batch.
 
     Parameters
     ----------
+    requests : list
+        IssueRequest or (borrower type, borrower id, staff id, bar codes) tuples.
+
+    Returns
+    -------
+    list
+        IssueResult of every request, in the order of the requests, None if the
+        batch failed, the reason is logged.
+    """
+    results = []
+
+    with query_session_scope() as session:
+        # Asserting the parameters
+        assert isinstance(requests, list), "Requests should be a list"
+        requests = [IssueRequest(*request) for request in requests]
+
+        # Getting the existing borrowers and staffs of all requests, from the cache of
+        # reference rows, and their book items
+        borrowers = {}
+        for borrower_type, models in BORROWER_MODELS.items():
+            ids = {request.borrower_id for request in requests
+                   if request.borrower_type == borrower_type}
+            borrowers[borrower_type] = set(lookup_many(session, models["borrower"], ids))
+
+        staffs = set(lookup_many(session, Staffs, {request.staff_id for request in requests}))
+
+        bar_codes = {bar_code for request in requests if isinstance(request.bar_codes, list)
+                     for bar_code in request.bar_codes}
+        items = dict(_book_items(session, bar_codes, BookItem.bar_code, BookItem.status)) \
+            if bar_codes else {}
+
+        # Validating the requests in order, an item goes to the first request asking for it
+        claimed = set()
+        accepted = []
+        for request in requests:
+            error = _issue_error(request, borrowers, staffs, items, claimed)
+            results.append(IssueResult(request, error is None, None, error))
+            if error is None:
+                claimed.update(request.bar_codes)
+                accepted.append(len(results) - 1)
+
+        if not accepted:
+            return results
+
+        # Changing the status of all issued book items in one atomic statement, in a
+        # savepoint so that a failed attempt leaves the rest of the transaction, such
+        # as the earlier operations of a unit of work, untouched
+        savepoint = session.begin_nested()
+        if _mark_issued(session, claimed) == len(claimed):
+            savepoint.commit()
+        else:
+            # A concurrent issue took some of the book items after they were read,
+            # so the requests are issued one by one with their book items locked
+            savepoint.rollback()
+            for position in list(accepted):
+                request = results[position].request
+                statuses = dict(session.query(BookItem.bar_code, BookItem.status).
+                                filter(BookItem.bar_code.in_(request.bar_codes)).with_for_update())
+                if any(statuses.get(bar_code) != BookStatus.AVAILABLE
+                       for bar_code in request.bar_codes):
+                    results[position] = results[position]._replace(
+                        success=False, error="Book item not Available")
+                    accepted.remove(position)
+                else:
+                    _mark_issued(session, request.bar_codes)
+
+            if not accepted:
+                return results
+
+        for borrower_type, models in BORROWER_MODELS.items():
+            positions = [position for position in accepted
+                         if results[position].request.borrower_type == borrower_type]
+            if not positions:
+                continue
+
+            # Adding the activities together, numbered by the database when they are flushed
+            activities = []
+            for position in positions:
+                request = results[position].request
+                activities.append(models["activity"](doi=date.today(), staff_id=request.staff_id,
+                                                     **{models["activity_key"]: request.borrower_id}))
+            session.add_all(activities)
+            session.flush()
+
+            borrows = []
+            for position, activity in zip(positions, activities):
+                request = results[position].request
+                borrows.extend({models["trans_key"]: activity.trans_id, "book_bar_code_id": bar_code}
+                               for bar_code in request.bar_codes)
+                results[position] = results[position]._replace(trans_id=activity.trans_id)
+
+            session.execute(models["borrow"].__table__.insert(), borrows)
+            record_loans(session, borrower_type,
+                         [(results[position].request.borrower_id, results[position].request.bar_codes)
+                          for position in positions])
+
+        LOGGER.info("Issued %d of %d checkout requests", len(accepted), len(requests))
+
+        # Returning inside the scope, so that nothing is reported if the transaction failed
+        return results
+
+
+def open_borrows_query(borrower_type, bar_codes):
+    """
+    Function to build the query of the latest open borrow of every book item
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor.
+    bar_codes : iterable
+        Bar codes of the book items.
+
+    Returns
+    -------
+    Query
+        Query of (bar code, transaction id) rows, not bound to any session.
+    """
+    models = BORROWER_MODELS[borrower_type]
+    borrow = models["borrow"]
+    trans_id = getattr(borrow, models["trans_key"])
+    return Query([borrow.book_bar_code_id, func.max(trans_id)]).\
+        filter(borrow.book_bar_code_id.in_(bar_codes)).\
+        filter(borrow.return_date.is_(None)).\
+        group_by(borrow.book_bar_code_id)
+
+
+def _open_borrows(session, borrower_type, bar_codes):
+    """
+    Function to get the latest open borrow of every book item, in one baked query
+
+    Parameters
+    ----------
+    session : Session
+        Session used to query the database.
+    borrower_type : str
+        Type of borrower, student or professor.
+    bar_codes : iterable
+        Bar codes of the book items.
+
+    Returns
+    -------
+    dict
+        Transaction id of the open borrow, by bar code.
+    """
+    query = bake(lambda session: open_borrows_query(borrower_type, in_list("bar_codes")).
+                 with_session(session), borrower_type)
+    return dict(query(session).params(bar_codes=list(bar_codes)))
+
+
+def _update_returned(session, returns, items):
+    """
+    Function to update the returned book items whose version is still the one read,
+    with one bulk update per kind of return
+
+    Parameters
+    ----------
+    session : Session
+        Session used to update the database.
+    returns : list
+        ReturnRequest of every returned book item.
+    items : dict
+        Tampered state and version of the book items, read before the return, by bar code.
+
+    Returns
+    -------
+    int
+        Number of book items updated.
+    """
+    # Lost book items are changed to lost and the others to available,
+    # tampered book items are also marked as tampered
+    updated = 0
+    for lost in (True, False):
+        for tampered in (True, False):
+            group = [(request.bar_code, items[request.bar_code][1]) for request in returns
+                     if request.lost == lost and request.tampered == tampered]
+            if not group:
+                continue
+            values = {BookItem.status: BookStatus.LOST if lost else BookStatus.AVAILABLE,
+                      BookItem.version: BookItem.version + 1}
+            if tampered:
+                values[BookItem.tampered] = True
+            updated += session.query(BookItem).\
+                filter(tuple_(BookItem.bar_code, BookItem.version).in_(group)).\
+                update(values, synchronize_session=False)
+    return updated
+
+
+def _return_items(session, borrower_type, returns, items):
+    """
+    Function to close the open borrows of book items and update the items, with bulk updates
+
+    The book items are updated only if their version is still the one read,
+    so a concurrent change of a book item fails its return instead of being
+    overwritten, the other book items are still returned.
+
+    Parameters
+    ----------
+    session : Session
+        Session used to update the database.
+    borrower_type : str
+        Type of borrower, student or professor.
+    returns : list
+        ReturnRequest of every returned book item.
+    items : dict
+        Tampered state and version of the book items, read before the return, by bar code.
+
+    Returns
+    -------
+    tuple
+        Bar codes of the book items for which a fine has to be paid, and bar codes
+        of the book items changed by a concurrent transaction, which were not returned.
+    """
+    savepoint = session.begin_nested()
+    if _update_returned(session, returns, items) == len(returns):
+        savepoint.commit()
+        changed = set()
+    else:
+        # A concurrent transaction changed some of the book items after they were read,
+        # so only the book items still at the version read are returned, locked
+        savepoint.rollback()
+        versions = dict(session.query(BookItem.bar_code, BookItem.version).
+                        filter(BookItem.bar_code.in_([request.bar_code for request in returns])).
+                        with_for_update())
+        changed = {request.bar_code for request in returns
+                   if versions.get(request.bar_code) != items[request.bar_code][1]}
+        returns = [request for request in returns if request.bar_code not in changed]
+        _update_returned(session, returns, items)
+        if not returns:
+            return set(), changed
+
+    borrow = BORROWER_MODELS[borrower_type]["borrow"]
+    bar_codes = [request.bar_code for request in returns]
+
+    # Taking the open loans off the impact summary, while they can still be found
+    record_returns(session, borrower_type, bar_codes)
+
+    # Assigning the return date of all the open borrows to today
+    session.query(borrow).\
+        filter(borrow.book_bar_code_id.in_(bar_codes)).\
+        filter(borrow.return_date.is_(None)).\
+        update({borrow.return_date: date.today()}, synchronize_session=False)
+
+    refresh_counters(session, bar_codes)
+    status_cache.mark_changed(session, bar_codes)
+
+    # Fine has to be paid for book items tampered for the first time, and by students
+    # for lost book items, professors are not fined for losing a book item
+    fined = {request.bar_code for request in returns
+             if (request.lost and borrower_type == "student")
+             or (request.tampered and not items[request.bar_code][0])}
+    return fined, changed
+
+
+def _returning(borrower_type, b_id, lost, tampered):
+    """
+    Function to return books from a borrower, used by student_returning and professor_returning
 
+    Parameters
+    ----------
+
+    borrower_type : str
+        Type of borrower, student or professor.
     b_id : list
         list of book-item bar codes being returned.
     lost : bool
-        True if the students has lost the book.
+        True if the borrower has lost the book.
     tampered : bool
         True if the book was tampered while returning.
 
+    Returns
+    -------
+    list
+        ReturnResult of every book item returned, None if the return failed, the reason is logged.
     """
-    print("\nReturning\n")
-
     with query_session_scope() as session:
         # Asserting the parameters
         assert isinstance(b_id, list), "Books should be a list"
         assert isinstance(lost, bool), "Lost has to be boolean"
         assert isinstance(tampered, bool), "Tampered has to be boolean"
 
-        # Getting list of book objects
-        book_list = session.query(BookItem).\
-            filter(BookItem.bar_code.in_(b_id)).all()
-        if (not book_list) or (len(b_id) != len(book_list)):
+        # Getting the tampered state and version of all the book items
+        items = {row[0]: row[1:] for row in
+                 _book_items(session, b_id, BookItem.bar_code, BookItem.tampered, BookItem.version)}
+        if (not items) or (len(set(b_id)) != len(items)):
             # If books not in database, then raise attribute error
             raise AttributeError("Book item not in DB")
 
-        for i in range(len(book_list)):
-            # Getting list of student borrow where the given book item occurred
-            student_borrow = session.query(StudentBorrow).\
-                filter(StudentBorrow.book_item == book_list[i]). \
-                order_by(StudentBorrow.student_trans_id.desc()).first()
-            if not student_borrow:
-                # If book did not occur in any previous transaction,
-                # then raise an attribute error
-                raise AttributeError("Book Not Found in Any Borrowed Transaction")
-            if lost:
-                # If book is lost then, status is changed to lost and
-                # student has to pay fine
-                book_list[i].status = BookStatus.LOST
-                print("\npay Fine\n")
-            else:
-                # If book is not lost, then status is changed to available
-                book_list[i].status = BookStatus.AVAILABLE
+        open_borrows = _open_borrows(session, borrower_type, b_id)
+        if len(open_borrows) != len(items):
+            # If a book is not in any open borrow, then raise an attribute error
+            raise AttributeError("Book Not Found in Any Borrowed Transaction")
 
-            if tampered:
-                # If book is tampered
-                if not book_list[i].tampered:
-                    # if the book item was not tampered previously,
-                    # then the tampered is changed to true
-                    print("\npay Fine\n")
-                    book_list[i].tampered = True
-
-            # Assigning the return date to today
-            student_borrow.return_date = date.today()
-            session.flush()
+        requests = [ReturnRequest(bar_code, lost, tampered) for bar_code in items]
+        fined, changed = _return_items(session, borrower_type, requests, items)
+        if changed:
+            # If a book item was changed since it was read, then raise an attribute error
+            raise AttributeError("Book item changed by a concurrent transaction")
+        for bar_code in fined:
+            LOGGER.info("Fine to be paid for book item %d", bar_code,
+                        extra={"borrower_type": borrower_type, "bar_code": bar_code,
+                               "trans_id": open_borrows[bar_code]})
+
+        LOGGER.info("Returned %d book items of %s borrows", len(items), borrower_type,
+                    extra={"borrower_type": borrower_type, "bar_codes": list(items)})
+        return [ReturnResult(request, True, borrower_type, open_borrows[request.bar_code],
+                             request.bar_code in fined, None) for request in requests]
+
+
+@operation("student_returning")
+def student_returning(b_id, lost=False, tampered=False):
+    """
+    Function to return books from student.
+
+    Parameters
+    ----------
+
+    b_id : list
+        list of book-item bar codes being returned.
+    lost : bool
+        True if the students has lost the book.
+    tampered : bool
+        True if the book was tampered while returning.
 
-            print("Books are returned")
+    """
+    return _returning("student", b_id, lost, tampered)
 
 
+@operation("professor_returning")
 def professor_returning(b_id, lost=False, tampered=False):
     """
     Function to return books from professor.
@@ -276,52 +701,115 @@ def professor_returning(b_id, lost=False, tampered=False):
         True if the book was tampered while returning.
 
     """
-    print("\nReturning\n")
+    return _returning("professor", b_id, lost, tampered)
+
+
+@operation("batch_return")
+def batch_return(returns):
+    """
+    Function to return many book items, of students and professors, in one transaction
+
+    The open borrows of all the book items are found with one query per borrow
+    table and closed with bulk updates. A book item that can not be returned is
+    reported as failed without affecting the other book items.
+
+    Parameters
+    ----------
+    returns : list
+        ReturnRequest or (bar code, lost, tampered) tuples.
+
+    Returns
+    -------
+    list
+        ReturnResult of every book item, in the order of the requests, None if the
+        batch failed, the reason is logged.
+    """
+    results = []
 
     with query_session_scope() as session:
         # Asserting the parameters
-        assert isinstance(b_id, list), "Books should be a list"
-        assert isinstance(lost, bool), "Lost has to be boolean"
-        assert isinstance(tampered, bool), "Tampered has to be boolean"
+        assert isinstance(returns, list), "Returns should be a list"
+        returns = [ReturnRequest(*request) for request in returns]
+
+        bar_codes = {request.bar_code for request in returns}
+        items = {row[0]: row[1:] for row in
+                 _book_items(session, bar_codes,
+                             BookItem.bar_code, BookItem.tampered, BookItem.version)} \
+            if bar_codes else {}
+        open_borrows = {borrower_type: _open_borrows(session, borrower_type, items)
+                        for borrower_type in BORROWER_MODELS} if items else {}
+
+        accepted = {borrower_type: [] for borrower_type in BORROWER_MODELS}
+        seen = set()
+        for request in returns:
+            borrower_type = next((borrower_type for borrower_type, borrows in open_borrows.items()
+                                  if request.bar_code in borrows), None)
+            if request.bar_code not in items:
+                error = "Book item not in DB"
+            elif request.bar_code in seen:
+                error = "Book item repeated in returns"
+            elif borrower_type is None:
+                error = "Book Not Found in Any Borrowed Transaction"
+            else:
+                error = None
+                accepted[borrower_type].append(request)
+            seen.add(request.bar_code)
+            results.append(ReturnResult(
+                request, error is None, borrower_type if error is None else None,
+                open_borrows[borrower_type][request.bar_code] if error is None else None,
+                False, error))
+
+        fined = set()
+        changed = set()
+        for borrower_type, requests in accepted.items():
+            if requests:
+                type_fined, type_changed = _return_items(session, borrower_type, requests, items)
+                fined |= type_fined
+                changed |= type_changed
+
+        for position, result in enumerate(results):
+            if result.success and result.request.bar_code in changed:
+                results[position] = result._replace(
+                    success=False, borrower_type=None, trans_id=None,
+                    error="Book item changed by a concurrent transaction")
+            else:
+                results[position] = result._replace(
+                    fine=result.success and result.request.bar_code in fined)
+        LOGGER.info("Returned %d of %d book items",
+                    sum(map(len, accepted.values())) - len(changed), len(returns))
 
-        # Getting list of book objects
-        book_list = session.query(BookItem).\
-            filter(BookItem.bar_code.in_(b_id)).all()
-        if (not book_list) or (len(b_id) != len(book_list)):
-            # If books not in database, then raise attribute error
-            raise AttributeError("Book item not in DB")
+        # Returning inside the scope, so that nothing is reported if the transaction failed
+        return results
 
-        for i in range(len(book_list)):
-            # Getting list of professor borrow where the given book item occurred
-            professor_borrow = session.query(ProfessorBorrow).\
-                filter(ProfessorBorrow.book_item == book_list[i]). \
-                order_by(ProfessorBorrow.professor_trans_id.desc()).first()
-            if not professor_borrow:
-                # If book did not occurred in any previous transaction,
-                # then raise an attribute error
-                raise AttributeError("Book Not Found in Any Borrowed Transaction")
-            if lost:
-                # If book is lost then, status is changed to lost and
-                # professor has to pay fine
-                book_list[i].status = BookStatus.LOST
-            else:
-                # If book is not lost, then status is changed to available
-                book_list[i].status = BookStatus.AVAILABLE
 
-            if tampered:
-                # If book is tampered
-                if not book_list[i].tampered:
-                    # if the book item was not tampered previously,
-                    # then the tampered is changed to true
-                    print("\npay Fine\n")
-                    book_list[i].tampered = True
-
-            # Assigning the return date to today
-            professor_borrow.return_date = date.today()
-            session.flush()
-            print("Books are returned")
+def impact_query(dep):
+    """
+    Function to build the query of the borrows of a department's books by students of other departments
 
+    Parameters
+    ----------
+    dep : int
+        Department Id
 
+    Returns
+    -------
+    Query
+        Query of (transaction id, book name, student name, student department name) rows,
+        not bound to any session.
+    """
+    query = Query([StudentActivity.trans_id,
+                   Books.name,
+                   Students.name,
+                   Department.name])
+    query = query.join(StudentBorrow, StudentActivity.trans_id == StudentBorrow.student_trans_id)
+    query = query.join(BookItem, StudentBorrow.book_bar_code_id == BookItem.bar_code)
+    query = query.join(Books, BookItem.isbn_id == Books.isbn_id)
+    query = query.join(Students, StudentActivity.student_id == Students.reg_id)
+    query = query.join(Department, Students.dept_id == Department.dept_id)
+    return query.filter(Books.dept_id == dep).filter(Students.dept_id != dep)
+
+
+@operation("impact")
 def impact(dep):
     """
     Function to check the impact on a department.
@@ -331,39 +819,119 @@ def impact(dep):
     dep : int
         Department Id
 
+    Returns
+    -------
+    list
+        (transaction id, book name, student name, student department name) rows,
+        None if the department or its activity was not found, the reason is logged.
     """
-    with query_session_scope() as session:
+    with query_session_scope(read_only=True) as session:
         # Asserting parameters
         assert isinstance(dep, int), "Department Id should be integer"
 
-        # Getting department object
-        department = session.query(Department).filter_by(dept_id=dep).first()
-        if not department:
+        # Getting department, from the cache of reference rows
+        if not lookup(session, Department, dep):
             # If department is not in database, raise attribute error
             raise AttributeError("Department not in DB")
 
         # Getting list of students and their transactions who are from different
-        # department but borrowed book from the given department
-        query = session.query(StudentActivity.trans_id,
-                              Books.name,
-                              Students.name,
-                              Department.name)
-        query = query.join(StudentBorrow, StudentActivity.trans_id == StudentBorrow.student_trans_id)
-        query = query.join(BookItem, StudentBorrow.book_bar_code_id == BookItem.bar_code)
-        query = query.join(Books, BookItem.isbn_id == Books.isbn_id)
-        query = query.join(Students, StudentActivity.student_id == Students.reg_id)
-        query = query.join(Department, Students.dept_id == Department.dept_id)
-        query = query.filter(Books.dept_id == dep).filter(Students.dept_id != dep)
-        results = query.all()
-        if not results:
+        # department but borrowed book from the given department, the streaming
+        # impact report of the reports module suits the departments with many rows
+        rows = [tuple(row) for row in impact_query(dep).with_session(session)]
+
+        if not rows:
             # If no activity was found, it raise an attribute error
             raise AttributeError("No Activity For this Department's Books")
 
-        for row in results:
-            print(f"Transaction Id: {row[0]}\tBook Name:{row[1]}\tStudent name: {row[2]},"
-                  f"\tstudent department: {row[3]}")
+        LOGGER.info("Found %d borrows of the books of department %d by other departments",
+                    len(rows), dep, extra={"dept_id": dep})
+        return rows
+
+
+def title_status_query(isbn_ids):
+    """
+    Function to build the query of the status and due date of every item of the given books
+
+    The book items are outer joined to their open borrows in both borrow tables,
+    a book item is in at most one open borrow.
+
+    Parameters
+    ----------
+    isbn_ids : iterable
+        Isbn codes of the books.
+
+    Returns
+    -------
+    Query
+        Query of (isbn code, book name, bar code, status, due date) rows, not bound to any session.
+    """
+    query = Query([Books.isbn_id, Books.name, BookItem.bar_code, BookItem.status,
+                   func.coalesce(StudentBorrow.due_date, ProfessorBorrow.due_date)])
+    query = query.outerjoin(BookItem, BookItem.isbn_id == Books.isbn_id)
+    query = query.outerjoin(StudentBorrow, and_(StudentBorrow.book_bar_code_id == BookItem.bar_code,
+                                                StudentBorrow.return_date.is_(None)))
+    query = query.outerjoin(ProfessorBorrow, and_(ProfessorBorrow.book_bar_code_id == BookItem.bar_code,
+                                                  ProfessorBorrow.return_date.is_(None)))
+    return query.filter(Books.isbn_id.in_(isbn_ids)).order_by(Books.isbn_id, BookItem.bar_code)
+
+
+def collect_titles(rows):
+    """
+    Function to group the rows of the title status query by book
+
+    Parameters
+    ----------
+    rows : iterable
+        (isbn code, book name, bar code, status, due date) rows.
+
+    Returns
+    -------
+    dict
+        TitleStatus of every book, by isbn code.
+    """
+    titles = {}
+    for isbn_id, name, bar_code, status, due_date in rows:
+        title = titles.setdefault(isbn_id, TitleStatus(isbn_id, name, []))
+        if bar_code is not None:
+            # Books without any item have a single row without bar code
+            title.items.append(ItemStatus(bar_code, status,
+                                          due_date if status == BookStatus.UNAVAILABLE else None))
+    return titles
+
 
+def _title_statuses(session, isbn_ids):
+    """
+    Function to get the status and due date of every item of the given books, from the
+    status cache, querying the books missing from it together
+
+    Parameters
+    ----------
+    session : Session
+        Session used to query the database.
+    isbn_ids : iterable
+        Isbn codes of the books.
 
+    Returns
+    -------
+    dict
+        TitleStatus of every book found, by isbn code.
+    """
+    # The books changed by the transaction are read from it, and not cached before it commits
+    changed = status_cache.changed(session)
+    titles = status_cache.get_titles([isbn_id for isbn_id in isbn_ids if isbn_id not in changed])
+    missing = [isbn_id for isbn_id in isbn_ids if isbn_id not in titles]
+    if missing:
+        # Noting when the read started, so that a status evicted meanwhile is not cached
+        started = time.time()
+        query = bake(lambda session: title_status_query(in_list("isbn_ids")).with_session(session))
+        fetched = collect_titles(query(session).params(isbn_ids=missing))
+        status_cache.put_titles({isbn_id: title for isbn_id, title in fetched.items()
+                                 if isbn_id not in changed}, started)
+        titles.update(fetched)
+    return titles
+
+
+@operation("check_status")
 def check_status(book_id):
     """
     Function to check the status of a given book
@@ -373,50 +941,62 @@ def check_status(book_id):
 
     book_id : int
         Primary Key/ Isbn code of Book.
-    """
-    print("\nChecking\n")
 
-    with query_session_scope() as session:
+    Returns
+    -------
+    TitleStatus
+        Status of the book items of the book, None if the book was not found, the reason is logged.
+    """
+    with query_session_scope(read_only=True) as session:
         # Asserting the parameters
         assert isinstance(book_id, int), "Book Id should be integer"
 
-        # Getting the book object
-        book_object = session.query(Books).\
-            filter(Books.isbn_id == book_id).first()
-        if not book_object:
+        # Getting the book and the status of all its book items
+        title = _title_statuses(session, [book_id]).get(book_id)
+        if not title:
             # If book id is not in database, raise an attribute error
             raise AttributeError("Book not in DB")
 
-        # Getting list of all book items associated with the given book object
-        book_items = book_object.book_items
-        for item in book_items:
-            # Setting due date to none
-            due_date = None
+        for item in title.items:
             if item.status == BookStatus.UNAVAILABLE:
-                # If status of book is unavailable, getting student borrow object
-                student_borrow = session.query(StudentBorrow).\
-                    filter(StudentBorrow.book_item == item). \
-                    order_by(StudentBorrow.student_trans_id.desc()).first()
-                if student_borrow:
-                    # if student borrow is not none, then
-                    # assigning the due date to the due date from the student borrow
-                    due_date = student_borrow.due_date
-                else:
-                    # If student borrow is none, then checking with the professor borrow
-                    professor_borrow = session.query(ProfessorBorrow). \
-                        filter(ProfessorBorrow.book_item == item). \
-                        order_by(ProfessorBorrow.professor_trans_id.desc()).first()
-                    if professor_borrow:
-                        # if professor borrow is not none, then
-                        # assigning the due date to the due date from the professor borrow
-                        due_date = professor_borrow.due_date
-
-                print(
-                    f"\nBook Name: {book_object.name} - Bard Code: {item.bar_code}"
-                    f" is {item.status.name} and is due return on: {due_date}\n")
+                LOGGER.info("Book Name: %s - Bar Code: %d is %s and is due return on: %s",
+                            title.name, item.bar_code, item.status.name, item.due_date,
+                            extra={"isbn_id": book_id, "bar_code": item.bar_code})
             else:
-                print(f"\nBook Name: {book_object.name} - Bard Code: {item.bar_code}"
-                      f" is {item.status.name}\n")
+                LOGGER.info("Book Name: %s - Bar Code: %d is %s",
+                            title.name, item.bar_code, item.status.name,
+                            extra={"isbn_id": book_id, "bar_code": item.bar_code})
+        return title
+
+
+@operation("bulk_status")
+def bulk_status(isbn_ids):
+    """
+    Function to get the status and due dates of the items of many books at once
+
+    Parameters
+    ----------
+
+    isbn_ids : list
+        Primary Keys/ Isbn codes of Books.
+
+    Returns
+    -------
+    dict
+        TitleStatus of every book found, by isbn code. Isbn codes not in the
+        database are left out.
+    """
+    titles = {}
+
+    with query_session_scope(read_only=True) as session:
+        # Asserting the parameters
+        assert isinstance(isbn_ids, list), "Book Ids should be a list"
+        assert all(isinstance(isbn_id, int) for isbn_id in isbn_ids), "Book Ids should be integers"
+
+        if isbn_ids:
+            titles = _title_statuses(session, set(isbn_ids))
+
+    return titles
 
 
 def basic_trans():
@@ -456,7 +1036,7 @@ def test_tamper():
     None
     """
 
-    print("\nTesting Tampering----------------\n")
+    LOGGER.info("Testing Tampering")
 
     # Issuing book to student
     student_issue(1, 3, [22])
@@ -496,7 +1076,7 @@ def impact_analysis():
     None
     """
 
-    print("\nIssuing to check Analysis----------\n")
+    LOGGER.info("Issuing to check Analysis")
 
     # Issuing some book to students who are
     # from the same department as the book and also from different department
@@ -507,12 +1087,12 @@ def impact_analysis():
     student_returning([28])
     student_issue(1, 28, [29])
 
-    print("\nAnalysing--------------------\n")
+    LOGGER.info("Analysing")
     # Calling the impact function to see the impact
     # On computer science department [id=2]
     impact(2)
 
-    print("\nChecking status of book -----------------------\n")
+    LOGGER.info("Checking status of book")
     # Checking the status of book of ISBN-15
     check_status(15)
 
@@ -533,7 +1113,7 @@ def main():
     impact_analysis()
 
     # Deleting all tables
-    BASE.metadata.drop_all(ENGINE)
+    BASE.metadata.drop_all(get_engine())
 
 
 if __name__ == '__main__':
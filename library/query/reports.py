@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+""" Module for streaming reports of the library database
+
+This script builds the reports as generators over server side cursors, the rows
+are fetched from the database in batches while they are written, so the memory
+used and the time to the first row do not depend on the size of the report.
+The rows are written by pluggable writers to a file or to the standard output,
+it contains the following functions
+
+    * impact_report
+    * history_report
+    * write_csv
+    * write_jsonl
+    * write_report
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard import
+import csv
+import json
+import logging
+import sys
+
+# External Imports
+from sqlalchemy.orm import Query
+
+# User Import
+from library.orm.models import Books, BookItem, BORROWER_MODELS
+from library.connections.transactions import operation, session_scope
+from library.query.queries import impact_query
+
+
+__author__ = 'praveen@gyandata.com'
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of rows fetched from the server side cursor at a time
+BATCH_SIZE = 1000
+
+# Columns of the rows of every report
+IMPACT_COLUMNS = ("trans_id", "book_name", "student_name", "student_department")
+HISTORY_COLUMNS = ("borrower_type", "trans_id", "borrower_id", "borrower_name", "bar_code",
+                   "book_name", "doi", "due_date", "return_date")
+
+
+def _stream(query, session, batch_size):
+    """Function to iterate over the rows of a query through a server side cursor"""
+    return query.with_session(session).\
+        execution_options(stream_results=True).\
+        yield_per(batch_size)
+
+
+def impact_report(dep, batch_size=BATCH_SIZE):
+    """
+    Function to stream the borrows of a department's books by students of other departments
+
+    Parameters
+    ----------
+    dep : int
+        Department Id
+    batch_size : int
+        Number of rows fetched from the database at a time.
+
+    Returns
+    -------
+    generator
+        Rows with the impact columns, as tuples.
+    """
+    with session_scope(read_only=True) as session:
+        for row in _stream(impact_query(dep), session, batch_size):
+            yield tuple(row)
+
+
+def _history_query(borrower_type, since, until):
+    """Function to build the query of the borrows of a borrower type"""
+    models = BORROWER_MODELS[borrower_type]
+    borrow, activity, borrower = models["borrow"], models["activity"], models["borrower"]
+    trans_id = getattr(borrow, models["trans_key"])
+    query = Query([trans_id, models["key"], borrower.name, borrow.book_bar_code_id, Books.name,
+                   activity.doi, borrow.due_date, borrow.return_date])
+    query = query.join(activity, trans_id == activity.trans_id)
+    query = query.join(borrower, getattr(activity, models["activity_key"]) == models["key"])
+    query = query.join(BookItem, borrow.book_bar_code_id == BookItem.bar_code)
+    query = query.join(Books, BookItem.isbn_id == Books.isbn_id)
+    if since:
+        query = query.filter(activity.doi >= since)
+    if until:
+        query = query.filter(activity.doi <= until)
+    return query.order_by(trans_id, borrow.book_bar_code_id)
+
+
+def history_report(borrower_type=None, since=None, until=None, batch_size=BATCH_SIZE):
+    """
+    Function to stream the borrowing history
+
+    Parameters
+    ----------
+    borrower_type : str
+        Type of borrower, student or professor, defaults to both.
+    since : date
+        First date of issue of the report, defaults to the first borrow.
+    until : date
+        Last date of issue of the report, defaults to the last borrow.
+    batch_size : int
+        Number of rows fetched from the database at a time.
+
+    Returns
+    -------
+    generator
+        Rows with the history columns, as tuples.
+    """
+    assert borrower_type is None or borrower_type in BORROWER_MODELS, \
+        "Borrower type should be student or professor"
+
+    borrower_types = [borrower_type] if borrower_type else list(BORROWER_MODELS)
+    with session_scope(read_only=True) as session:
+        for name in borrower_types:
+            for row in _stream(_history_query(name, since, until), session, batch_size):
+                yield (name,) + tuple(row)
+
+
+def write_csv(rows, columns, stream):
+    """
+    Function to write rows as CSV, with a header row
+
+    Parameters
+    ----------
+    rows : iterable
+        Rows as tuples.
+    columns : iterable
+        Names of the columns.
+    stream : file
+        Text stream written to.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    writer = csv.writer(stream)
+    writer.writerow(columns)
+    count = 0
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+    return count
+
+
+def write_jsonl(rows, columns, stream):
+    """
+    Function to write rows as JSON objects, one per line
+
+    Parameters
+    ----------
+    rows : iterable
+        Rows as tuples.
+    columns : iterable
+        Names of the columns, the keys of the objects.
+    stream : file
+        Text stream written to.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    count = 0
+    for count, row in enumerate(rows, 1):
+        stream.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+    return count
+
+
+# Writers by format name, a writer takes the rows, the columns and the stream
+WRITERS = {
+    "csv": write_csv,
+    "jsonl": write_jsonl,
+}
+
+# Generator and columns of every report
+REPORTS = {
+    "impact": (impact_report, IMPACT_COLUMNS),
+    "history": (history_report, HISTORY_COLUMNS),
+}
+
+
+@operation("write_report", attempts=1)
+def write_report(report, output_format="csv", path=None, **params):
+    """
+    Function to write a report to a file or to the standard output, while it is being read
+
+    Parameters
+    ----------
+    report : str
+        Name of the report, impact or history.
+    output_format : str
+        Name of the writer, csv or jsonl.
+    path : str
+        Path of the file written, defaults to the standard output.
+    params : dict
+        Parameters of the report generator.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    assert report in REPORTS, f"Report should be one of {', '.join(REPORTS)}"
+    assert output_format in WRITERS, f"Format should be one of {', '.join(WRITERS)}"
+
+    generator, columns = REPORTS[report]
+    rows = generator(**params)
+    if path is None:
+        count = WRITERS[output_format](rows, columns, sys.stdout)
+    else:
+        with open(path, "w", newline="") as stream:
+            count = WRITERS[output_format](rows, columns, stream)
+    LOGGER.info("Wrote %d rows of the %s report", count, report)
+    return count
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+""" Module for caching the status of the books between circulation changes
+
+This script caches the status and due dates of the items of a book, by isbn
+code. The issue and return functions mark the books whose items they change
+in their session, and the marked books are evicted once the transaction
+ends, not when a savepoint of it is released. The entries are kept by a pluggable backend, a dict for a single
+process or a directory of files shared by many processes (a directory under
+/dev/shm keeps it in shared memory), and expire after a time to live as a
+safety net. The backend notes when every book was last evicted, and a status
+read before then, or just after it, is not cached, so a read racing a commit
+can not put back the status the commit evicted, it contains the following
+classes and functions
+
+    * DictBackend
+    * FileBackend
+    * configure
+    * get_titles
+    * put_titles
+    * mark_changed
+    * changed
+    * invalidate
+    * clear
+    * status_cache_stats
+
+This script requires that the following packages be installed within the Python
+environment you are running this script in.
+
+    * sqlalchemy - Package used to connect to a database and do SQL operations using orm_queries
+
+"""
+
+# Standard Imports
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+# External Imports
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# User Imports
+from library.orm.models import BookItem
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+# Seconds a status is cached for, if no change evicts it before
+STATUS_TTL = 60.0
+
+# Seconds a read may lag the eviction of its book, such as on a replica behind the
+# primary, a status read this soon after its book was evicted is not cached
+STALE_WINDOW = 1.0
+
+# Key of the session info holding the isbn codes changed in the transaction
+_CHANGED = "status_cache_changed"
+
+
+class DictBackend:
+    """This class keeps the cached entries in a dict of the process.
+
+    Attributes
+    ----------
+    ttl : float
+        Seconds an entry is kept for.
+
+    """
+
+    def __init__(self, ttl=STATUS_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._evicted = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Function to get a cached value, None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def set(self, key, value):
+        """Function to cache a value"""
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+
+    def delete(self, keys):
+        """Function to evict values, noting when they were evicted"""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._evicted[key] = now
+
+    def evicted(self, key):
+        """Function to get the time a value was last evicted, 0 if it never was"""
+        with self._lock:
+            return self._evicted.get(key, 0.0)
+
+    def clear(self):
+        """Function to evict every value"""
+        with self._lock:
+            self._entries.clear()
+            self._evicted.clear()
+
+
+class FileBackend:
+    """This class keeps every cached entry in a file of a directory shared by processes.
+
+    Attributes
+    ----------
+    directory : str
+        Directory of the entries.
+
+    ttl : float
+        Seconds an entry is kept for.
+
+    """
+
+    def __init__(self, directory, ttl=STATUS_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, extension=".pickle"):
+        """Function to get the path of the file of an entry, or of its eviction marker"""
+        return os.path.join(self.directory, f"{key}{extension}")
+
+    def get(self, key):
+        """Function to get a cached value, None if it is missing, expired or unreadable"""
+        try:
+            with open(self._path(key), "rb") as file:
+                expires, value = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if expires >= time.time() else None
+
+    def set(self, key, value):
+        """Function to cache a value, replacing the file atomically"""
+        handle, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as file:
+            pickle.dump((time.time() + self.ttl, value), file)
+        os.replace(temp, self._path(key))
+
+    def delete(self, keys):
+        """Function to evict values, noting when they were evicted in the time of a marker file"""
+        for key in keys:
+            with open(self._path(key, ".evicted"), "a"):
+                pass
+            os.utime(self._path(key, ".evicted"))
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def evicted(self, key):
+        """Function to get the time a value was last evicted, 0 if it never was"""
+        try:
+            return os.path.getmtime(self._path(key, ".evicted"))
+        except OSError:
+            return 0.0
+
+    def clear(self):
+        """Function to evict every value"""
+        for name in os.listdir(self.directory):
+            if name.endswith((".pickle", ".evicted")):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+# Backends by name, a backend gets, sets and deletes entries by key, and knows when
+# an entry was last deleted
+BACKENDS = {
+    "dict": DictBackend,
+    "file": FileBackend,
+}
+
+_STATE = {"backend": DictBackend(), "stale_window": STALE_WINDOW,
+          "hits": 0, "misses": 0, "evictions": 0, "stale": 0}
+_STATE_LOCK = threading.Lock()
+
+
+def configure(backend="dict", stale_window=STALE_WINDOW, **options):
+    """
+    Function to change the backend of the cache
+
+    Parameters
+    ----------
+    backend : str
+        Name of the backend, dict or file.
+    stale_window : float
+        Seconds a read may lag the eviction of its book, at least the lag of the replicas.
+    options : dict
+        Parameters of the backend, such as the directory of the file backend and the ttl.
+    """
+    assert backend in BACKENDS, f"Backend should be one of {', '.join(BACKENDS)}"
+    _STATE["backend"] = BACKENDS[backend](**options)
+    _STATE["stale_window"] = stale_window
+
+
+def _count(**counts):
+    """Function to add to the counters of the cache"""
+    with _STATE_LOCK:
+        for key, value in counts.items():
+            _STATE[key] += value
+
+
+def get_titles(isbn_ids):
+    """
+    Function to get the cached status of books
+
+    Parameters
+    ----------
+    isbn_ids : iterable
+        Isbn codes of the books.
+
+    Returns
+    -------
+    dict
+        Cached status of the books found in the cache, by isbn code.
+    """
+    backend = _STATE["backend"]
+    titles = {}
+    for isbn_id in isbn_ids:
+        title = backend.get(isbn_id)
+        if title is not None:
+            titles[isbn_id] = title
+    _count(hits=len(titles), misses=len(isbn_ids) - len(titles))
+    return titles
+
+
+def _stale(backend, isbn_id, started):
+    """Function to check whether the status of a book read at a time may predate its last change"""
+    return started is not None and \
+        backend.evicted(isbn_id) + _STATE["stale_window"] > started
+
+
+def put_titles(titles, started=None):
+    """
+    Function to cache the status of books, unless their book was evicted since they were read
+
+    Parameters
+    ----------
+    titles : dict
+        Status of the books, by isbn code.
+    started : float
+        Time.time() before the status was read, None to cache it whatever the evictions.
+    """
+    backend = _STATE["backend"]
+    stale = 0
+    for isbn_id, title in titles.items():
+        if _stale(backend, isbn_id, started):
+            stale += 1
+            continue
+        backend.set(isbn_id, title)
+        if _stale(backend, isbn_id, started):
+            # Evicted while it was being cached, so it is evicted again
+            backend.delete([isbn_id])
+            stale += 1
+    _count(stale=stale)
+
+
+def invalidate(isbn_ids):
+    """
+    Function to evict the status of books
+
+    Parameters
+    ----------
+    isbn_ids : iterable
+        Isbn codes of the books.
+    """
+    isbn_ids = list(isbn_ids)
+    _STATE["backend"].delete(isbn_ids)
+    _count(evictions=len(isbn_ids))
+
+
+def clear():
+    """
+    Function to evict the status of every book, such as when the database is replaced
+    """
+    _STATE["backend"].clear()
+
+
+def mark_changed(session, bar_codes, isbn_ids=()):
+    """
+    Function to mark the books of changed book items, to be evicted when the transaction ends
+
+    Parameters
+    ----------
+    session : Session
+        Session of the transaction changing the book items.
+    bar_codes : iterable
+        Bar codes of the changed book items.
+    isbn_ids : iterable
+        Isbn codes of books changed themselves, such as renamed ones.
+    """
+    marked = session.info.setdefault(_CHANGED, set())
+    marked.update(isbn_ids)
+    bar_codes = list(bar_codes)
+    if bar_codes:
+        marked.update(row[0] for row in session.query(BookItem.isbn_id).
+                      filter(BookItem.bar_code.in_(bar_codes)))
+
+
+def changed(session):
+    """
+    Function to get the books changed in the transaction of a session, not evicted yet
+
+    Parameters
+    ----------
+    session : Session
+        Session of the transaction.
+
+    Returns
+    -------
+    set
+        Isbn codes of the changed books, whose cached status is stale for the session.
+    """
+    return session.info.get(_CHANGED, set())
+
+
+def status_cache_stats():
+    """
+    Function to get the counters of the cache
+
+    Returns
+    -------
+    dict
+        Number of hits, misses, evicted books and stale reads not cached.
+    """
+    with _STATE_LOCK:
+        return {key: _STATE[key] for key in ("hits", "misses", "evictions", "stale")}
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed(session, flush_context):  # pylint: disable=unused-argument
+    """Function to mark the books of the book items changed by a flush"""
+    isbn_ids = {instance.isbn_id for instance in list(session.dirty) + list(session.deleted)
+                if isinstance(instance, BookItem)}
+    if isbn_ids:
+        session.info.setdefault(_CHANGED, set()).update(isbn_ids)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _evict_ended(session, transaction):
+    """Function to evict the books changed by a transaction once it is committed or
+    rolled back, a savepoint ending, such as the one of an operation of a unit of work,
+    leaves them to the transaction, whose reads must not be cached until it ends"""
+    if transaction.parent is None:
+        isbn_ids = session.info.pop(_CHANGED, None)
+        if isbn_ids:
+            invalidate(isbn_ids)
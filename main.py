@@ -8,13 +8,18 @@ environment you are running this script in.
 """
 
 # Standard imports
-import logging.config
-import json
+import os
+import sys
 
 # User Import
-from library.connections.get_connection import ENGINE
+from library.connections.get_connection import get_engine
+from library.connections.instrumentation import log_operation_stats
+from library.connections.transactions import log_contention
+from library import logging_config
+from library.orm.bakery import log_bakery_stats
 from library.orm.models import BASE
 from library.populate.populate_db import populate
+from library.populate.snapshots import use_snapshot
 from library.query.queries import basic_trans, impact_analysis,\
     test_tamper
 
@@ -24,26 +29,36 @@ __author__ = 'praveen@gyandata.com'
 
 def configure_logging():
     """
-    function to configure logging
+    function to configure logging, the records are written by a listener thread
+    and the console is left out if LIBRARY_LOG_CONSOLE is 0
     :return: nothing
     :rtype: None
     """
-    with open('configs\\log.json', 'r') as file:
-        config = json.load(file)
+    logging_config.configure_logging()
 
-    logging.config.dictConfig(config)
 
+def main(preset=None):
+    """
+    Main Function to populate the database and perform queries
 
-def main():
-    """Main Function to populate the database and perform queries"""
+    Parameters
+    ----------
+    preset : str
+        Name of a dataset snapshot (small, medium or large) to run against a clone of,
+        instead of creating and populating the configured database.
+    """
 
     configure_logging()
 
-    # Creating all the tables
-    BASE.metadata.create_all(ENGINE)
+    if preset:
+        # Cloning the cached snapshot, it is built on the first run
+        engine = use_snapshot(preset)
+    else:
+        # Creating all the tables
+        BASE.metadata.create_all(get_engine())
 
-    # Populating the database, # Giving a new session as parameter
-    populate()
+        # Populating the database, # Giving a new session as parameter
+        populate()
 
     # Calling the basic transaction to do some issues, passing the
     # Session factory as parameter
@@ -58,9 +73,23 @@ def main():
     # And passing the session factory as parameter
     impact_analysis()
 
-    # Deleting all tables
-    BASE.metadata.drop_all(ENGINE)
+    # Logging the operations that had to be retried
+    log_contention()
+
+    # Logging the hit rates of the compiled hot queries
+    log_bakery_stats()
+
+    # Logging the statements run by every operation
+    log_operation_stats()
+
+    if preset:
+        # Deleting the clone
+        engine.dispose()
+        os.remove(engine.url.database)
+    else:
+        # Deleting all tables
+        BASE.metadata.drop_all(get_engine())
 
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
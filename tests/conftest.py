@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+""" Fixtures of the tests, run from the root of the repository
+
+Every test using the database fixture gets its own clone of the small
+snapshot, with the session factory pointed at it and the caches emptied.
+The people fixture holds ids of its rows and the issue fixture issues
+book items to them.
+
+"""
+
+# External Imports
+import pytest
+
+# User Import
+from library.connections.get_connection import SCOPED_SESSION, SESSION_FACTORY
+from library.orm.cache import CACHES, invalidate
+from library.populate.snapshots import use_snapshot
+from library.query import status_cache
+from library.query.queries import IssueRequest, batch_issue
+
+
+__author__ = 'praveen@gyandata.com'
+
+
+def _clear_caches():
+    """Function to empty the caches, whose keys are the same in every clone"""
+    for model in CACHES:
+        invalidate(model)
+    status_cache.clear()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Engine of a clone of the small snapshot, used by the session factory"""
+    _clear_caches()
+    engine = use_snapshot("small", str(tmp_path / "library.sqlite"))
+    yield engine
+    SCOPED_SESSION.remove()
+    SESSION_FACTORY.configure(bind=None)
+    engine.dispose()
+    _clear_caches()
+
+
+def _ids(database, query):
+    """Function to get the first column of the rows of a query"""
+    return [row[0] for row in database.execute(query)]
+
+
+@pytest.fixture
+def people(database):
+    """Staff, student and professor ids and available bar codes of the database"""
+    return {"staff": _ids(database, "SELECT staff_id FROM staffs")[0],
+            "student": _ids(database, "SELECT reg_id FROM students")[0],
+            "professor": _ids(database, "SELECT employee_code FROM professors")[0],
+            "items": _ids(database, "SELECT bar_code FROM book_item WHERE status = 'AVAILABLE' "
+                                    "ORDER BY bar_code")}
+
+
+@pytest.fixture
+def issue(people):
+    """Function issuing book items to the first borrower of a type, in one batch"""
+    def issue_items(borrower_type, bar_codes):
+        result, = batch_issue([IssueRequest(borrower_type, people[borrower_type],
+                                            people["staff"], bar_codes)])
+        assert result.success, result.error
+        return result
+    return issue_items
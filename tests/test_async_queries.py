@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+""" Tests of the pool of async connections and of the async transactions """
+
+# Standard Imports
+import asyncio
+
+# External Imports
+import pytest
+from sqlalchemy import select
+
+# User Imports
+from library.orm.models import Staffs
+from library.query import async_queries, queries
+from library.query.async_queries import AsyncPool
+
+aiosqlite = pytest.importorskip("aiosqlite")
+
+
+def test_unsupported_database():
+    with pytest.raises(ValueError, match="sqlite or mysql"):
+        AsyncPool("postgresql://localhost/library")
+
+
+def test_broken_connection_not_reused(database):
+    async def run():
+        pool = AsyncPool(str(database.url), size=1)
+        with pytest.raises(RuntimeError):
+            async with pool.transaction() as transaction:
+                broken = transaction.connection
+                await broken.close()
+                raise RuntimeError("Connection lost")
+
+        async with pool.transaction() as transaction:
+            assert transaction.connection is not broken
+            rows = await transaction.fetch(select([Staffs.staff_id]))
+        await pool.close()
+        return rows, pool
+
+    rows, pool = asyncio.run(run())
+    assert rows and pool._opened == 0  # pylint: disable=protected-access
+
+
+def _run(database, transactions):
+    """Function to run a coroutine function with a pool of the database"""
+    async def run():
+        pool = AsyncPool(str(database.url), size=2)
+        try:
+            return await transactions(pool)
+        finally:
+            await pool.close()
+    return asyncio.run(run())
+
+
+def test_issue_and_return(database, people):
+    bar_codes = people["items"][:2]
+
+    async def transactions(pool):
+        issued = await async_queries.issue(pool, "student", people["student"],
+                                           people["staff"], bar_codes)
+        returned = await async_queries.returning(pool, "student", bar_codes, lost=True)
+        return issued, returned
+
+    issued, returned = _run(database, transactions)
+    assert issued.success and issued.trans_id == database.execute(
+        "SELECT max(trans_id) FROM student_activity").scalar()
+    assert [(result.request.bar_code, result.trans_id, result.fine) for result in returned] == \
+        [(bar_code, issued.trans_id, True) for bar_code in bar_codes]
+    assert all(isinstance(result, queries.ReturnResult) for result in returned)
+    statuses = {row[0] for row in database.execute(
+        f"SELECT status FROM book_item WHERE bar_code IN ({bar_codes[0]}, {bar_codes[1]})")}
+    assert statuses == {"LOST"}
+
+
+def test_issue_repeated_item(database, people):
+    bar_code = people["items"][0]
+
+    async def transactions(pool):
+        await async_queries.issue(pool, "student", people["student"], people["staff"],
+                                  [bar_code, bar_code])
+
+    with pytest.raises(AttributeError, match="Book item repeated in request"):
+        _run(database, transactions)
+    assert database.execute("SELECT count(*) FROM student_borrow").scalar() == 0
+
+
+def test_check_status_matches_sync(database, people, issue):
+    bar_code = people["items"][0]
+    issue("professor", [bar_code])
+    isbn_id = database.execute(f"SELECT isbn_id FROM book_item WHERE bar_code = {bar_code}").scalar()
+
+    async def transactions(pool):
+        return await async_queries.check_status(pool, isbn_id)
+
+    title = _run(database, transactions)
+    assert title == queries.check_status(isbn_id)
+    assert {item.bar_code: item.status.name for item in title.items}[bar_code] == "UNAVAILABLE"
+
+
+def test_impact_matches_sync(database, people):
+    student_dept = database.execute(
+        f"SELECT dept_id FROM students WHERE reg_id = {people['student']}").scalar()
+    dept_id, bar_code = database.execute(
+        f"SELECT books.dept_id, bar_code FROM book_item JOIN books USING (isbn_id) "
+        f"WHERE books.dept_id != {student_dept} AND status = 'AVAILABLE' LIMIT 1").first()
+
+    async def transactions(pool):
+        await async_queries.issue(pool, "student", people["student"], people["staff"], [bar_code])
+        return await async_queries.impact(pool, dept_id)
+
+    rows = _run(database, transactions)
+    assert len(rows) == 1 and rows == queries.impact(dept_id)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+""" Tests of the availability counters of the books """
+
+# User Import
+from library.query import availability as availability_module
+from library.query.availability import availability, reconcile_counters
+from library.query.queries import ReturnRequest, batch_return
+
+
+def _isbn_id(database, bar_code):
+    """Function to get the book of a book item"""
+    return database.execute(f"SELECT isbn_id FROM book_item WHERE bar_code = {bar_code}").scalar()
+
+
+def test_counters_follow_circulation(database, people, issue):
+    bar_code = people["items"][0]
+    isbn_id = _isbn_id(database, bar_code)
+    before = availability(isbn_id)
+
+    issue("student", [bar_code])
+    issued = availability(isbn_id)
+    assert (issued.available, issued.issued) == (before.available - 1, before.issued + 1)
+
+    batch_return([ReturnRequest(bar_code, lost=True)])
+    lost = availability(isbn_id)
+    assert (lost.quantity, lost.available, lost.issued, lost.lost) == \
+        (before.quantity, before.available - 1, before.issued, before.lost + 1)
+
+
+def test_reconcile_fixes_drifted_books(database, people):
+    isbn_id = _isbn_id(database, people["items"][0])
+    before = availability(isbn_id)
+    database.execute(f"UPDATE books SET available_count = 0, issued_count = 5 "
+                     f"WHERE isbn_id = {isbn_id}")
+
+    assert reconcile_counters() == 1
+    assert availability(isbn_id) == before
+    assert reconcile_counters() == 0
+
+
+def test_failed_reads_return_none(database, monkeypatch):  # pylint: disable=unused-argument
+    def missing_counts(bar_codes=None):
+        raise AttributeError("Counters not found")
+
+    # The scope logs and rolls back an attribute error, leaving nothing to report
+    monkeypatch.setattr(availability_module, "counters_update", missing_counts)
+    assert reconcile_counters() is None
+    monkeypatch.setattr(availability_module, "Books", object())
+    assert availability(1) is None
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+""" Tests of the counters of the bakery of the hot queries """
+
+# User Import
+from library.orm.bakery import bakery_stats
+from library.query import status_cache
+from library.query.queries import check_status, student_issue
+
+
+def test_repeated_calls_hit(database, people):
+    isbn_ids = [row[0] for row in database.execute("SELECT isbn_id FROM books ORDER BY isbn_id")]
+
+    def calls(round_):
+        assert student_issue(people["staff"], people["student"], [people["items"][round_]]).success
+        # Emptying the status cache, so the status is queried
+        status_cache.clear()
+        assert check_status(isbn_ids[round_])
+
+    calls(0)
+    before = bakery_stats()
+    calls(1)
+    after = bakery_stats()
+
+    for kind in ("queries", "statements"):
+        assert after[kind]["hits"] > before[kind]["hits"]
+        assert after[kind]["misses"] == before[kind]["misses"]
+    assert after["size"] == before["size"]
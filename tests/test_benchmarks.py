@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+""" Tests of the timing of the benchmarked operations """
+
+# External Imports
+import pytest
+
+# User Import
+from library.benchmarks.suite import measure
+
+
+def test_failed_calls_counted_not_timed():
+    results = measure(lambda succeed: True if succeed else None,
+                      [(True,), (False,), (True,), (False,), (True,)], 1, [0])
+
+    assert (results["runs"], results["failures"]) == (2, 2)
+
+
+def test_every_call_failed():
+    with pytest.raises(RuntimeError, match="failed"):
+        measure(lambda: None, [()] * 3, 1, [0])
+
+
+@pytest.mark.parametrize("calls", [0, 2])
+def test_calls_beyond_warmup_required(calls):
+    with pytest.raises(AssertionError, match="more times than the warmup"):
+        measure(lambda: True, [()] * calls, 2, [0])
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+""" Tests of the cache of the reference rows """
+
+# User Import
+from library.connections.get_connection import SESSION_FACTORY
+from library.connections.transactions import session_scope
+from library.orm.cache import CACHES, cache_stats, lookup, lookup_many
+from library.orm.models import Staffs
+
+
+def _name(staff_id):
+    """Function to look a staff up through the cache, in a session of its own"""
+    with session_scope() as session:
+        return lookup(session, Staffs, staff_id).name
+
+
+def test_lookup_cached(people):
+    staff_id = people["staff"]
+    _name(staff_id)
+    hits = cache_stats()["Staffs"]["hits"]
+
+    _name(staff_id)
+    assert cache_stats()["Staffs"]["hits"] == hits + 1
+    with session_scope() as session:
+        assert set(lookup_many(session, Staffs, [staff_id, -1])) == {staff_id}
+
+
+def test_flushed_row_evicted_again_on_commit(people):
+    staff_id = people["staff"]
+    _name(staff_id)
+
+    session = SESSION_FACTORY()
+    try:
+        session.query(Staffs).get(staff_id).name = "Renamed"
+        session.flush()
+        assert CACHES[Staffs].get(staff_id) is None
+        # Another session caches the committed row before the change is committed
+        assert _name(staff_id) != "Renamed"
+        session.commit()
+    finally:
+        session.close()
+
+    assert _name(staff_id) == "Renamed"
+
+
+def test_bulk_update_evicts(people):
+    staff_id = people["staff"]
+    _name(staff_id)
+
+    with session_scope() as session:
+        session.query(Staffs).filter(Staffs.staff_id == staff_id).\
+            update({Staffs.name: "Bulk"}, synchronize_session=False)
+
+    assert _name(staff_id) == "Bulk"
+
+
+def test_rolled_back_row_not_kept(people):
+    staff_id = people["staff"]
+    name = _name(staff_id)
+
+    session = SESSION_FACTORY()
+    try:
+        savepoint = session.begin_nested()
+        session.query(Staffs).get(staff_id).name = "Renamed"
+        savepoint.commit()
+        # Read from the transaction, before it is committed
+        assert lookup(session, Staffs, staff_id).name == "Renamed"
+        session.rollback()
+    finally:
+        session.close()
+
+    assert _name(staff_id) == name
+
+
+def test_bulk_update_rolled_back_not_kept(people):
+    staff_id = people["staff"]
+    name = _name(staff_id)
+
+    session = SESSION_FACTORY()
+    try:
+        session.query(Staffs).filter(Staffs.staff_id == staff_id).\
+            update({Staffs.name: "Bulk"}, synchronize_session=False)
+        assert lookup(session, Staffs, staff_id).name == "Bulk"
+        session.rollback()
+    finally:
+        session.close()
+
+    assert _name(staff_id) == name
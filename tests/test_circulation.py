@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+""" Tests of the issues and returns of book items """
+
+# External Imports
+import pytest
+
+# User Import
+from library.query import queries
+from library.orm.models import BookStatus
+from library.query.queries import IssueRequest, ReturnRequest, batch_issue, batch_return, \
+    professor_returning, student_returning
+
+
+@pytest.mark.parametrize("borrower_type, returning, fined", [
+    ("student", student_returning, True),
+    ("professor", professor_returning, False),
+])
+def test_lost_fined_for_students_only(people, issue, borrower_type, returning, fined):
+    bar_code = people["items"][0]
+    issue(borrower_type, [bar_code])
+
+    result, = returning([bar_code], lost=True)
+    assert result.success and result.fine is fined
+
+
+@pytest.mark.parametrize("borrower_type", ["student", "professor"])
+def test_first_tamper_fined(people, issue, borrower_type):
+    bar_code = people["items"][0]
+    issue(borrower_type, [bar_code])
+
+    result, = batch_return([ReturnRequest(bar_code, tampered=True)])
+    assert result.success and result.fine
+
+
+def test_batch_return_conflict_fails_changed_item_only(database, people, issue, monkeypatch):
+    first, second = people["items"][:2]
+    issue("student", [first, second])
+    book_items = queries._book_items
+
+    def stale_book_items(session, bar_codes, *columns):
+        # Reading the first book item at the version before a concurrent change
+        return [(row[0], row[1], row[2] - 1) if row[0] == first else row
+                for row in book_items(session, bar_codes, *columns)]
+
+    monkeypatch.setattr(queries, "_book_items", stale_book_items)
+    results = batch_return([ReturnRequest(first), ReturnRequest(second)])
+
+    assert [(result.success, result.error) for result in results] == \
+        [(False, "Book item changed by a concurrent transaction"), (True, None)]
+    statuses = {row[0]: row[1] for row in database.execute(
+        f"SELECT bar_code, status FROM book_item WHERE bar_code IN ({first}, {second})")}
+    assert statuses == {first: "UNAVAILABLE", second: "AVAILABLE"}
+    open_borrows = [row[0] for row in database.execute(
+        "SELECT book_bar_code_id FROM student_borrow WHERE return_date IS NULL")]
+    assert first in open_borrows and second not in open_borrows
+
+
+def test_batch_issue_conflict_fails_taken_item_only(database, people, issue, monkeypatch):
+    taken, first, second = people["items"][:3]
+    taken_trans_id = issue("professor", [taken]).trans_id
+    book_items = queries._book_items
+
+    def stale_book_items(session, bar_codes, *columns):
+        # Reading the taken book item as it was before a concurrent issue
+        return [(row[0], BookStatus.AVAILABLE) if row[0] == taken else row
+                for row in book_items(session, bar_codes, *columns)]
+
+    monkeypatch.setattr(queries, "_book_items", stale_book_items)
+    results = batch_issue([IssueRequest("student", people["student"], people["staff"], [first]),
+                           IssueRequest("student", people["student"], people["staff"], [taken]),
+                           IssueRequest("professor", people["professor"], people["staff"], [second])])
+
+    assert [(result.success, result.error) for result in results] == \
+        [(True, None), (False, "Book item not Available"), (True, None)]
+    assert results[0].trans_id == database.execute(
+        "SELECT trans_id FROM student_activity").scalar()
+    assert [row[0] for row in database.execute(
+        "SELECT trans_id FROM professor_activity ORDER BY trans_id")] == \
+        [taken_trans_id, results[2].trans_id]
+    borrows = {row[0]: row[1] for row in database.execute(
+        "SELECT book_bar_code_id, student_trans_id FROM student_borrow")}
+    assert borrows == {first: results[0].trans_id}
+    statuses = {row[0] for row in database.execute(
+        f"SELECT status FROM book_item WHERE bar_code IN ({taken}, {first}, {second})")}
+    assert statuses == {"UNAVAILABLE"}
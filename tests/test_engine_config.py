@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+""" Tests of the engine configuration and of the engines of its profiles """
+
+# Standard import
+import json
+
+# External Imports
+import pytest
+
+# User Imports
+from library.connections import get_connection
+from library.connections.get_connection import dispose_engines, get_engine, load_config
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """Function writing the engine configuration file, read afresh with no engine created"""
+    path = tmp_path / "engine_config.json"
+    monkeypatch.setenv("LIBRARY_ENGINE_CONFIG", str(path))
+    monkeypatch.delenv("LIBRARY_DB_PROFILE", raising=False)
+    monkeypatch.setattr(get_connection, "_CONFIG", {})
+    monkeypatch.setattr(get_connection, "_ENGINES", {})
+    monkeypatch.setattr(get_connection, "_REPLICAS", {})
+
+    def write(settings):
+        path.write_text(json.dumps(settings))
+    yield write
+    dispose_engines()
+
+
+def test_defaults_without_file(config):  # pylint: disable=unused-argument
+    settings = load_config()
+
+    assert settings["default_profile"] == "sqlite"
+    assert settings["profiles"] == get_connection.DEFAULT_PROFILES
+
+
+def test_file_overrides_defaults(config, tmp_path):
+    url = f"sqlite:///{tmp_path / 'reports.sqlite'}"
+    config({"default_profile": "reports",
+            "profiles": {"memory": {"sqlalchemy.pool_pre_ping": True},
+                         "reports": {"sqlalchemy.url": url}}})
+    profiles = load_config()["profiles"]
+
+    assert profiles["memory"] == dict(get_connection.DEFAULT_PROFILES["memory"],
+                                      **{"sqlalchemy.pool_pre_ping": True})
+    assert profiles["sqlite"] == get_connection.DEFAULT_PROFILES["sqlite"]
+    assert str(get_engine().url) == url
+
+
+def test_profile_from_environment(config, monkeypatch):
+    config({"default_profile": "sqlite"})
+    monkeypatch.setenv("LIBRARY_DB_PROFILE", "memory")
+    engine = get_engine()
+
+    assert str(engine.url) == "sqlite://"
+    assert engine.scalar("PRAGMA foreign_keys") == 1
+    assert get_engine("memory") is engine
+    with pytest.raises(AssertionError, match="Profile should be one of"):
+        get_engine("missing")
+
+
+def test_engines_per_process(config, monkeypatch):  # pylint: disable=unused-argument
+    engine = get_engine("memory")
+    assert get_engine("memory") is engine
+
+    # A forked worker creates its own engine instead of using the one of its parent
+    with monkeypatch.context() as worker:
+        worker.setattr(get_connection.os, "getpid", lambda: -1)
+        worker_engine = get_engine("memory")
+        assert worker_engine is not engine and get_engine("memory") is worker_engine
+        dispose_engines()
+
+    assert get_engine("memory") is engine
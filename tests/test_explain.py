@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+""" Tests of the query plans of the hot queries """
+
+# External Imports
+import pytest
+
+# User Import
+from library.connections.transactions import session_scope
+from library.orm.models import Books
+from library.query.explain import CATALOGUE, check_plans, full_scans, main
+
+
+@pytest.mark.parametrize("name", list(CATALOGUE))
+def test_hot_query_uses_indexes(database, name):
+    with session_scope(database) as session:
+        assert full_scans(session, CATALOGUE[name]()) == []
+
+
+def test_full_scan_reported(database):
+    with session_scope(database) as session:
+        assert full_scans(session, session.query(Books).filter(Books.name == "book")) == ["books"]
+
+
+def test_check_plans(database):
+    assert check_plans(database) == {}
+    assert main(["small"]) == 0
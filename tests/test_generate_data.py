@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+""" Tests of the generated datasets """
+
+# Standard import
+import csv
+import os
+
+# User Import
+from library.populate.generate_data import REFERENCE_DATE, TABLE_ORDER, _columns, generate
+from library.populate.populate_db import generate_rows
+
+
+SCALE = {"students": 2, "professors": 1, "books": 2, "items": 2}
+
+
+def test_rows_have_every_loaded_column():
+    rows = generate_rows(SCALE, dict.fromkeys(TABLE_ORDER, 0), range(2), today=REFERENCE_DATE)
+
+    for name in TABLE_ORDER[1:]:
+        for row in rows[name]:
+            assert set(_columns(name)) <= set(row), name
+
+
+def test_generate_writes_every_table(tmp_path):
+    counts = generate(str(tmp_path), departments=2, students=2, professors=1, books=2,
+                      items=2, staffs=1, workers=1)
+
+    assert counts["book_item"] == 8
+    for name in TABLE_ORDER:
+        with open(os.path.join(tmp_path, name + ".csv"), encoding="utf-8") as file:
+            header, *lines = list(csv.reader(file))
+        assert header == _columns(name)
+        assert len(lines) == counts[name]
+
+
+def test_same_seed_same_files_for_any_workers(tmp_path):
+    files = {}
+    for workers in (1, 3):
+        output_dir = tmp_path / str(workers)
+        generate(str(output_dir), seed=7, departments=5, students=3, professors=2, books=3,
+                 items=2, staffs=2, workers=workers)
+        # The load scripts name the directory, only the data files are compared
+        files[workers] = {name: (output_dir / (name + ".csv")).read_bytes() for name in TABLE_ORDER}
+
+    assert files[1] == files[3]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+""" Tests of the summary of the loans between departments """
+
+# User Import
+from library.query import impact_summary
+from library.query.impact_summary import impact_figures, rebuild_impact_summary
+
+
+def test_rebuild_keeps_figures(database, people, issue):
+    student_dept = database.execute(
+        f"SELECT dept_id FROM students WHERE reg_id = {people['student']}").scalar()
+    dept_id, bar_code = database.execute(
+        f"SELECT books.dept_id, bar_code FROM book_item JOIN books USING (isbn_id) "
+        f"WHERE books.dept_id != {student_dept} LIMIT 1").first()
+    issue("student", [bar_code])
+
+    figures = impact_figures(dept_id)
+    assert [(figure.borrower_dept_id, figure.borrower_type, figure.loan_count,
+             figure.active_loan_count) for figure in figures] == [(student_dept, "student", 1, 1)]
+    assert rebuild_impact_summary() == 1
+    assert impact_figures(dept_id) == figures
+
+
+def test_failed_rebuild_returns_none(database, people, issue, monkeypatch):
+    issue("student", [people["items"][0]])
+
+    def missing_history(borrower_type):
+        raise AttributeError("History not found")
+
+    # The scope logs and rolls back an attribute error, keeping the summary
+    monkeypatch.setattr(impact_summary, "_history_query", missing_history)
+    assert rebuild_impact_summary() is None
+    assert database.execute("SELECT count(*) FROM department_impact").scalar() == 1
+    monkeypatch.setattr(impact_summary, "DepartmentImpact", object())
+    assert impact_figures(1) is None
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+""" Tests of the catalogue import and the upserts """
+
+# Standard import
+import json
+
+# External Imports
+import pytest
+from sqlalchemy import Table, Column, Integer, MetaData
+
+# User Import
+from library.orm.models import BookStatus
+from library.orm.upsert import upsert_statement
+from library.populate.import_catalogue import import_catalogue
+
+
+def _record(**fields):
+    """Function to build a catalogue record of a new book item"""
+    record = {"isbn_id": 9001, "book_name": "Catalogued", "dept_id": 1, "author_id": 9001,
+              "author_name": "Author", "bar_code": 90001, "dopur": "2020-01-01",
+              "dopub": "2019-01-01", "price": 100.0, "edition": 1}
+    record.update(fields)
+    return record
+
+
+def _write(path, lines):
+    """Function to write the lines of a JSONL catalogue"""
+    path.write_text("\n".join(line if isinstance(line, str) else json.dumps(line)
+                              for line in lines) + "\n")
+    return str(path)
+
+
+def test_malformed_line_rejected_alone(database, tmp_path):
+    path = _write(tmp_path / "catalogue.jsonl",
+                  [_record(), "{not json", _record(bar_code=90002)])
+
+    assert import_catalogue(path) == {"imported": 2, "rejected": 1}
+    assert database.execute("SELECT count(*) FROM book_item WHERE isbn_id = 9001").scalar() == 2
+
+
+def test_reimport_keeps_circulation_columns(database, tmp_path):
+    path = _write(tmp_path / "catalogue.jsonl", [_record()])
+    import_catalogue(path)
+    database.execute("UPDATE book_item SET status = 'UNAVAILABLE', tampered = 1, version = 3 "
+                     "WHERE bar_code = 90001")
+
+    path = _write(tmp_path / "catalogue.jsonl", [_record(price=150.0, status="AVAILABLE")])
+    import_catalogue(path)
+
+    row = database.execute("SELECT status, tampered, version, price FROM book_item "
+                           "WHERE bar_code = 90001").first()
+    assert (row.status, row.tampered, row.version, row.price) == \
+        (BookStatus.UNAVAILABLE.name, 1, 3, 150.0)
+
+
+def test_upsert_unknown_dialect():
+    table = Table("counters", MetaData(), Column("key", Integer, primary_key=True),
+                  Column("value", Integer))
+
+    with pytest.raises(ValueError, match="mysql, sqlite"):
+        upsert_statement("postgresql", table, ["key", "value"])
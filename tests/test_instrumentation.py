@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+""" Tests of the attribution of the statements to the operations """
+
+# User Import
+from library.connections.instrumentation import operation_scope, operation_stats, \
+    statement_shape
+
+
+def test_shape_collapses_in_lists():
+    assert statement_shape("SELECT a FROM t WHERE b IN (?, ?,\n ?) AND c IN (?)") == \
+        statement_shape("SELECT a FROM t WHERE b IN (?) AND c IN (?, ?)")
+
+
+def test_transaction_control_not_counted(database):
+    with operation_scope("test_transaction_control") as frame:
+        for _ in range(6):
+            with database.connect() as connection:
+                with connection.begin():
+                    with connection.begin_nested():
+                        connection.execute("SELECT 1")
+
+    assert dict(frame["shapes"]) == {"SELECT 1": 6}
+    assert operation_stats()["test_transaction_control"]["suspects"] == {"SELECT 1": 1}
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+""" Tests of the logging configuration """
+
+# Standard Imports
+import json
+import logging
+
+# User Imports
+from library.logging_config import configure_logging, stop_logging
+
+
+def test_structured_file_log(tmp_path, monkeypatch):
+    path = tmp_path / "Logs" / "Library.log"
+    monkeypatch.setenv("LIBRARY_LOG_FILE", str(path))
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    try:
+        configure_logging(console=False)
+        logging.getLogger("library.test").info("Issued %d book items", 2,
+                                               extra={"trans_id": 7})
+    finally:
+        stop_logging()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+    entry = json.loads(path.read_text().splitlines()[-1])
+    assert (entry["message"], entry["trans_id"], entry["logger"]) == \
+        ("Issued 2 book items", 7, "library.test")
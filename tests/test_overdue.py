@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+""" Tests of the overdue fines """
+
+# Standard import
+from datetime import date, timedelta
+
+# User Import
+from library.query.overdue import assess_overdue, load_fine_schedule
+
+
+def test_default_schedule():
+    schedule = load_fine_schedule()
+
+    assert set(schedule) == {"student", "professor"}
+    assert all(fines["rates"] for fines in schedule.values())
+
+
+def test_overdue_borrow_fined(database, people, issue):
+    issue("student", people["items"][:1])
+
+    assert assess_overdue(date.today() + timedelta(days=365)) == {"student": 1, "professor": 0}
+    amount = database.execute("SELECT amount FROM fine_ledger").scalar()
+    assert 0 < amount <= load_fine_schedule()["student"]["max_amount"]
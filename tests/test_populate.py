@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+""" Tests of the population of the database """
+
+# External Imports
+from sqlalchemy import select
+
+# User Import
+from library.connections.get_connection import SESSION_FACTORY, create_engine
+from library.orm.models import BASE
+from library.populate.populate_db import bulk_populate, populate
+
+# Columns holding random dates and prices, and the times of the audit trail,
+# which differ between the populations
+RANDOM_COLUMNS = {"doj", "dopur", "dopub", "price", "created_on", "last_updated"}
+
+
+def _engine(path):
+    """Function to create an engine of a new database file with all the tables"""
+    engine = create_engine("sqlite", f"sqlite:///{path}")
+    BASE.metadata.create_all(engine)
+    return engine
+
+
+def _contents(engine):
+    """Function to get the rows of every table, without the random columns, by table name"""
+    contents = {}
+    for table in BASE.metadata.sorted_tables:
+        columns = [column for column in table.columns if column.name not in RANDOM_COLUMNS]
+        contents[table.name] = [tuple(row) for row in engine.execute(
+            select(columns).order_by(*table.primary_key.columns))]
+    return contents
+
+
+def test_bulk_populate_matches_populate(tmp_path):
+    engine = _engine(tmp_path / "populate.sqlite")
+    bulk_engine = _engine(tmp_path / "bulk.sqlite")
+    try:
+        SESSION_FACTORY.configure(bind=engine)
+        populate()
+        stats = bulk_populate(chunk_size=7, bind=bulk_engine)
+
+        contents = _contents(engine)
+        assert contents == _contents(bulk_engine)
+        assert {name: rows["rows"] for name, rows in stats.items()} == \
+            {name: len(rows) for name, rows in contents.items() if rows}
+        assert len(contents["book_item"]) == 60
+    finally:
+        SESSION_FACTORY.configure(bind=None)
+        engine.dispose()
+        bulk_engine.dispose()
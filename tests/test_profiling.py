@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+""" Tests of the sampled profiles of the operations """
+
+# Standard import
+import os
+
+# External Imports
+import pytest
+
+# User Import
+from library.connections import profiling
+from library.connections.transactions import operation
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    """Directory of the profiles, with one in every two calls of an operation profiled"""
+    monkeypatch.setenv("LIBRARY_PROFILE_SAMPLE", "2")
+    monkeypatch.setenv("LIBRARY_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "_SETTINGS", {})
+    monkeypatch.setattr(profiling, "_COUNTERS", {})
+    return tmp_path
+
+
+def _reports(directory):
+    """Function to get the names of the profile reports of a directory"""
+    return sorted(name for name in os.listdir(directory) if name.endswith(".txt"))
+
+
+def test_sampled_calls_profiled(profiles):
+    @operation("test_profiled_operation")
+    def add(first, second):
+        return first + second
+
+    assert add(1, 2) == 3
+    reports = _reports(profiles)
+    assert len(reports) == 1 and reports[0].endswith("-test_profiled_operation.txt")
+    assert os.path.exists(profiles / reports[0].replace(".txt", ".prof"))
+    with open(profiles / reports[0]) as file:
+        text = file.read()
+    assert "Operation: test_profiled_operation\nArguments: 1, 2" in text
+    assert "Top allocations" in text
+
+    # The next call is not sampled, the one after it is
+    assert add(3, 4) == 7
+    assert len(_reports(profiles)) == 1
+    assert add(5, 6) == 11
+    assert len(_reports(profiles)) == 2
+
+
+def test_profiling_off(profiles, monkeypatch):
+    monkeypatch.setenv("LIBRARY_PROFILE_SAMPLE", "0")
+
+    def add(first, second):
+        return first + second
+
+    assert profiling.profiled("test_unprofiled_operation")(add) is add
+    assert _reports(profiles) == []
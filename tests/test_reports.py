@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+""" Tests of the streaming reports """
+
+# Standard import
+import csv
+import json
+
+# External Imports
+import pytest
+
+# User Import
+from library.query.queries import impact
+from library.query.reports import HISTORY_COLUMNS, IMPACT_COLUMNS, WRITERS, history_report, \
+    impact_report, write_report
+
+
+@pytest.fixture
+def borrows(database, people, issue):
+    """Department whose book items are borrowed by a student of another department
+    and by a professor, with the bar codes borrowed by each"""
+    student_dept = database.execute(
+        f"SELECT dept_id FROM students WHERE reg_id = {people['student']}").scalar()
+    isbn_id, dept_id = database.execute(
+        f"SELECT isbn_id, dept_id FROM books WHERE dept_id != {student_dept} LIMIT 1").first()
+    student_item, professor_item = [row[0] for row in database.execute(
+        f"SELECT bar_code FROM book_item WHERE isbn_id = {isbn_id} ORDER BY bar_code LIMIT 2")]
+    issue("student", [student_item])
+    issue("professor", [professor_item])
+    return {"dept_id": dept_id, "student": student_item, "professor": professor_item}
+
+
+def _text(value):
+    """Function to get the text a value is written as in every format"""
+    return "" if value is None else str(value)
+
+
+def _read(path, output_format):
+    """Function to read the rows of a written report as dictionaries of texts"""
+    with open(path, encoding="utf-8", newline="") as file:
+        if output_format == "csv":
+            header, *lines = list(csv.reader(file))
+            return [dict(zip(header, line)) for line in lines]
+        return [{name: _text(value) for name, value in json.loads(line).items()} for line in file]
+
+
+def test_streamed_reports(borrows):
+    assert list(impact_report(borrows["dept_id"], batch_size=1)) == impact(borrows["dept_id"])
+
+    history = list(history_report(batch_size=1))
+    assert [(row[0], row[4]) for row in history] == \
+        [("student", borrows["student"]), ("professor", borrows["professor"])]
+    assert list(history_report("professor")) == history[1:]
+
+
+@pytest.mark.parametrize("output_format", list(WRITERS))
+@pytest.mark.parametrize("report, columns", [("impact", IMPACT_COLUMNS),
+                                             ("history", HISTORY_COLUMNS)])
+def test_write_report(tmp_path, borrows, report, columns, output_format):
+    params = {"dep": borrows["dept_id"]} if report == "impact" else {}
+    expected = list(impact_report(**params) if report == "impact" else history_report())
+    path = tmp_path / f"{report}.{output_format}"
+
+    assert write_report(report, output_format, str(path), **params) == len(expected) > 0
+    assert _read(path, output_format) == \
+        [{name: _text(value) for name, value in zip(columns, row)} for row in expected]
+
+
+def test_write_report_to_stdout(capsys, borrows):
+    assert write_report("impact", "jsonl", dep=borrows["dept_id"]) == 1
+    row = json.loads(capsys.readouterr().out)
+    assert list(row) == list(IMPACT_COLUMNS)
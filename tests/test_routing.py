@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+""" Tests of the routing of the reads of read-only sessions to the replicas """
+
+# Standard Imports
+import threading
+
+# External Imports
+import pytest
+from sqlalchemy import Column, MetaData, String, Table
+
+# User Imports
+from library.connections import get_connection
+from library.connections.get_connection import ReplicaSet, RoutingSession, create_engine
+
+MARKER = Table("marker", MetaData(), Column("name", String(20)))
+
+
+def _engine(path, name=None):
+    """Function to create a sqlite engine of a file, holding its name in the marker table"""
+    engine = create_engine("sqlite", f"sqlite:///{path}")
+    if name:
+        MARKER.create(engine)
+        engine.execute(MARKER.insert().values(name=name))
+    return engine
+
+
+@pytest.fixture
+def engines(tmp_path, monkeypatch):
+    """Primary and replica engines, with no write of the thread noted"""
+    monkeypatch.setattr(get_connection, "_LAST_WRITE", threading.local())
+    primary = _engine(tmp_path / "primary.sqlite", "primary")
+    replica = _engine(tmp_path / "replica.sqlite", "replica")
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def _read(primary, replicas, read_only):
+    """Function to read the marker through a new routing session"""
+    session = RoutingSession(bind=primary, replicas=replicas)
+    session.info["read_only"] = read_only
+    try:
+        return session.execute(MARKER.select()).scalar()
+    finally:
+        session.close()
+
+
+def test_read_only_sessions_read_replica(engines):
+    primary, replica = engines
+    replicas = ReplicaSet([replica])
+
+    assert _read(primary, replicas, read_only=True) == "replica"
+    assert _read(primary, replicas, read_only=False) == "primary"
+    assert _read(primary, None, read_only=True) == "primary"
+
+
+@pytest.mark.parametrize("pin_seconds, read", [(0.0, "replica"), (60.0, "written")])
+def test_reads_after_write_pinned(engines, pin_seconds, read):
+    primary, replica = engines
+    replicas = ReplicaSet([replica], pin_seconds=pin_seconds)
+
+    session = RoutingSession(bind=primary, replicas=replicas)
+    session.execute(MARKER.update().values(name="written"))
+    session.commit()
+    session.close()
+
+    assert primary.execute(MARKER.select()).scalar() == "written"
+    assert _read(primary, replicas, read_only=True) == read
+
+
+def test_unhealthy_replica_skipped(engines, tmp_path):
+    primary, replica = engines
+    broken = _engine(tmp_path / "missing" / "replica.sqlite")
+    replicas = ReplicaSet([broken, replica])
+
+    assert [replicas.choose() for _ in range(3)] == [replica] * 3
+    assert _read(primary, replicas, read_only=True) == "replica"
+    assert _read(primary, ReplicaSet([broken]), read_only=True) == "primary"
+    broken.dispose()
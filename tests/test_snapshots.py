@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+""" Tests of the dataset snapshots """
+
+# Standard import
+import os
+
+# External Imports
+import pytest
+
+# User Import
+from library.populate import snapshots
+
+
+def test_incomplete_snapshot_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "SNAPSHOT_DIR", str(tmp_path))
+    # A population failing on an assertion only logs it, leaving the tables empty
+    monkeypatch.setattr(snapshots, "bulk_populate", lambda **options: None)
+
+    with pytest.raises(RuntimeError, match="incomplete"):
+        snapshots.build_snapshot("small")
+    assert os.listdir(tmp_path) == []
+
+
+def test_snapshot_rows(database):
+    for table, rows in snapshots.expected_rows("small").items():
+        assert database.execute(f"SELECT count(*) FROM {table}").scalar() == rows
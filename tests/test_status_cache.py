@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+""" Tests of the cache of the book status """
+
+# Standard import
+import json
+import time
+
+# External Imports
+import pytest
+
+# User Import
+from library.connections.transactions import unit_of_work
+from library.populate.import_catalogue import import_catalogue
+from library.query import status_cache
+from library.query.queries import TitleStatus, check_status, student_issue
+
+
+@pytest.fixture(params=["dict", "file"])
+def backend(request, tmp_path):
+    """Every backend of the cache, the dict backend is restored afterwards"""
+    options = {"directory": str(tmp_path / "status")} if request.param == "file" else {}
+    status_cache.configure(request.param, **options)
+    yield request.param
+    status_cache.configure()
+
+
+def _isbn_id(database, people):
+    """Function to get the book of the first available book item"""
+    return database.execute(f"SELECT isbn_id FROM book_item "
+                            f"WHERE bar_code = {people['items'][0]}").scalar()
+
+
+@pytest.mark.usefixtures("backend")
+def test_read_before_eviction_not_cached():
+    title = TitleStatus(1, "book", [])
+    started = time.time()
+    status_cache.invalidate([1])
+
+    status_cache.put_titles({1: title}, started)
+    assert status_cache.get_titles([1]) == {}
+    assert status_cache.status_cache_stats()["stale"] >= 1
+
+
+@pytest.mark.usefixtures("backend")
+def test_read_after_eviction_cached():
+    title = TitleStatus(1, "book", [])
+    status_cache.invalidate([1])
+
+    status_cache.put_titles({1: title}, time.time() + status_cache.STALE_WINDOW)
+    assert status_cache.get_titles([1]) == {1: title}
+
+
+def test_circulation_evicts(database, people, issue):
+    isbn_id = _isbn_id(database, people)
+    assert check_status(isbn_id) is not None
+    assert isbn_id in status_cache.get_titles([isbn_id])
+
+    issue("student", people["items"][:1])
+    assert status_cache.get_titles([isbn_id]) == {}
+    statuses = {item.bar_code: item.status for item in check_status(isbn_id).items}
+    assert statuses[people["items"][0]].name == "UNAVAILABLE"
+
+
+def test_import_evicts(database, people, tmp_path):
+    isbn_id = _isbn_id(database, people)
+    check_status(isbn_id)
+    dept_id = database.execute(f"SELECT dept_id FROM books WHERE isbn_id = {isbn_id}").scalar()
+    path = tmp_path / "catalogue.jsonl"
+    path.write_text(json.dumps({"isbn_id": isbn_id, "book_name": "Renamed", "dept_id": dept_id,
+                                "author_id": 9001, "author_name": "Author"}) + "\n")
+
+    import_catalogue(str(path))
+    assert status_cache.get_titles([isbn_id]) == {}
+
+
+@pytest.fixture
+def no_stale_window():
+    """Caching the reads whatever the time since the eviction of their book"""
+    status_cache.configure(stale_window=0.0)
+    yield
+    status_cache.configure()
+
+
+@pytest.mark.usefixtures("no_stale_window")
+def test_rolled_back_unit_not_cached(database, people):
+    bar_code = people["items"][0]
+    isbn_id = _isbn_id(database, people)
+
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            student_issue(people["staff"], people["student"], [bar_code])
+            # Read in the unit, the issue is not committed and must not be cached
+            check_status(isbn_id)
+            raise RuntimeError("Desk closed")
+
+    statuses = {item.bar_code: item.status.name for item in check_status(isbn_id).items}
+    assert statuses[bar_code] == "AVAILABLE"
+
+
+def test_batch_issue_evicts_after_commit(database, people, issue, monkeypatch):
+    bar_code = people["items"][0]
+    evict = status_cache.invalidate
+    seen = []
+
+    def invalidate(isbn_ids):
+        # Status of the book item committed when its book is evicted
+        seen.append(database.execute(f"SELECT status FROM book_item "
+                                     f"WHERE bar_code = {bar_code}").scalar())
+        evict(isbn_ids)
+
+    monkeypatch.setattr(status_cache, "invalidate", invalidate)
+    issue("student", [bar_code])
+    assert seen and set(seen) == {"UNAVAILABLE"}
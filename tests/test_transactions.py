@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+""" Tests of the retries of the transient database errors """
+
+# Standard import
+import sqlite3
+
+# External Imports
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# User Import
+from library.connections import transactions
+from library.connections.transactions import contention_report, run_with_retry
+
+
+def _locked():
+    """Function to get the error of a locked sqlite database"""
+    return OperationalError("UPDATE book_item", {}, sqlite3.OperationalError("database is locked"))
+
+
+def _failing(errors):
+    """Function to get a function raising the errors in turn, then returning the calls made"""
+    calls = []
+
+    def function():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return len(calls)
+    return function
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Leaving out the backoff sleeps"""
+    monkeypatch.setattr(transactions.time, "sleep", lambda delay: None)
+
+
+def test_transient_error_retried():
+    assert run_with_retry("test_transient", _failing([_locked(), _locked()])) == 3
+
+    metrics = contention_report()["test_transient"]
+    assert (metrics["calls"], metrics["retries"], metrics["aborts"]) == (1, 2, 0)
+
+
+def test_aborted_after_last_attempt():
+    function = _failing([_locked()] * 3)
+
+    with pytest.raises(OperationalError):
+        run_with_retry("test_aborted", function, attempts=3)
+    metrics = contention_report()["test_aborted"]
+    assert (metrics["retries"], metrics["aborts"]) == (2, 1)
+
+
+def test_permanent_error_not_retried():
+    error = IntegrityError("INSERT INTO books", {}, sqlite3.IntegrityError("UNIQUE constraint"))
+
+    with pytest.raises(IntegrityError):
+        run_with_retry("test_permanent", _failing([error]))
+    assert contention_report()["test_permanent"]["retries"] == 0
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+""" Tests of the units of work, of the caches after them and of the issues racing a
+concurrent issue """
+
+# External Imports
+import pytest
+
+# User Import
+from library.connections.transactions import in_unit_of_work, session_scope, unit_of_work
+from library.orm.cache import lookup
+from library.orm.models import BookItem, BookStatus, Staffs
+from library.query import queries, status_cache
+from library.query.queries import IssueRequest, batch_issue, check_status, student_issue
+
+
+def _statuses(database, bar_codes):
+    """Function to get the status of book items, by bar code"""
+    return {row[0]: row[1] for row in database.execute(
+        f"SELECT bar_code, status FROM book_item "
+        f"WHERE bar_code IN ({', '.join(map(str, bar_codes))})")}
+
+
+@pytest.fixture
+def stale_read(monkeypatch):
+    """Function making the batches read book items as available, as before a concurrent issue"""
+    book_items = queries._book_items
+
+    def stale(bar_codes):
+        def stale_book_items(session, codes, *columns):
+            rows = list(book_items(session, codes, *columns))
+            if columns == (BookItem.bar_code, BookItem.status):
+                rows = [(row[0], BookStatus.AVAILABLE) if row[0] in bar_codes else row
+                        for row in rows]
+            return rows
+        monkeypatch.setattr(queries, "_book_items", stale_book_items)
+    return stale
+
+
+def _racing_batch(people):
+    """Function to issue the first item, already issued, and the second item to the student"""
+    first, second = people["items"][:2]
+    return batch_issue([IssueRequest("student", people["student"], people["staff"], [first]),
+                        IssueRequest("student", people["student"], people["staff"], [second])])
+
+
+def test_unit_rolled_back_as_a_whole(database, people, issue):
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            issue("student", people["items"][:1])
+            assert in_unit_of_work()
+            raise RuntimeError("Desk closed")
+
+    assert not in_unit_of_work()
+    assert _statuses(database, people["items"][:1]) == {people["items"][0]: "AVAILABLE"}
+
+
+def test_racing_issue_fails_taken_item_only(database, people, issue, stale_read):
+    first, second = people["items"][:2]
+    issue("professor", [first])
+    stale_read({first})
+
+    results = _racing_batch(people)
+    assert [(result.success, result.error) for result in results] == \
+        [(False, "Book item not Available"), (True, None)]
+    assert _statuses(database, [second]) == {second: "UNAVAILABLE"}
+
+
+def test_racing_issue_inside_unit_keeps_earlier_operations(database, people, issue, stale_read):
+    first, second, third = people["items"][:3]
+    issue("professor", [first])
+    stale_read({first})
+
+    with unit_of_work():
+        issue("professor", [third])
+        results = _racing_batch(people)
+
+    assert [result.success for result in results] == [False, True]
+    assert _statuses(database, [first, second, third]) == \
+        {first: "UNAVAILABLE", second: "UNAVAILABLE", third: "UNAVAILABLE"}
+    assert database.execute("SELECT count(*) FROM professor_activity").scalar() == 2
+
+
+@pytest.fixture
+def no_stale_window():
+    """Caching the reads whatever the time since the eviction of their book"""
+    status_cache.configure(stale_window=0.0)
+    yield
+    status_cache.configure()
+
+
+@pytest.mark.usefixtures("no_stale_window")
+def test_rolled_back_unit_leaves_caches_correct(database, people):
+    bar_code = people["items"][0]
+    isbn_id = database.execute(f"SELECT isbn_id FROM book_item WHERE bar_code = {bar_code}").scalar()
+    staff_name = database.execute(f"SELECT name FROM staffs "
+                                  f"WHERE staff_id = {people['staff']}").scalar()
+
+    with pytest.raises(RuntimeError):
+        with unit_of_work() as session:
+            session.query(Staffs).get(people["staff"]).name = "Renamed"
+            # The operations of the unit read the rename and the issue before they commit
+            student_issue(people["staff"], people["student"], [bar_code])
+            check_status(isbn_id)
+            with session_scope() as operation_session:
+                lookup(operation_session, Staffs, people["staff"])
+            raise RuntimeError("Desk closed")
+
+    with session_scope() as session:
+        assert lookup(session, Staffs, people["staff"]).name == staff_name
+    statuses = {item.bar_code: item.status.name for item in check_status(isbn_id).items}
+    assert statuses[bar_code] == "AVAILABLE"